@@ -0,0 +1,318 @@
+"""Headless engine benchmarks
+
+Every benchmark uses fixed seeds, so two runs on the same machine do the
+same work and their results can be compared:
+
+    python bench.py --out base.json
+    (make changes)
+    python bench.py --compare base.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from fields import BACKENDS
+from tetris import Board
+
+_MOVES = ['l', 'r', 'd', 'cw', 'ccw']
+
+
+# best rate of repeat runs of func, which returns the number of operations it did
+def _rate(func, repeat):
+    best = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ops = func()
+        best = max(best, ops / (time.perf_counter() - start))
+    return best
+
+
+# best time per call of func over repeat runs of number calls
+def _per_call(func, number, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# a mid-game board: random pieces hard dropped into random columns
+def _mid_game(backend, seed=0, pieces=12):
+    rng = random.Random(seed)
+    board = Board(rseed=seed, backend=backend)
+    for _ in range(pieces):
+        for _ in range(rng.randint(0, 3)):
+            board.act(rng.choice(('cw', 'ccw')))
+        for _ in range(rng.randint(0, 5)):
+            board.act(rng.choice(('l', 'r')))
+        board.act('hd')
+        if board.dead:
+            board = Board(rseed=seed, backend=backend)
+    return board
+
+
+def bench_actions(backend, repeat):
+    """Movement and rotation actions per second"""
+    rng = random.Random(1)
+    actions = [rng.choice(_MOVES) for _ in range(20000)]
+
+    def run():
+        board = _mid_game(backend)
+        for action in actions:
+            board.act(action)
+        return len(actions)
+    return _rate(run, repeat), 'actions/s'
+
+
+def bench_locks(backend, repeat):
+    """Hard drops (lock, line clear, spawn) per second"""
+    rng = random.Random(2)
+    columns = [rng.randint(-2, 2) for _ in range(5000)]
+
+    def run():
+        board = Board(rseed=2, backend=backend)
+        for shift in columns:
+            for _ in range(abs(shift)):
+                board.act('l' if shift < 0 else 'r')
+            board.act('hd')
+            if board.dead:
+                board = Board(rseed=2, backend=backend)
+        return len(columns)
+    return _rate(run, repeat), 'locks/s'
+
+
+def bench_games(backend, repeat):
+    """Complete games per second with a random placement policy"""
+    def run():
+        rng = random.Random(3)
+        for seed in range(20):
+            board = Board(rseed=seed, backend=backend)
+            while not board.dead:
+                if rng.random() < 0.1:
+                    board.act('hold')
+                for _ in range(rng.randint(0, 3)):
+                    board.act(rng.choice(('cw', 'ccw')))
+                for _ in range(rng.randint(0, 5)):
+                    board.act(rng.choice(('l', 'r')))
+                board.act('hd')
+        return 20
+    return _rate(run, repeat), 'games/s'
+
+
+def bench_piece_valid(backend, repeat):
+    """Time per Board._piece_valid call"""
+    board = _mid_game(backend)
+    return _per_call(board._piece_valid, 20000, repeat), 's'
+
+
+def bench_clear_lines(backend, repeat):
+    """Time per Board._clear_lines call on a field with no full rows"""
+    board = _mid_game(backend)
+    return _per_call(lambda: board._clear_lines(1), 20000, repeat), 's'
+
+
+def bench_ghost(backend, repeat):
+    """Time per Board._generate_ghost_piece call"""
+    board = _mid_game(backend)
+    return _per_call(board._generate_ghost_piece, 20000, repeat), 's'
+
+
+def bench_state(backend, repeat):
+    """Time per Board.state call"""
+    board = _mid_game(backend)
+    return _per_call(board.state, 20000, repeat), 's'
+
+
+def bench_memory(backend, repeat):
+    """Peak memory allocated per board while creating 200 of them"""
+    # the first board builds the shared Zobrist keys, a one time cost
+    Board(rseed=0, backend=backend)
+    tracemalloc.start()
+    boards = [Board(rseed=seed, backend=backend) for seed in range(200)]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del boards
+    return peak / 200, 'bytes'
+
+
+# GameHandler drawing a mid-game board offscreen, None without pygame
+def _render_handler(backend):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    try:
+        import pygame
+        from pygame_handler import GameHandler
+        from simulation import GameSimulation
+    except ImportError:
+        return None
+
+    pygame.init()
+    handler = GameHandler()
+    handler.m_board = _mid_game(backend)
+    handler._sim = GameSimulation(handler.m_board)
+    return handler
+
+
+def bench_render_full(backend, repeat):
+    """Time per GameHandler._draw_game frame drawn from scratch (renderer reset)"""
+    handler = _render_handler(backend)
+    if handler is None:
+        return None, 's'
+
+    def frame():
+        handler._renderer.reset()
+        handler._draw_game()
+    return _per_call(frame, 20, repeat), 's'
+
+
+def bench_render_frame(backend, repeat):
+    """Time per GameHandler._draw_game frame after one action, hard dropping
+    every 8th frame, so the dirty cells and HUD are redrawn as in a game"""
+    handler = _render_handler(backend)
+    if handler is None:
+        return None, 's'
+    rng = random.Random(4)
+    actions = [rng.choice(_MOVES) if i % 8 else 'hd' for i in range(1, 241)]
+    start = handler.m_board.snapshot()
+    frames = iter(())
+
+    def frame():
+        nonlocal frames
+        board = handler.m_board
+        action = next(frames, None)
+        if action is None or board.dead:
+            # same frames every run
+            board.restore(start)
+            frames = iter(actions)
+            action = next(frames)
+        board.act(action)
+        handler._draw_game()
+    handler._draw_game()
+    return _per_call(frame, len(actions), repeat), 's'
+
+
+# name: (function, whether a larger value is better)
+BENCHMARKS = {
+    'actions': (bench_actions, True),
+    'locks': (bench_locks, True),
+    'games': (bench_games, True),
+    'piece_valid': (bench_piece_valid, False),
+    'clear_lines': (bench_clear_lines, False),
+    'ghost': (bench_ghost, False),
+    'state': (bench_state, False),
+    'memory': (bench_memory, False),
+    'render_full': (bench_render_full, False),
+    'render_frame': (bench_render_frame, False),
+}
+
+
+def run(names=None, backends=None, repeat=3):
+    """Runs benchmarks and collects their results
+
+    Parameters
+    ----------
+    names : list of str, optional
+        Keys of BENCHMARKS to run, by default None which runs all of them
+    backends : list of str, optional
+        Field backends to run them on, by default None which uses all of them
+    repeat : int, optional
+        Runs per benchmark, the best one is kept, by default 3
+
+    Returns
+    -------
+    dict
+        JSON serializable results, 'results' maps 'name/backend' to the
+        value, unit and whether higher is better
+    """
+    names = list(BENCHMARKS) if names is None else names
+    backends = list(BACKENDS) if backends is None else backends
+
+    results = {}
+    for name in names:
+        func, higher_is_better = BENCHMARKS[name]
+        for backend in backends:
+            value, unit = func(backend, repeat)
+            results['{}/{}'.format(name, backend)] = {
+                'value': value,
+                'unit': unit,
+                'higher_is_better': higher_is_better,
+            }
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(old, new, tolerance=0.1):
+    """Lists how each result changed between two runs
+
+    Returns
+    -------
+    list of tuple
+        (name, old value, new value, ratio, regressed) for each result in
+        both runs, ratio > 1 meaning faster / smaller, regressed when
+        the ratio is below 1 - tolerance
+    """
+    out = []
+    for name, new_res in new['results'].items():
+        old_res = old['results'].get(name)
+        if old_res is None or old_res['value'] is None or new_res['value'] is None:
+            continue
+        if new_res['higher_is_better']:
+            ratio = new_res['value'] / old_res['value']
+        else:
+            ratio = old_res['value'] / new_res['value']
+        out.append((name, old_res['value'], new_res['value'], ratio, ratio < 1 - tolerance))
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+    parser.add_argument('--backend', action='append', choices=list(BACKENDS),
+                        help='field backend to run on (default: all)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', help='file to write the results to as JSON')
+    parser.add_argument('--compare', help='results file of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown allowed before a result counts as a regression')
+    args = parser.parse_args(argv)
+
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark \'{}\''.format(name))
+
+    res = run(args.names or None, args.backend, args.repeat)
+    for name, result in res['results'].items():
+        print('{:24} {:>14.6g} {}'.format(name, result['value'] or float('nan'), result['unit']))
+
+    if args.out:
+        with open(args.out, 'w') as out_file:
+            json.dump(res, out_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as in_file:
+            old = json.load(in_file)
+        regressed = False
+        print()
+        for name, old_val, new_val, ratio, worse in compare(old, res, args.tolerance):
+            print('{:24} {:>12.6g} -> {:<12.6g} x{:.2f}{}'.format(
+                name, old_val, new_val, ratio, '  REGRESSION' if worse else ''))
+            regressed |= worse
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
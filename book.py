@@ -0,0 +1,256 @@
+"""Placement cache keyed on the surface of the stack, usable as an opening book
+
+    cache = PlacementCache(book='book.json')    # warm start, if the file exists
+    bot = CachedBot(BeamSearchBot(), cache)
+    placement = bot.choose(board)               # a lookup when the board was seen before
+    cache.save('book.json')
+
+Boards are keyed on their skyline (column heights less the lowest one),
+the holes and overhangs under it (as the empty cells below each column's
+top, row by row from the lowest top), the current piece and what holding
+would do. Boards with the same skyline but different holes get different
+keys, so a hit is always a field the answer was found for. Answers are
+also looked up among the placements movegen finds on the board, so a
+cached one that can't be reached (e.g. the piece has already moved) is a
+miss rather than a wrong move.
+
+The next pieces past the one holding brings in aren't in the key unless
+preview says so: answers found with a longer look ahead are reused
+whatever comes after, which is what makes most hits possible.
+"""
+import argparse
+from itertools import islice
+import json
+import os
+import sys
+import uuid
+from time import perf_counter
+
+import movegen
+from bot import BeamSearchBot
+from tetris import Board
+from zobrist import TranspositionTable
+
+# version of the book file layout
+_FORMAT = 1
+
+
+def surface_key(board, preview=0):
+    """Cache key of board, see the module docstring
+
+    Parameters
+    ----------
+    board : Board
+    preview : int, optional
+        Next pieces in the key, by default 0 (the next piece is always in
+        it when holding would bring it in)
+
+    Returns
+    -------
+    tuple
+        (piece, held piece, whether hold is used, next pieces, skyline, holes),
+        holes being (row from the lowest top, bitmask of empty cells) pairs
+    """
+    field = board._field
+    tops = field.tops
+    base = max(tops)
+    skyline = tuple(base - top for top in tops)
+    holes = []
+    covered = 0
+    masks = field.row_masks()
+    for r_ind in range(min(tops), field.height):
+        row = masks[r_ind]
+        covered |= row
+        if covered & ~row:
+            holes.append((r_ind - base, covered & ~row))
+    # holding without a held piece brings in the next one
+    seen = max(preview, int(board.held_piece is None and not board._hold_used))
+    return (board.cur_piece.piece_str, board.held_piece, board._hold_used,
+            tuple(islice(board.next_pieces, seen)), skyline, tuple(holes))
+
+
+# JSON has no tuples, keys come back from a book as lists
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class PlacementCache:
+    def __init__(self, capacity=1 << 16, preview=0, book=None):
+        """Best placements found earlier, by surface_key() of their board
+
+        Once full, storing a new board evicts the least recently used one
+
+        Parameters
+        ----------
+        capacity : int, optional
+            Maximum number of boards, by default 65536
+        preview : int, optional
+            Next pieces in the key, see surface_key(), by default 0
+        book : str, optional
+            File written by save() to start from, by default None. A file
+            that doesn't exist yet is skipped
+
+        Attributes
+        ----------
+        hits, misses : int
+            Number of get() calls that did / didn't return a placement
+        """
+        self.preview = preview
+        self.hits = 0
+        self.misses = 0
+        self._table = TranspositionTable(capacity)
+        if book is not None and os.path.exists(book):
+            self.load(book)
+
+    @property
+    def capacity(self):
+        return self._table.capacity
+
+    @property
+    def evictions(self):
+        """Number of boards dropped to make room"""
+        return self._table.evictions
+
+    @property
+    def hit_rate(self):
+        """Fraction of get() calls that returned a placement"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Counters and size as a dict"""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self), 'hit_rate': round(self.hit_rate, 4)}
+
+    def get(self, board):
+        """Placement stored for board, found again among its movegen
+        placements, None if there's none"""
+        # (hold, rotation, row from the bottom, column, tspin)
+        answer = self._table.get(surface_key(board, self.preview))
+        if answer is not None:
+            hold, rotation, row, col, tspin = answer
+            pos = [board.height - row, col]
+            for placement in movegen.placements(board, hold):
+                if placement.hold == hold and placement.rotation == rotation \
+                        and placement.pos == pos and placement.tspin == tspin:
+                    self.hits += 1
+                    return placement
+        self.misses += 1
+        return None
+
+    def put(self, board, placement):
+        """Stores placement (a movegen.Placement) as the answer for board"""
+        self._table.put(surface_key(board, self.preview),
+                        (placement.hold, placement.rotation, board.height - placement.pos[0],
+                         placement.pos[1], placement.tspin))
+
+    def save(self, path):
+        """Writes the cache to path (replacing it at once), least recently used first"""
+        book = {'format': _FORMAT, 'preview': self.preview,
+                'entries': [list(item) for item in self._table.items()]}
+        tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(tmp_path, 'w') as out_file:
+            json.dump(book, out_file, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Adds the boards of a file written by save(), as the most recently used"""
+        with open(path) as in_file:
+            book = json.load(in_file)
+        if book.get('format') != _FORMAT:
+            raise ValueError('{} is not a placement book'.format(path))
+        if book['preview'] != self.preview:
+            raise ValueError('{} has keys with {} next pieces, not {}'.format(
+                path, book['preview'], self.preview))
+        for key, answer in book['entries']:
+            self._table.put(_freeze(key), tuple(answer))
+
+    def clear(self):
+        """Drops every board and resets the counters"""
+        self._table.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._table)
+
+
+class CachedBot:
+    def __init__(self, bot, cache):
+        """Bot looking its moves up in a PlacementCache first
+
+        Moves that miss are chosen by bot and stored. Has the same
+        choose() and counters as the bot it wraps
+
+        Parameters
+        ----------
+        bot : BeamSearchBot
+            Or any bot with choose(board)
+        cache : PlacementCache
+        """
+        self.bot = bot
+        self.cache = cache
+        self.nodes = 0
+        self.depth_reached = 0
+        self.elapsed = 0.0
+
+    @property
+    def nodes_per_second(self):
+        """Evaluation rate of the last choose()"""
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def choose(self, board):
+        """Stored placement for board, else the bot's choice (then stored)"""
+        start = perf_counter()
+        placement = self.cache.get(board)
+        if placement is not None:
+            self.nodes = 0
+            self.depth_reached = 0
+        else:
+            placement = self.bot.choose(board)
+            self.nodes = self.bot.nodes
+            self.depth_reached = self.bot.depth_reached
+            if placement is not None:
+                self.cache.put(board, placement)
+        self.elapsed = perf_counter() - start
+        return placement
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Plays seeded games with the cached beam search bot, growing a book')
+    parser.add_argument('book', help='book file, read if it exists and written back')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--start', type=int, default=0, help='first seed')
+    parser.add_argument('--pieces', type=int, default=100, help='pieces per game')
+    parser.add_argument('--budget', type=float, default=0.05, help='seconds per searched move')
+    parser.add_argument('--capacity', type=int, default=1 << 16)
+    parser.add_argument('--preview', type=int, default=0, help='next pieces in the key')
+    args = parser.parse_args(argv)
+
+    cache = PlacementCache(args.capacity, args.preview, args.book)
+    loaded = len(cache)
+    bot = CachedBot(BeamSearchBot(args.budget), cache)
+    elapsed = 0.0
+    placed = 0
+    for seed in range(args.start, args.start + args.games):
+        board = Board(rseed=seed, backend='bitboard')
+        for _ in range(args.pieces):
+            placement = bot.choose(board) if not board.dead else None
+            if placement is None:
+                break
+            elapsed += bot.elapsed
+            placed += 1
+            for action in placement.path:
+                board.act(action)
+    cache.save(args.book)
+
+    print('{} boards loaded, {} saved'.format(loaded, len(cache)))
+    print(json.dumps(cache.stats()))
+    print('{:.4f} s per move'.format(elapsed / placed if placed else 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,382 @@
+"""Beam search bot
+
+    bot = BeamSearchBot(budget=0.05)
+    placement = bot.choose(board)   # best move found within 50 ms
+    for action in placement.path:
+        board.act(action)
+
+It can also play headless (play(), or python bot.py) and drive a
+GameSimulation through BotInput, e.g. as GameHandler's autoplay.
+"""
+import argparse
+import sys
+from time import perf_counter
+
+import numpy as np
+import features
+import movegen
+import utils
+import zobrist
+from tetris import Board
+from zobrist import TranspositionTable
+
+# weights of the features (and of the lines cleared along the way)
+#   from Yiyuan Lee's tuned 4 feature evaluator
+WEIGHTS = {
+    'aggregate_height': -0.510066,
+    'holes': -0.35663,
+    'bumpiness': -0.184483,
+    'lines': 0.760666,
+}
+
+
+# puts the piece where placement says and locks it
+def _apply(board, placement):
+    if placement.hold:
+        board.act('hold')
+    piece = board.cur_piece
+    piece.rotation = placement.rotation
+    piece.pos = list(placement.pos)
+    # a T-spin is a T that got here by rotating
+    piece.last_move = 'cw' if placement.tspin else 'd'
+    board.act('hd')
+
+
+class Evaluator:
+    def __init__(self, weights=None, table_size=1 << 16):
+        """Scores boards in batches, remembering each field's score
+
+        A board's score is its features (see features.extract) times their
+        weights plus the lines weight times the lines cleared getting there.
+        The field part is stored in a TranspositionTable under the board's
+        Board.zobrist, kept from one search to the next, so boards a search
+        already reached cost a lookup instead of a feature extraction
+
+        Parameters
+        ----------
+        weights : dict, optional
+            Weight of each of features.FEATURES and 'lines', by default WEIGHTS
+        table_size : int, optional
+            Most field scores kept, by default 65536
+
+        Attributes
+        ----------
+        table : TranspositionTable
+            Field scores by board hash, with its hit and miss counts
+        """
+        weights = WEIGHTS if weights is None else weights
+        for name in weights:
+            if name not in features.FEATURES and name != 'lines':
+                raise ValueError('Unknown feature \'{}\''.format(name))
+        self._weights = np.array([weights.get(name, 0.0) for name in features.FEATURES])
+        self._eroded_weight = weights.get('eroded_cells', 0.0)
+        self._lines_weight = weights.get('lines', 0.0)
+        self.table = TranspositionTable(table_size)
+        self._clear()
+
+    def _clear(self):
+        self._keys = []
+        self._scores = []
+        self._missed = []
+        self._fields = []
+        self._eroded = []
+        self._lines = []
+
+    def add(self, board, eroded, lines, key=None):
+        """Adds a board to the batch
+
+        Parameters
+        ----------
+        board : Board
+            Board right after the move, only read here
+        eroded : int
+            Eroded cells of the move (see features.eroded_cells)
+        lines : int
+            Lines cleared since the root of the search
+        key : int, optional
+            board.zobrist, if already at hand
+        """
+        key = board.zobrist if key is None else key
+        score = self.table.get(key)
+        if score is None:
+            self._missed.append(len(self._scores))
+            self._fields.append(board._board.copy())
+        self._keys.append(key)
+        self._scores.append(score)
+        self._eroded.append(eroded)
+        self._lines.append(lines)
+
+    def scores(self):
+        """Scores of the boards added since the last call, in order"""
+        scores = self._scores
+        if self._fields:
+            fresh = features.extract(np.array(self._fields)) @ self._weights
+            for ind, score in zip(self._missed, fresh.tolist()):
+                scores[ind] = score
+                self.table.put(self._keys[ind], score)
+        out = np.array(scores, dtype=float) + self._eroded_weight * np.array(self._eroded) \
+            + self._lines_weight * np.array(self._lines)
+        self._clear()
+        return out
+
+
+class BeamSearchBot:
+    def __init__(self, budget=0.05, width=32, depth=1 + zobrist.PREVIEW, hold=True, weights=None,
+                 preview=zobrist.PREVIEW, table_size=1 << 16):
+        """Anytime beam search over placements of the current and next pieces
+
+        Each layer places one more piece on the best width boards of the
+        layer before, best first, scoring the results with
+        features.extract(). When the budget runs out the first move of the
+        best board of the last layer is played, even if only the best few
+        boards of the layer before were expanded
+
+        Only pieces a player can see are placed: the current one, the held
+        one and the first preview next ones. A board whose next piece isn't
+        among them isn't expanded, or only by holding when a visible piece
+        is in the hold
+
+        Parameters
+        ----------
+        budget : float, optional
+            Seconds per move, by default 0.05 (the first layer is always
+            finished, however long it takes)
+        width : int, optional
+            Boards kept per layer, by default 32
+        depth : int, optional
+            Most pieces to look ahead, by default one more than the pieces
+            a player can see (the current one and zobrist.PREVIEW next)
+        hold : bool, optional
+            Whether to consider holding, by default True
+        weights : dict, optional
+            Weight of each of features.FEATURES and 'lines', by default WEIGHTS
+        preview : int, optional
+            Next pieces the bot may look at, by default zobrist.PREVIEW
+        table_size : int, optional
+            Most field scores kept between moves, see Evaluator, by default 65536
+
+        Attributes
+        ----------
+        nodes : int
+            Boards evaluated by the last choose()
+        table_hits, table_misses : int
+            Boards of the last choose() whose field score was / wasn't
+            already in the table
+        depth_reached : int
+            Pieces the last choose() looked ahead, the last layer possibly unfinished
+        elapsed : float
+            Seconds the last choose() took
+        """
+        if width < 1:
+            raise ValueError('Beam width must be positive, got {}'.format(width))
+        self.budget = budget
+        self.width = width
+        self.depth = depth
+        self.hold = hold
+        self.preview = preview
+        self.evaluator = Evaluator(weights, table_size)
+
+        self.nodes = 0
+        self.depth_reached = 0
+        self.elapsed = 0.0
+        self.table_hits = 0
+        self.table_misses = 0
+
+    @property
+    def nodes_per_second(self):
+        """Evaluation rate of the last choose()"""
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def table_hit_rate(self):
+        """Fraction of the last choose()'s boards scored from the table"""
+        lookups = self.table_hits + self.table_misses
+        return self.table_hits / lookups if lookups else 0.0
+
+    def choose(self, board):
+        """Best placement found for board's current piece within the budget
+
+        Parameters
+        ----------
+        board : Board
+            Board to move on, left unchanged
+
+        Returns
+        -------
+        movegen.Placement
+            Placement to play (see its path), None if every move loses
+        """
+        start = perf_counter()
+        deadline = start + self.budget
+        table = self.evaluator.table
+        hits, misses = table.hits, table.misses
+        work = board.clone()
+        root_lines = work.lines_cleared
+
+        # (snapshot, first placement, queue pieces taken) of the boards kept from the last layer
+        beam = [(work.snapshot(), None, 0)]
+        best = None
+        self.nodes = 0
+        self.depth_reached = 0
+        for depth in range(self.depth):
+            parents, scores, finished = self._expand(
+                work, beam, root_lines, deadline if depth else None)
+            if not parents:
+                break
+            self.nodes += len(parents)
+            order = np.argsort(-scores, kind='stable')[:self.width]
+            best = parents[order[0]][2]
+            self.depth_reached = depth + 1
+
+            beam = []
+            for ind in order.tolist():
+                snap, placement, first, used = parents[ind]
+                work.restore(snap)
+                _apply(work, placement)
+                beam.append((work.snapshot(), first, used))
+            if not finished:
+                break
+
+        self.table_hits = table.hits - hits
+        self.table_misses = table.misses - misses
+        self.elapsed = perf_counter() - start
+        return best
+
+    # placements of work's visible pieces, used being the queue pieces taken since
+    #   the root, with the queue pieces taken after each
+    def _visible(self, work, used):
+        if used <= self.preview:
+            # holding without a held piece brings in the next one, which has to be visible
+            hold = self.hold and (work.held_piece is not None or used < self.preview)
+            placements = movegen.placements(work, hold)
+        elif used == self.preview + 1 and self.hold and work.held_piece is not None:
+            # the current piece is the first unseen one, the held one (seen) can swap in
+            placements = [placement for placement in movegen.placements(work, True)
+                          if placement.hold]
+        else:
+            return []
+        return [(placement, used + (2 if placement.hold and work.held_piece is None else 1))
+                for placement in placements]
+
+    # places the next piece on the boards of beam until the deadline
+    # returns the (parent snapshot, placement, first placement, queue pieces taken)
+    #   of each distinct surviving board, their scores and whether all of beam was done
+    def _expand(self, work, beam, root_lines, deadline):
+        seen = set()
+        parents = []
+        finished = True
+        for snap, first, used in beam:
+            if deadline is not None and perf_counter() > deadline:
+                finished = False
+                break
+            work.restore(snap)
+            counts = work.row_counts
+            for placement, taken in self._visible(work, used):
+                work.restore(snap)
+                _apply(work, placement)
+                if work.dead:
+                    continue
+                key = work.zobrist
+                if key in seen:
+                    continue
+                seen.add(key)
+                parents.append((snap, placement, first or placement, taken))
+                self.evaluator.add(work, features.eroded_cells(
+                    counts, work.width, placement.piece_str, placement.rotation, placement.pos),
+                    work.lines_cleared - root_lines, key)
+
+        scores = self.evaluator.scores()
+        if not parents:
+            return parents, None, finished
+        return parents, scores, finished
+
+
+class BotInput:
+    def __init__(self, bot, sim):
+        """Turns a bot's moves into GameSimulation inputs
+
+        poll() matches FixedTimestep.run: each new piece gets a move,
+        played as one batch of presses (and releases, so nothing repeats)
+        on the tick right after the poll
+
+        Parameters
+        ----------
+        bot : BeamSearchBot
+            Bot choosing the moves
+        sim : GameSimulation
+            Simulation being played
+        """
+        self.bot = bot
+        self.sim = sim
+        self._planned = None
+
+    def poll(self):
+        """(events, None) with the moves for the current piece if it has none yet
+
+        The moves are planned from where the piece is, so none are given
+        while gravity or the lock delay would move it before they land
+        """
+        board = self.sim.board
+        if board.dead or board.cur_piece is self._planned or self.sim.falls_next_tick:
+            return [], None
+        self._planned = board.cur_piece
+
+        placement = self.bot.choose(board)
+        events = []
+        if placement is not None:
+            for action in placement.path:
+                events.append(('press', action))
+                if action in utils.MOVEMENT:
+                    events.append(('release', action))
+        return events, None
+
+
+def play(bot, board, pieces=None):
+    """Plays board with bot until it's lost or pieces pieces are placed
+
+    Returns
+    -------
+    int
+        Number of pieces placed
+    """
+    placed = 0
+    while not board.dead and (pieces is None or placed < pieces):
+        placement = bot.choose(board)
+        if placement is None:
+            break
+        for action in placement.path:
+            board.act(action)
+        placed += 1
+    return placed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plays a headless game with the beam search bot')
+    parser.add_argument('--pieces', type=int, default=100, help='pieces to place (default: 100)')
+    parser.add_argument('--budget', type=float, default=0.05, help='seconds per move')
+    parser.add_argument('--width', type=int, default=32, help='beam width')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', default='bitboard')
+    args = parser.parse_args(argv)
+
+    bot = BeamSearchBot(args.budget, args.width)
+    board = Board(rseed=args.seed, backend=args.backend)
+    nodes = 0
+    elapsed = 0.0
+    hits = 0
+    placed = 0
+    while not board.dead and placed < args.pieces:
+        placed += play(bot, board, 1)
+        nodes += bot.nodes
+        elapsed += bot.elapsed
+        hits += bot.table_hits
+
+    print('pieces {} lines {} score {} {}'.format(
+        placed, board.lines_cleared, board.score, 'dead' if board.dead else ''))
+    print('{:.0f} nodes/s, {:.1%} scored from the table'.format(
+        nodes / elapsed if elapsed else 0, hits / nodes if nodes else 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
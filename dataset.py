@@ -0,0 +1,343 @@
+"""Compact on-disk datasets of game transitions
+
+    writer = DatasetWriter('data')
+    state = writer.encode(board)
+    board.act(action)
+    writer.add(state, utils.ACTIONS[action], reward, writer.encode(board), board.dead)
+    ...
+    writer.close()
+
+    batch = Dataset('data').sample(256)     # dict of arrays
+
+A dataset is a directory of shards, raw arrays of fixed width records
+(see record_dtype()) that the reader memory maps, so sampling only reads
+the records it picks. Each writer appends to shards of its own and adds
+a line to index.jsonl when one is finished, so writers in different
+processes can fill the same dataset at once. Shards still being written
+(or left behind by a writer that died) aren't in the index and are
+ignored.
+
+Fields are stored as one bit per cell (packed=True, which drops the
+piece colours) or as int8 shape values, with the current piece, hold and
+next pieces stored alongside rather than drawn in.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import uuid
+from itertools import islice
+
+import numpy as np
+import utils
+from tetris import Board
+
+_META = 'meta.json'
+_INDEX = 'index.jsonl'
+
+
+def record_dtype(height=26, width=10, preview=5, packed=True):
+    """numpy dtype of one transition
+
+    Fields: state and next_state, each with field (packed bits or int8
+    shape values), piece (shape value), rotation, pos (row, column), hold
+    (shape value, 0 if none) and next (shape values), then action,
+    reward and done
+    """
+    if packed:
+        field = ('field', 'u1', ((height * width + 7) // 8,))
+    else:
+        field = ('field', 'i1', (height, width))
+    state = np.dtype([field, ('piece', 'u1'), ('rotation', 'u1'), ('pos', 'i1', (2,)),
+                      ('hold', 'u1'), ('next', 'u1', (preview,))])
+    return np.dtype([('state', state), ('action', '<i4'), ('reward', '<f4'),
+                     ('next_state', state), ('done', '?')])
+
+
+# meta.json of a dataset, written by the first writer
+def _check_meta(path, meta):
+    meta_path = os.path.join(path, _META)
+    if os.path.exists(meta_path):
+        with open(meta_path) as in_file:
+            old = json.load(in_file)
+        if old != meta:
+            raise ValueError('{} holds records of a different layout: {}'.format(path, old))
+        return
+    # writers starting together write the same thing, the last rename wins
+    tmp_path = '{}.{}.tmp'.format(meta_path, uuid.uuid4().hex)
+    with open(tmp_path, 'w') as out_file:
+        json.dump(meta, out_file)
+    os.replace(tmp_path, meta_path)
+
+
+class DatasetWriter:
+    def __init__(self, path, shard_size=1 << 16, packed=True, preview=5,
+                 height=26, width=10, buffer=1024, name=None):
+        """Appends transitions to a dataset directory, see the module docstring
+
+        Parameters
+        ----------
+        path : str
+            Dataset directory, created if needed
+        shard_size : int, optional
+            Records per shard, by default 65536
+        packed : bool, optional
+            Whether fields are stored as bits, by default True
+        preview : int, optional
+            Next pieces stored per state, by default 5
+        height, width : int, optional
+            Size of the boards, by default 26 by 10
+        buffer : int, optional
+            Records kept in memory between writes, by default 1024
+        name : str, optional
+            Prefix of this writer's shard files, by default a random one.
+            Must differ between writers of the same dataset
+
+        Attributes
+        ----------
+        records : int
+            Number of records added
+        """
+        if shard_size < 1 or buffer < 1:
+            raise ValueError('Shard and buffer sizes must be positive')
+        os.makedirs(path, exist_ok=True)
+        self.meta = {'height': height, 'width': width, 'preview': preview, 'packed': packed}
+        _check_meta(path, self.meta)
+
+        self.path = path
+        self.shard_size = shard_size
+        self.name = name if name is not None else uuid.uuid4().hex[:12]
+        self.dtype = record_dtype(height, width, preview, packed)
+        self.records = 0
+
+        self._buffer = np.zeros(min(buffer, shard_size), dtype=self.dtype)
+        self._buffered = 0
+        self._shards = 0
+        self._file = None
+        self._in_shard = 0
+        self._state = np.zeros((), dtype=self.dtype['state'])
+
+    def encode(self, board):
+        """Record of board's state, to pass to add()"""
+        state = self._state.copy()
+        filled = board._board != 0
+        if self.meta['packed']:
+            state['field'] = np.packbits(filled, axis=None)
+        else:
+            state['field'] = board._board
+        piece = board.cur_piece
+        state['piece'] = utils.shape_values[piece.piece_str]
+        state['rotation'] = piece.rotation
+        state['pos'] = piece.pos
+        state['hold'] = utils.shape_values.get(board.held_piece, 0)
+        state['next'] = [utils.shape_values[piece_str]
+                         for piece_str in islice(board.next_pieces, self.meta['preview'])]
+        return state
+
+    def add(self, state, action, reward, next_state, done):
+        """Appends one transition
+
+        Parameters
+        ----------
+        state, next_state : numpy.void
+            encode() of the board before and after the action
+        action : int
+            Code of the action (e.g. from utils.ACTIONS)
+        reward : float
+        done : bool
+        """
+        record = self._buffer[self._buffered]
+        record['state'] = state
+        record['action'] = action
+        record['reward'] = reward
+        record['next_state'] = next_state
+        record['done'] = done
+        self._buffered += 1
+        self.records += 1
+        if self._buffered == len(self._buffer) \
+                or self._in_shard + self._buffered == self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """Writes out the buffered records"""
+        if not self._buffered:
+            return
+        if self._file is None:
+            shard = '{}-{:05d}.bin'.format(self.name, self._shards)
+            self._file = open(os.path.join(self.path, shard), 'wb')
+        self._file.write(self._buffer[:self._buffered].tobytes())
+        self._in_shard += self._buffered
+        self._buffered = 0
+        if self._in_shard == self.shard_size:
+            self._finish_shard()
+
+    # closes the current shard and adds it to the index
+    def _finish_shard(self):
+        self._file.close()
+        line = json.dumps({'shard': os.path.basename(self._file.name), 'records': self._in_shard})
+        # one short O_APPEND write, so lines of concurrent writers don't mix
+        fd = os.open(os.path.join(self.path, _INDEX), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (line + '\n').encode())
+        finally:
+            os.close(fd)
+        self._file = None
+        self._in_shard = 0
+        self._shards += 1
+
+    def close(self):
+        """Writes out everything and indexes the last shard"""
+        self.flush()
+        if self._file is not None:
+            self._finish_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Dataset:
+    def __init__(self, path):
+        """Memory mapped view of the finished shards of a dataset
+
+        Parameters
+        ----------
+        path : str
+            Dataset directory written by DatasetWriter
+
+        Attributes
+        ----------
+        meta : dict
+            height, width, preview and packed of the records
+        dtype : numpy.dtype
+            Record layout, see record_dtype()
+        """
+        self.path = path
+        with open(os.path.join(path, _META)) as in_file:
+            self.meta = json.load(in_file)
+        self.dtype = record_dtype(**self.meta)
+        self._shards = []
+        self._starts = np.zeros(1, dtype=np.int64)
+        self._seen = set()
+        self.refresh()
+
+    def refresh(self):
+        """Picks up shards finished since the last refresh"""
+        try:
+            with open(os.path.join(self.path, _INDEX), 'rb') as in_file:
+                lines = in_file.read().split(b'\n')
+        except FileNotFoundError:
+            return
+        # the last line can be half written
+        for line in lines[:-1]:
+            entry = json.loads(line)
+            if entry['shard'] in self._seen or entry['records'] == 0:
+                continue
+            self._seen.add(entry['shard'])
+            self._shards.append(np.memmap(os.path.join(self.path, entry['shard']), self.dtype,
+                                          'r', shape=(entry['records'],)))
+        self._starts = np.cumsum([0] + [len(shard) for shard in self._shards])
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    def records(self, indices):
+        """Raw records at indices, read from the shards they're in"""
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) and (indices.min() < 0 or indices.max() >= len(self)):
+            raise ValueError('Record index out of range for {} records'.format(len(self)))
+        out = np.empty(len(indices), dtype=self.dtype)
+        shard_of = np.searchsorted(self._starts, indices, side='right') - 1
+        for shard in np.unique(shard_of).tolist():
+            mask = shard_of == shard
+            local = indices[mask] - self._starts[shard]
+            # sorted reads touch each page of the shard once
+            order = np.argsort(local)
+            out_ind = np.flatnonzero(mask)[order]
+            out[out_ind] = self._shards[shard][local[order]]
+        return out
+
+    def sample(self, batch_size, rng=None):
+        """Random mini-batch of transitions, see batch()
+
+        Parameters
+        ----------
+        batch_size : int
+        rng : numpy.random.Generator, optional
+            By default a new unseeded one
+        """
+        if not len(self):
+            raise ValueError('Dataset has no finished shards')
+        rng = rng if rng is not None else np.random.default_rng()
+        return self.batch(rng.integers(len(self), size=batch_size))
+
+    def batch(self, indices):
+        """Records at indices with the fields unpacked to int8 arrays
+
+        Returns
+        -------
+        dict of numpy.array
+            state_* and next_state_* for field (batch, height, width), piece,
+            rotation, pos, hold and next, plus action, reward and done
+        """
+        records = self.records(indices)
+        out = {}
+        for prefix in ('state', 'next_state'):
+            states = records[prefix]
+            field = states['field']
+            if self.meta['packed']:
+                height, width = self.meta['height'], self.meta['width']
+                field = np.unpackbits(field, axis=1, count=height * width).view(np.int8)
+                field = field.reshape(len(records), height, width)
+            out[prefix + '_field'] = field
+            for name in ('piece', 'rotation', 'pos', 'hold', 'next'):
+                out['{}_{}'.format(prefix, name)] = states[name]
+        for name in ('action', 'reward', 'done'):
+            out[name] = records[name]
+        return out
+
+
+# random player actions, the reward being the points they scored
+def _harvest(args):
+    path, seeds, config = args
+    rng = random.Random(seeds[0])
+    with DatasetWriter(path, **config) as writer:
+        for seed in seeds:
+            board = Board(rseed=seed, backend='bitboard')
+            while not board.dead:
+                state = writer.encode(board)
+                action = rng.choice(utils.PLAYER_ACTIONS)
+                score = board.score
+                board.act(action)
+                writer.add(state, utils.ACTIONS[action], board.score - score,
+                           writer.encode(board), board.dead)
+        return writer.records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Writes random play to a dataset')
+    parser.add_argument('out', help='dataset directory')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--start', type=int, default=0, help='first seed')
+    parser.add_argument('--workers', type=int, default=None, help='default: one per core')
+    parser.add_argument('--shard-size', type=int, default=1 << 16)
+    parser.add_argument('--int8', action='store_true', help='store shape values instead of bits')
+    args = parser.parse_args(argv)
+
+    config = {'shard_size': args.shard_size, 'packed': not args.int8}
+    workers = args.workers or os.cpu_count()
+    seeds = list(range(args.start, args.start + args.games))
+    tasks = [(args.out, seeds[i::workers], config) for i in range(workers) if seeds[i::workers]]
+    with multiprocessing.Pool(workers) as pool:
+        records = sum(pool.map(_harvest, tasks))
+    dataset = Dataset(args.out)
+    print('{} records written, {} in the dataset'.format(records, len(dataset)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+from itertools import islice
+
+import numpy as np
+import utils
+from tetris import Board
+
+# action names by code, utils.ACTIONS maps the other way
+_CODE_TO_ACTION = dict((val, key) for key, val in utils.ACTIONS.items())
+
+
+class TetrisEnv:
+    def __init__(self, backend='array', preview=5):
+        """Headless environment driving a Board with reset() / step()
+
+        Observations are written into buffers allocated once, the same dict
+        of arrays is returned by every call so callers must copy anything
+        they want to keep past the next step
+
+        Parameters
+        ----------
+        backend : str, optional
+            Field backend passed on to Board, by default 'array'
+        preview : int, optional
+            Number of next pieces in the observation, by default 5
+
+        Attributes
+        ----------
+        board : Board
+            Game being played, None until reset() is called
+        observation : dict of numpy.array
+            Allocated by the first reset() and reused after that:
+            'board' (height, width) shape values with the current piece drawn in,
+            'next_pieces' (preview,) shape values of the upcoming pieces,
+            'held_piece' (1,) shape value of the held piece (0 if none),
+            'ghost' (4, 2) cells the current piece would land on
+        """
+        self.backend = backend
+        self.preview = preview
+        self.board = None
+        self.observation = None
+
+    def _observe(self):
+        obs = self.observation
+        board = self.board
+        board.state(out=obs['board'])
+        for i, piece_str in enumerate(islice(board.next_pieces, self.preview)):
+            obs['next_pieces'][i] = utils.shape_values[piece_str]
+        obs['held_piece'][0] = utils.shape_values.get(board.held_piece, 0)
+        obs['ghost'][:] = board.ghost_piece_occupied
+        return obs
+
+    def reset(self, seed=None):
+        """Starts a new game
+
+        Parameters
+        ----------
+        seed : Any, optional
+            Seed for the piece generator, by default None
+
+        Returns
+        -------
+        dict of numpy.array
+            First observation
+        """
+        self.board = Board(rseed=seed, backend=self.backend)
+        if self.observation is None:
+            self.observation = {
+                'board': np.zeros((self.board.height, self.board.width), dtype=np.int8),
+                'next_pieces': np.zeros(self.preview, dtype=np.int8),
+                'held_piece': np.zeros(1, dtype=np.int8),
+                'ghost': np.zeros((4, 2), dtype=np.int64),
+            }
+        return self._observe()
+
+    def step(self, action):
+        """Applies one action to the game
+
+        Parameters
+        ----------
+        action : str or int
+            Action name accepted by Board.act or its code from utils.ACTIONS
+
+        Returns
+        -------
+        dict of numpy.array
+            Observation after the action
+        int
+            Points scored by the action
+        bool
+            Whether the game is over
+        dict
+            'lines_cleared' by the action and whether it 'succeeded'
+        """
+        board = self.board
+        if board is None or board.dead:
+            raise ValueError('Game is over, call reset() first')
+        if not isinstance(action, str):
+            try:
+                action = _CODE_TO_ACTION[action]
+            except KeyError:
+                raise ValueError('Invalid action code \'{}\''.format(action))
+
+        score, lines = board.score, board.lines_cleared
+        succeeded = board.act(action)
+        info = {
+            'lines_cleared': board.lines_cleared - lines,
+            'succeeded': succeeded,
+        }
+        return self._observe(), board.score - score, board.dead, info
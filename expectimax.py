@@ -0,0 +1,521 @@
+"""Expectimax search over the preview queue, serial or on a process pool
+
+    bot = ExpectimaxBot(depth=3, workers=8, budget=0.5)
+    placement = bot.choose(board)   # same interface as BeamSearchBot
+    bot.close()
+
+Pieces the player can see (the current one, the held one and the first
+preview next ones) are max nodes over every placement, hold included.
+Pieces past the preview are unknown: chance nodes averaging the best
+placement of each of the 7 shapes. Leaves are scored like
+BeamSearchBot's boards.
+
+With workers the tree is cut into tasks of one root placement and one
+placement after it (just the root placements for a depth of 2), which
+idle workers take one at a time from the pool's queue, so a few large
+subtrees don't leave the other workers waiting. A task carries the
+root's Board.snapshot() and the moves leading to its node, not a pickled
+Board. Results are combined in the order the serial search visits them,
+so with no budget both return the same placement.
+"""
+import argparse
+import math
+import multiprocessing
+import sys
+from time import monotonic
+
+import features
+import fields
+import movegen
+import utils
+import zobrist
+from bot import WEIGHTS, Evaluator
+from tetris import Board, Piece
+
+# value of a node where the game is lost
+_LOST = -math.inf
+
+# set by _init_worker() in each worker process
+_searcher = None
+_generation = None
+
+
+class _Cutoff(Exception):
+    pass
+
+
+# puts the piece where move says and locks it, move being
+#   (hold, rotation, row, col, tspin) as in movegen.Placement
+def _play(board, move):
+    hold, rotation, row, col, tspin = move
+    if hold:
+        board.act('hold')
+    piece = board.cur_piece
+    piece.rotation = rotation
+    piece.pos = [row, col]
+    # a T-spin is a T that got here by rotating
+    piece.last_move = 'cw' if tspin else 'd'
+    board.act('hd')
+
+
+# (backend, snapshot) of board, all it takes to rebuild it elsewhere
+def _pack(board):
+    for name, field_type in fields.BACKENDS.items():
+        if type(board._field) is field_type:
+            return name, board.snapshot()
+    raise ValueError('Unknown field type {}'.format(type(board._field).__name__))
+
+
+class _Searcher:
+    # the search itself, run the same way by the driver and the workers
+    def __init__(self, preview, hold, weights, table_size):
+        self.preview = preview
+        self.hold = hold
+        self.evaluator = Evaluator(weights, table_size)
+        self._boards = {}
+        # called at every node, raises _Cutoff to abandon the search
+        self.check = None
+        self.root_lines = 0
+        self.nodes = 0
+
+    def unpack(self, packed):
+        """Board at a _pack()ed position (reused between calls)"""
+        backend, snap = packed
+        if backend not in self._boards:
+            self._boards[backend] = Board(rseed=0, backend=backend)
+        board = self._boards[backend]
+        board.restore(snap)
+        return board
+
+    def moves(self, work, hold):
+        """(placement, move) of each distinct placement the game survives"""
+        snap = work.snapshot()
+        out = []
+        seen = set()
+        for placement in movegen.placements(work, hold):
+            move = (placement.hold, placement.rotation, placement.pos[0], placement.pos[1],
+                    placement.tspin)
+            work.restore(snap)
+            _play(work, move)
+            if work.dead:
+                continue
+            key = work.zobrist
+            if key not in seen:
+                seen.add(key)
+                out.append((placement, move))
+        work.restore(snap)
+        return out
+
+    def options(self, work, used):
+        """(placement, move, used after it) of each child of the max node at work,
+        used being the queue pieces taken since the root"""
+        # holding without a held piece brings in the next one, which has to be visible
+        hold = self.hold and not work._hold_used \
+            and (work.held_piece is not None or used < self.preview)
+        out = []
+        for placement, move in self.moves(work, hold):
+            taken = 2 if placement.hold and work.held_piece is None else 1
+            out.append((placement, move, used + taken))
+        return out
+
+    def children(self, work, used):
+        """Children of the node at work, see options()
+
+        Returns
+        -------
+        list
+            (move, used after it) of a max node, or for a chance node
+            (the current piece not being in the preview) one list of those
+            per shape of utils.SHAPES, None for a shape that can't spawn
+        bool
+            Whether it's a chance node
+        """
+        if used <= self.preview:
+            return [(move, taken) for _, move, taken in self.options(work, used)], False
+        snap = work.snapshot()
+        per_shape = []
+        for shape in utils.SHAPES:
+            self.spawn(work, snap, shape)
+            if work._piece_valid():
+                per_shape.append([(move, used + 1) for _, move in self.moves(work, False)])
+            else:
+                per_shape.append(None)
+        work.restore(snap)
+        return per_shape, True
+
+    def value(self, work, depth, used):
+        """Expected best score of placing depth more pieces from work (left unchanged)"""
+        if self.check is not None:
+            self.check()
+        children, chance = self.children(work, used)
+        if not chance:
+            return self._best(work, depth, children, None)
+        total = 0.0
+        for shape, moves in zip(utils.SHAPES, children):
+            if not moves:
+                return _LOST
+            total += self._best(work, depth, moves, shape)
+        return total / len(utils.SHAPES)
+
+    # best of the children, shape replacing the current piece of a chance node
+    def _best(self, work, depth, children, shape):
+        if not children:
+            return _LOST
+        snap = work.snapshot()
+        if depth == 1:
+            scores = self.leaf_scores(work, [move for move, _ in children], shape)
+            return float(scores.max())
+        best = _LOST
+        for move, used in children:
+            self.play(work, snap, shape, move)
+            best = max(best, self.value(work, depth - 1, used))
+        work.restore(snap)
+        return best
+
+    @staticmethod
+    def spawn(work, snap, shape):
+        """Restores snap, with shape as the current piece if given"""
+        work.restore(snap)
+        if shape is not None:
+            work.cur_piece = Piece(shape, work)
+            work._ghost = None
+
+    def play(self, work, snap, shape, move):
+        """Restores snap and plays move, with shape as the current piece if given"""
+        self.spawn(work, snap, shape)
+        _play(work, move)
+
+    def leaf_scores(self, work, moves, shape=None):
+        """Scores of the boards after each move, as BeamSearchBot scores them"""
+        snap = work.snapshot()
+        counts = work.row_counts
+        piece_str = shape if shape is not None else work.cur_piece.piece_str
+        swap = work.held_piece if work.held_piece is not None else work.next_pieces[0]
+        evaluator = self.evaluator
+        for move in moves:
+            self.play(work, snap, shape, move)
+            evaluator.add(work, features.eroded_cells(
+                counts, work.width, swap if move[0] else piece_str, move[1], move[2:4]),
+                work.lines_cleared - self.root_lines)
+        work.restore(snap)
+        self.nodes += len(moves)
+        return evaluator.scores()
+
+    def lookups(self):
+        """(hits, misses) of the field score table so far"""
+        table = self.evaluator.table
+        return table.hits, table.misses
+
+
+def _init_worker(preview, hold, weights, table_size, generation):
+    global _searcher, _generation
+    _searcher = _Searcher(preview, hold, weights, table_size)
+    _generation = generation
+
+
+# value of the node reached by playing path from the packed root
+# returns (index, value, nodes evaluated, table hits, table misses), value None if cut off
+def _run_task(task):
+    ind, generation, deadline, packed, root_lines, path, depth, used = task
+
+    def check():
+        if _generation.value != generation or (deadline is not None and monotonic() > deadline):
+            raise _Cutoff()
+    searcher = _searcher
+    searcher.check = check
+    searcher.root_lines = root_lines
+    searcher.nodes = 0
+    hits, misses = searcher.lookups()
+    work = searcher.unpack(packed)
+    for shape, move in path:
+        searcher.play(work, work.snapshot(), shape, move)
+    try:
+        value = searcher.value(work, depth, used)
+    except _Cutoff:
+        value = None
+    end_hits, end_misses = searcher.lookups()
+    return ind, value, searcher.nodes, end_hits - hits, end_misses - misses
+
+
+class ExpectimaxBot:
+    def __init__(self, depth=3, budget=None, workers=0, preview=zobrist.PREVIEW, hold=True,
+                 weights=None, table_size=1 << 16):
+        """Depth limited expectimax search, see the module docstring
+
+        Parameters
+        ----------
+        depth : int, optional
+            Pieces to look ahead, the current one included, by default 3
+        budget : float, optional
+            Seconds per move, by default None which always searches the
+            full depth. With a budget the depths are searched one after the
+            other and the deepest finished one is played (depth 1 is always
+            finished, however long it takes)
+        workers : int, optional
+            Worker processes, by default 0 which searches in this process,
+            None for one per core
+        preview : int, optional
+            Next pieces the bot may look at, by default zobrist.PREVIEW
+        hold : bool, optional
+            Whether to consider holding, by default True
+        weights : dict, optional
+            Weight of each of features.FEATURES and 'lines', by default bot.WEIGHTS
+        table_size : int, optional
+            Most field scores kept between moves by the search and by each
+            worker, see bot.Evaluator, by default 65536
+
+        Attributes
+        ----------
+        nodes : int
+            Boards evaluated by the last choose()
+        table_hits, table_misses : int
+            Boards of the last choose() whose field score was / wasn't
+            already in the table (of the process that scored them)
+        depth_reached : int
+            Depth of the search the last choose() played
+        elapsed : float
+            Seconds the last choose() took
+        """
+        if depth < 1:
+            raise ValueError('Depth must be positive, got {}'.format(depth))
+        weights = WEIGHTS if weights is None else weights
+        self.depth = depth
+        self.budget = budget
+        self.workers = workers if workers is not None else multiprocessing.cpu_count()
+        self.preview = preview
+        self.hold = hold
+        self.weights = weights
+        self.table_size = table_size
+        self._searcher = _Searcher(preview, hold, weights, table_size)
+        self._pool = None
+        self._generation = None
+
+        self.nodes = 0
+        self.depth_reached = 0
+        self.elapsed = 0.0
+        self.table_hits = 0
+        self.table_misses = 0
+
+    @property
+    def nodes_per_second(self):
+        """Evaluation rate of the last choose()"""
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def table_hit_rate(self):
+        """Fraction of the last choose()'s boards scored from a table"""
+        lookups = self.table_hits + self.table_misses
+        return self.table_hits / lookups if lookups else 0.0
+
+    def choose(self, board):
+        """Best placement for board's current piece
+
+        Parameters
+        ----------
+        board : Board
+            Board to move on, left unchanged
+
+        Returns
+        -------
+        movegen.Placement
+            Placement to play (see its path), None if every move loses
+        """
+        start = monotonic()
+        deadline = start + self.budget if self.budget is not None else None
+        searcher = self._searcher
+        searcher.root_lines = board.lines_cleared
+        searcher.nodes = 0
+        hits, misses = searcher.lookups()
+        self.nodes = 0
+        self.depth_reached = 0
+        self.table_hits = 0
+        self.table_misses = 0
+
+        work = board.clone()
+        options = searcher.options(work, 0)
+        best = None
+        if options:
+            # with no budget the shallower searches would be thrown away
+            depths = range(1, self.depth + 1) if deadline is not None else [self.depth]
+            for depth in depths:
+                if depth == 1:
+                    values = searcher.leaf_scores(work, [move for _, move, _ in options]).tolist()
+                elif self.workers:
+                    values = self._parallel_values(work, options, depth, deadline)
+                else:
+                    values = self._serial_values(work, options, depth, deadline)
+                if values is None:
+                    break
+                # first of the best, as the serial search has it
+                best = options[values.index(max(values))][0]
+                self.depth_reached = depth
+
+        self.nodes += searcher.nodes
+        end_hits, end_misses = searcher.lookups()
+        self.table_hits += end_hits - hits
+        self.table_misses += end_misses - misses
+        self.elapsed = monotonic() - start
+        return best
+
+    # values of the root options searched depth pieces deep, None if cut off
+    def _serial_values(self, work, options, depth, deadline):
+        searcher = self._searcher
+
+        def check():
+            if deadline is not None and monotonic() > deadline:
+                raise _Cutoff()
+        searcher.check = check
+        snap = work.snapshot()
+        values = []
+        try:
+            for _, move, used in options:
+                searcher.play(work, snap, None, move)
+                values.append(searcher.value(work, depth - 1, used))
+        except _Cutoff:
+            return None
+        finally:
+            searcher.check = None
+            work.restore(snap)
+        return values
+
+    def _parallel_values(self, work, options, depth, deadline):
+        if self._pool is None:
+            self._generation = multiprocessing.Value('q', 0)
+            self._pool = multiprocessing.Pool(
+                self.workers, _init_worker,
+                (self.preview, self.hold, self.weights, self.table_size, self._generation))
+        with self._generation.get_lock():
+            self._generation.value += 1
+            generation = self._generation.value
+
+        searcher = self._searcher
+        snap = work.snapshot()
+        packed = _pack(work)
+        root_lines = searcher.root_lines
+        # tasks are (path from the root, depth, used), plans say how to
+        #   combine their values into each option's: a task index, or
+        #   (chance, task indices per shape) for options split one level down
+        tasks = []
+        plans = []
+        for _, move, used in options:
+            if depth == 2:
+                plans.append(len(tasks))
+                tasks.append(([(None, move)], depth - 1, used))
+                continue
+            searcher.play(work, snap, None, move)
+            children, chance = searcher.children(work, used)
+            groups = []
+            for shape, moves in zip(utils.SHAPES, children) if chance else [(None, children)]:
+                group = []
+                for child, child_used in moves or ():
+                    group.append(len(tasks))
+                    tasks.append(([(None, move), (shape, child)], depth - 2, child_used))
+                groups.append(group)
+            plans.append((chance, groups))
+        work.restore(snap)
+
+        results = [None] * len(tasks)
+        jobs = [(ind, generation, deadline, packed, root_lines) + task
+                for ind, task in enumerate(tasks)]
+        # one task at a time, whichever worker is free takes the next one
+        finished = self._pool.imap_unordered(_run_task, jobs, chunksize=1)
+        try:
+            for _ in jobs:
+                timeout = None if deadline is None else max(deadline - monotonic(), 0)
+                ind, value, nodes, hits, misses = finished.next(timeout)
+                if value is None:
+                    return None
+                results[ind] = value
+                self.nodes += nodes
+                self.table_hits += hits
+                self.table_misses += misses
+        except multiprocessing.TimeoutError:
+            return None
+        finally:
+            # tasks still queued or running give up at their next node
+            with self._generation.get_lock():
+                self._generation.value += 1
+
+        values = []
+        for plan in plans:
+            if isinstance(plan, int):
+                values.append(results[plan])
+                continue
+            chance, groups = plan
+            if not chance:
+                values.append(max([_LOST] + [results[ind] for ind in groups[0]]))
+                continue
+            total = 0.0
+            for group in groups:
+                if not group:
+                    total = _LOST
+                    break
+                total += max([_LOST] + [results[ind] for ind in group])
+            values.append(total / len(utils.SHAPES))
+        return values
+
+    def close(self):
+        """Stops the worker processes"""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plays a headless game with the expectimax bot')
+    parser.add_argument('--pieces', type=int, default=20, help='pieces to place (default: 20)')
+    parser.add_argument('--depth', type=int, default=3, help='pieces to look ahead')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='seconds per move (default: always the full depth)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes, 0 to search in this process (default: one per core)')
+    parser.add_argument('--check', action='store_true',
+                        help='also search each move serially and count disagreements')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', default='bitboard')
+    args = parser.parse_args(argv)
+
+    board = Board(rseed=args.seed, backend=args.backend)
+    serial = ExpectimaxBot(args.depth, args.budget, 0) if args.check else None
+    nodes = 0
+    hits = 0
+    elapsed = 0.0
+    serial_elapsed = 0.0
+    differ = 0
+    placed = 0
+    with ExpectimaxBot(args.depth, args.budget, args.workers) as bot:
+        while not board.dead and placed < args.pieces:
+            placement = bot.choose(board)
+            if placement is None:
+                break
+            nodes += bot.nodes
+            hits += bot.table_hits
+            elapsed += bot.elapsed
+            if serial is not None:
+                other = serial.choose(board)
+                serial_elapsed += serial.elapsed
+                differ += other is None or other.path != placement.path
+            for action in placement.path:
+                board.act(action)
+            placed += 1
+
+    print('pieces {} lines {} score {} {}'.format(
+        placed, board.lines_cleared, board.score, 'dead' if board.dead else ''))
+    print('{:.0f} nodes/s, {:.1%} scored from the table, {:.3f} s per move'.format(
+        nodes / elapsed if elapsed else 0, hits / nodes if nodes else 0,
+        elapsed / placed if placed else 0))
+    if serial is not None:
+        print('serial {:.3f} s per move, {} moves differ'.format(
+            serial_elapsed / placed if placed else 0, differ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
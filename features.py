@@ -0,0 +1,132 @@
+"""Board features for evaluators, computed for many fields at once
+
+    fields = features.stack(boards)          # or a raw (N, 26, 10) array
+    scores = features.extract(fields) @ weights
+
+Fields are full height, hidden spawn rows included. Heights are counted
+from the bottom of the field, so a stack reaching into the hidden rows
+counts in full, and rows with nothing in them (like the hidden rows
+usually are) add no row transitions.
+"""
+import numpy as np
+import utils
+
+# columns of extract()'s output
+FEATURES = ('aggregate_height', 'max_height', 'holes', 'bumpiness', 'wells',
+            'row_transitions', 'column_transitions', 'eroded_cells')
+
+
+def stack(boards, out=None):
+    """Placed cells of each board (the current piece left out) as one array
+
+    Parameters
+    ----------
+    boards : sequence of Board
+        Boards of the same size
+    out : numpy.array, optional
+        (N, height, width) array to write into, by default None which
+        allocates a new one
+
+    Returns
+    -------
+    numpy.array
+        Shape value of each cell of each board, 0 if empty
+    """
+    if out is None:
+        first = boards[0]
+        out = np.empty((len(boards), first.height, first.width), dtype=np.int8)
+    for i, board in enumerate(boards):
+        out[i] = board._board
+    return out
+
+
+def eroded_cells(row_counts, width, piece_str, rotation, pos):
+    """Eroded piece cells of placing a piece: lines it clears times the
+    number of its own cells in them
+
+    Parameters
+    ----------
+    row_counts : sequence of int
+        Filled cells per row before the piece is placed (Board.row_counts)
+    width : int
+        Number of columns of the field
+    piece_str : str
+        Letter of the piece
+    rotation : int
+        Rotation of the piece
+    pos : sequence of int
+        Row and column the piece is placed at
+
+    Returns
+    -------
+    int
+    """
+    lines = 0
+    cells = 0
+    for r_off, mask in utils.PIECE_ROWS[piece_str][rotation]:
+        in_row = bin(mask).count('1')
+        if row_counts[pos[0] + r_off] + in_row == width:
+            lines += 1
+            cells += in_row
+    return lines * cells
+
+
+def extract(fields, eroded=None):
+    """Feature matrix of a stack of fields
+
+    Parameters
+    ----------
+    fields : numpy.array or sequence of Board
+        (N, height, width) array where non zero cells are filled, a single
+        (height, width) field, or boards (see stack())
+    eroded : array_like, optional
+        Eroded cells of the placement that led to each field (see
+        eroded_cells()), by default None which fills the column with 0s
+
+    Returns
+    -------
+    numpy.array
+        (N, len(FEATURES)) integer array, columns in FEATURES order
+    """
+    if not isinstance(fields, np.ndarray):
+        fields = stack(fields)
+    if fields.ndim == 2:
+        fields = fields[None]
+    if fields.ndim != 3:
+        raise ValueError('Expected (N, height, width) fields, got shape {}'.format(fields.shape))
+    count, height, width = fields.shape
+
+    filled = fields != 0
+    out = np.zeros((count, len(FEATURES)), dtype=np.int64)
+
+    # heights from the first filled cell of each column
+    heights = np.where(filled.any(axis=1), height - filled.argmax(axis=1), 0)
+    out[:, 0] = heights.sum(axis=1)
+    out[:, 1] = heights.max(axis=1)
+
+    # empty cells with something above them
+    covered = np.logical_or.accumulate(filled, axis=1)
+    out[:, 2] = np.count_nonzero(covered & ~filled, axis=(1, 2))
+
+    out[:, 3] = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+
+    # depth of each column below both its neighbours, the walls being higher than anything
+    walled = np.pad(heights, ((0, 0), (1, 1)), constant_values=height + 1)
+    depths = np.minimum(walled[:, :-2], walled[:, 2:]) - heights
+    out[:, 4] = np.clip(depths, 0, None).sum(axis=1)
+
+    # walls count as filled, rows that are entirely empty are skipped
+    sides = np.ones((count, height, 1), dtype=bool)
+    rows = np.concatenate((sides, filled, sides), axis=2)
+    row_trans = np.count_nonzero(rows[:, :, 1:] != rows[:, :, :-1], axis=2)
+    out[:, 5] = (row_trans * filled.any(axis=2)).sum(axis=1)
+
+    # the floor counts as filled, the top of the field as empty
+    floor = np.ones((count, 1, width), dtype=bool)
+    cols = np.concatenate((filled, floor), axis=1)
+    out[:, 6] = np.count_nonzero(cols[:, 1:] != cols[:, :-1], axis=(1, 2)) \
+        + np.count_nonzero(filled[:, 0], axis=1)
+
+    if eroded is not None:
+        out[:, 7] = eroded
+    return out
@@ -0,0 +1,272 @@
+"""Change feed of a board for spectators
+
+    writer = FeedWriter(board)
+    ...
+    message = writer.poll()     # e.g. once a frame, b'' if nothing changed
+    view.apply(message)         # view = FeedView() on the other end
+
+A message is a run of records, each a code byte and its fields:
+
+    KEYFRAME  height, width, then height * width shape values (the field)
+    PIECE     shape, rotation, row, column, ghost row of the current piece
+    LOCK      shape, rotation, row, column of a piece that locked
+    CLEAR     count, then the rows a lock cleared (top to bottom)
+    HOLD      shape of the held piece
+    NEXT      count, then the shapes of the next pieces
+    STATUS    score (8 bytes), lines cleared (4 bytes) and whether the game is lost
+
+Shapes are utils.shape_values (0 for none), rows and columns signed
+bytes. A keyframe carries the full state, so a view can join the feed at
+any keyframe. Between keyframes only what changed since the last poll is
+sent, a few bytes for a moving piece against the 2 kB of a state() array,
+and messages are built once however many views they're sent to.
+"""
+from itertools import islice
+import struct
+
+import numpy as np
+import utils
+
+KEYFRAME = 1
+PIECE = 2
+LOCK = 3
+CLEAR = 4
+HOLD = 5
+NEXT = 6
+STATUS = 7
+
+_PIECE = struct.Struct('<BBbbb')
+_LOCK = struct.Struct('<BBbb')
+_STATUS = struct.Struct('<QI?')
+_SIZE = struct.Struct('<BB')
+
+_VAL_TO_SHAPE = dict((val, key) for key, val in utils.shape_values.items())
+
+
+class FeedWriter:
+    def __init__(self, board, preview=5, keyframe_every=300):
+        """Builds the change feed of board, see the module docstring
+
+        Locks are recorded as they happen (through board.feed), everything
+        else is compared against the last poll when polled
+
+        Parameters
+        ----------
+        board : Board
+            Board to follow, its feed attribute is set to this writer
+        preview : int, optional
+            Number of next pieces sent, by default 5
+        keyframe_every : int, optional
+            Polls between keyframes, by default 300 (5 s at 60 polls per
+            second). The first poll is always a keyframe
+
+        Attributes
+        ----------
+        polls : int
+            Number of poll() calls
+        """
+        if board.feed is not None:
+            raise ValueError('Board already has a feed')
+        if keyframe_every < 1:
+            raise ValueError('Keyframe interval must be positive, got {}'.format(keyframe_every))
+        self.board = board
+        self.preview = preview
+        self.keyframe_every = keyframe_every
+        self.polls = 0
+        board.feed = self
+
+        self._events = bytearray()
+        self._locked = False
+        self._field_hash = None
+        self._piece = None
+        self._held = None
+        self._next = None
+        self._status = None
+
+    # called by Board._lock_piece once the piece is in the field, before lines clear
+    def locked(self, piece):
+        events = self._events
+        events.append(LOCK)
+        events += _LOCK.pack(utils.shape_values[piece.piece_str], piece.rotation, *piece.pos)
+        full = self.board._field._full_rows()
+        if full:
+            events.append(CLEAR)
+            events.append(len(full))
+            events += bytes(full)
+        self._locked = True
+
+    def poll(self, keyframe=False):
+        """Changes since the last poll as one message
+
+        A field that changed without a lock in between (e.g. a restore())
+        is sent as a keyframe. Restoring and locking between two polls
+        goes unnoticed, poll with keyframe=True after restoring
+
+        Parameters
+        ----------
+        keyframe : bool, optional
+            Whether to send the full state, by default False which only
+            does every keyframe_every polls
+
+        Returns
+        -------
+        bytes
+            Message for FeedView.apply(), empty if nothing changed
+        """
+        board = self.board
+        keyframe = keyframe or self.polls % self.keyframe_every == 0 \
+            or (board._field_hash != self._field_hash and not self._locked)
+        self.polls += 1
+
+        out = bytearray()
+        if keyframe:
+            field = board._board
+            out.append(KEYFRAME)
+            out += _SIZE.pack(board.height, board.width)
+            out += field.astype(np.int8).tobytes()
+        else:
+            out += self._events
+        self._events.clear()
+        self._locked = False
+
+        piece = board.cur_piece
+        piece_key = (piece.piece_str, piece.rotation, piece.pos[0], piece.pos[1])
+        if keyframe or piece_key != self._piece or board._field_hash != self._field_hash:
+            self._piece = piece_key
+            out.append(PIECE)
+            out += _PIECE.pack(utils.shape_values[piece.piece_str], piece.rotation,
+                               piece.pos[0], piece.pos[1], piece.pos[0] + board.drop_distance())
+        self._field_hash = board._field_hash
+
+        if keyframe or board.held_piece != self._held:
+            self._held = board.held_piece
+            out.append(HOLD)
+            out.append(utils.shape_values.get(board.held_piece, 0))
+
+        next_pieces = tuple(islice(board.next_pieces, self.preview))
+        if keyframe or next_pieces != self._next:
+            self._next = next_pieces
+            out.append(NEXT)
+            out.append(len(next_pieces))
+            out += bytes(utils.shape_values[piece_str] for piece_str in next_pieces)
+
+        status = (board.score, board.lines_cleared, board.dead)
+        if keyframe or status != self._status:
+            self._status = status
+            out.append(STATUS)
+            out += _STATUS.pack(*status)
+        return bytes(out)
+
+    def close(self):
+        """Stops following the board"""
+        if self.board.feed is self:
+            self.board.feed = None
+
+
+class FeedView:
+    def __init__(self):
+        """Board state rebuilt from a FeedWriter's messages
+
+        Messages before the first keyframe are skipped
+
+        Attributes
+        ----------
+        field : numpy.array
+            Shape value of each placed cell, None until synced
+        cur_piece : tuple
+            (shape letter, rotation, row, column) of the current piece
+        ghost_row : int
+            Row the current piece would land on
+        held_piece : str
+            Letter of the held piece, None if there's none
+        next_pieces : tuple of str
+            Letters of the next pieces
+        score, lines_cleared : int
+        dead : bool
+        """
+        self.field = None
+        self.cur_piece = None
+        self.ghost_row = None
+        self.held_piece = None
+        self.next_pieces = ()
+        self.score = 0
+        self.lines_cleared = 0
+        self.dead = False
+
+    @property
+    def synced(self):
+        """Whether a keyframe has been applied"""
+        return self.field is not None
+
+    def apply(self, message):
+        """Applies one message from FeedWriter.poll()
+
+        Returns
+        -------
+        bool
+            False if the message was skipped, waiting for a keyframe
+        """
+        if not message:
+            return self.synced
+        if not self.synced and message[0] != KEYFRAME:
+            return False
+
+        pos = 0
+        while pos < len(message):
+            code = message[pos]
+            pos += 1
+            if code == PIECE:
+                val, rot, row, col, ghost = _PIECE.unpack_from(message, pos)
+                pos += _PIECE.size
+                self.cur_piece = (_VAL_TO_SHAPE[val], rot, row, col)
+                self.ghost_row = ghost
+            elif code == LOCK:
+                val, rot, row, col = _LOCK.unpack_from(message, pos)
+                pos += _LOCK.size
+                for r_off, c_off in utils.OCCUPIED[_VAL_TO_SHAPE[val]][rot]:
+                    self.field[row + r_off, col + c_off] = val
+            elif code == CLEAR:
+                count = message[pos]
+                full = list(message[pos + 1:pos + 1 + count])
+                pos += 1 + count
+                kept = np.ones(len(self.field), dtype=bool)
+                kept[full] = False
+                self.field[count:] = self.field[kept]
+                self.field[:count] = 0
+            elif code == HOLD:
+                self.held_piece = _VAL_TO_SHAPE.get(message[pos])
+                pos += 1
+            elif code == NEXT:
+                count = message[pos]
+                self.next_pieces = tuple(_VAL_TO_SHAPE[val] for val in message[pos + 1:pos + 1 + count])
+                pos += 1 + count
+            elif code == STATUS:
+                self.score, self.lines_cleared, self.dead = _STATUS.unpack_from(message, pos)
+                pos += _STATUS.size
+            elif code == KEYFRAME:
+                height, width = _SIZE.unpack_from(message, pos)
+                pos += _SIZE.size
+                cells = np.frombuffer(message, np.int8, height * width, pos)
+                self.field = cells.reshape(height, width).copy()
+                pos += height * width
+            else:
+                raise ValueError('Invalid feed record {} at byte {}'.format(code, pos - 1))
+        return True
+
+    @property
+    def ghost_piece_occupied(self):
+        """Cells the current piece would land on, like Board.ghost_piece_occupied"""
+        piece_str, rot, _, col = self.cur_piece
+        return tuple((self.ghost_row + r_off, col + c_off)
+                     for r_off, c_off in utils.OCCUPIED[piece_str][rot])
+
+    def state(self, out=None):
+        """Field with the current piece drawn in, like Board.state()"""
+        if out is None:
+            out = self.field.copy()
+        else:
+            np.copyto(out, self.field)
+        piece_str, rot, row, col = self.cur_piece
+        for r_off, c_off in utils.OCCUPIED[piece_str][rot]:
+            out[row + r_off, col + c_off] = utils.shape_values[piece_str]
+        return out
@@ -0,0 +1,332 @@
+import numpy as np
+import utils
+
+
+class _Field:
+    """Behaviour shared by the field backends
+
+    Subclasses keep tops (per column, the index of the highest filled row
+    or height if the column is empty) and counts (number of filled cells
+    per row) up to date in place() and clear_lines()
+    """
+    __slots__ = ()
+
+    def drop_distance(self, piece_str, rotation, pos):
+        """Number of rows the piece can fall from pos before landing
+
+        Uses the column tops when the piece is above the stack in every
+        column it covers, otherwise (e.g. tucked under an overhang) steps down
+        """
+        row, col = pos
+        dist = self.height
+        for c_off, r_off in utils.BOTTOMS[piece_str][rotation]:
+            gap = self.tops[col + c_off] - (row + r_off) - 1
+            if gap < 0:
+                return self._drop_by_steps(piece_str, rotation, pos)
+            if gap < dist:
+                dist = gap
+        return dist
+
+    def shift_distance(self, piece_str, rotation, pos, direc):
+        """Number of columns the piece can move from pos before hitting a
+        wall or a block, direc is -1 for left and 1 for right
+
+        Looks up the nearest filled cell beside each row of the piece in
+        the row masks, so it costs the same however far the piece goes
+        """
+        row, col = pos
+        dist = self.width
+        for r_off, left, right in utils.SIDES[piece_str][rotation]:
+            mask = self.row_mask(row + r_off)
+            if direc < 0:
+                # bit_length is one past the nearest filled column to the left
+                gap = col + left - (mask & ((1 << (col + left)) - 1)).bit_length()
+            else:
+                beside = mask >> (col + right + 1)
+                if beside:
+                    gap = (beside & -beside).bit_length() - 1
+                else:
+                    gap = self.width - 1 - (col + right)
+            if gap < dist:
+                dist = gap
+        return dist
+
+    def _drop_by_steps(self, piece_str, rotation, pos):
+        dist = 0
+        while not self.collides(piece_str, rotation, (pos[0] + dist + 1, pos[1])):
+            dist += 1
+        return dist
+
+    def copy(self):
+        """Independent copy of the field"""
+        field = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(field, name, getattr(self, name))
+        field.cells = self.cells.copy()
+        field.restore(self.snapshot())
+        return field
+
+    # adds a placed piece to tops and counts
+    def _add_piece(self, piece_str, rotation, pos):
+        tops = self.tops
+        counts = self.counts
+        for r_off, c_off in utils.OCCUPIED[piece_str][rotation]:
+            r_ind, c_ind = pos[0] + r_off, pos[1] + c_off
+            counts[r_ind] += 1
+            if r_ind < tops[c_ind]:
+                tops[c_ind] = r_ind
+
+    # indices of the full rows
+    def _full_rows(self):
+        return [r_ind for r_ind, count in enumerate(self.counts) if count == self.width]
+
+    # counts with the rows in full removed and empty rows added on top
+    def _compact_counts(self, full):
+        return [0] * len(full) + [count for r_ind, count in enumerate(self.counts)
+                                  if r_ind not in full]
+
+
+class ArrayField(_Field):
+    __slots__ = ('height', 'width', 'cells', 'tops', 'counts')
+
+    def __init__(self, height, width, board=None):
+        """Playing field stored as a numpy array of shape values
+
+        Parameters
+        ----------
+        height : int
+            Number of rows, including the hidden spawn rows
+        width : int
+            Number of columns
+        board : numpy.array, optional
+            Initial field, by default None which generates an empty field
+
+        Attributes
+        ----------
+        cells : numpy.array
+            (height, width) array holding the shape value of each cell, 0 if empty
+        tops : list of int
+            Index of the highest filled row of each column, height if empty
+        counts : list of int
+            Number of filled cells in each row
+        """
+        self.height = height
+        self.width = width
+
+        if board is None:
+            self.cells = np.zeros((height, width), dtype=int)
+        else:
+            self.cells = np.array(board)
+
+        self.counts = np.count_nonzero(self.cells, axis=1).tolist()
+        self._update_tops()
+
+    def _update_tops(self):
+        filled = self.cells != 0
+        self.tops = np.where(filled.any(axis=0), filled.argmax(axis=0),
+                             self.height).tolist()
+
+    def _out_of_bounds(self, pos):
+        return not 0 <= pos[0] < self.height or not 0 <= pos[1] < self.width
+
+    def row_masks(self):
+        """Bitmask per row, bit i is set if column i is filled"""
+        return ((self.cells != 0) @ (1 << np.arange(self.width))).tolist()
+
+    def row_mask(self, r_ind):
+        """Bitmask of one row, see row_masks()"""
+        mask = 0
+        for c_ind, val in enumerate(self.cells[r_ind].tolist()):
+            if val:
+                mask |= 1 << c_ind
+        return mask
+
+    # walks out from the piece's side in each row it covers, the rows are
+    #   fetched in one go since indexing the array cell by cell is slow
+    def shift_distance(self, piece_str, rotation, pos, direc):
+        row, col = pos
+        min_r, max_r = utils.EXTENTS[piece_str][rotation][:2]
+        lines = self.cells[row + min_r:row + max_r + 1].tolist()
+        dist = self.width
+        for r_off, left, right in utils.SIDES[piece_str][rotation]:
+            line = lines[r_off - min_r]
+            c_ind = col + (left if direc < 0 else right) + direc
+            gap = 0
+            while gap < dist and 0 <= c_ind < self.width and not line[c_ind]:
+                gap += 1
+                c_ind += direc
+            dist = gap
+        return dist
+
+    # copy of the mutable state, for restore() (shape values fit in a byte)
+    def snapshot(self):
+        return self.cells.astype(np.int8), self.tops[:], self.counts[:]
+
+    def restore(self, snap):
+        cells, tops, counts = snap
+        np.copyto(self.cells, cells)
+        self.tops = tops[:]
+        self.counts = counts[:]
+
+    # checks if the cell is blocked (out of bounds cells count as blocked)
+    def filled(self, pos):
+        return self._out_of_bounds(pos) or self.cells[pos] != 0
+
+    # checks if the piece would intersect placed blocks / the walls at pos
+    def collides(self, piece_str, rotation, pos):
+        for r_off, c_off in utils.OCCUPIED[piece_str][rotation]:
+            if self.filled((pos[0] + r_off, pos[1] + c_off)):
+                return True
+        return False
+
+    # writes the piece into the field
+    def place(self, piece_str, rotation, pos):
+        val = utils.shape_values[piece_str]
+        for r_off, c_off in utils.OCCUPIED[piece_str][rotation]:
+            self.cells[pos[0] + r_off, pos[1] + c_off] = val
+        self._add_piece(piece_str, rotation, pos)
+
+    # removes full rows, shifting everything above down
+    # returns the number of rows removed
+    def clear_lines(self):
+        if self.width not in self.counts:
+            return 0
+        full = self._full_rows()
+
+        kept = np.ones(self.height, dtype=bool)
+        kept[full] = False
+        lcleared = len(full)
+        self.cells[lcleared:] = self.cells[kept]
+        self.cells[:lcleared] = 0
+        self.counts = self._compact_counts(full)
+        self._update_tops()
+        return lcleared
+
+
+class BitField(_Field):
+    __slots__ = ('height', 'width', 'cells', 'tops', 'counts', 'rows', '_full_row')
+
+    def __init__(self, height, width, board=None):
+        """Playing field stored as one integer bitmask per row
+
+        Collision, locking and line detection only touch the row masks;
+        the colour plane is kept up to date for rendering and state()
+
+        Parameters
+        ----------
+        height : int
+            Number of rows, including the hidden spawn rows
+        width : int
+            Number of columns
+        board : numpy.array, optional
+            Initial field, by default None which generates an empty field
+
+        Attributes
+        ----------
+        rows : list of int
+            Bitmask per row, bit i is set if column i is filled
+        cells : numpy.array
+            (height, width) array holding the shape value of each cell, 0 if empty
+        tops : list of int
+            Index of the highest filled row of each column, height if empty
+        counts : list of int
+            Number of filled cells in each row
+        """
+        self.height = height
+        self.width = width
+        self._full_row = (1 << width) - 1
+
+        if board is None:
+            self.cells = np.zeros((height, width), dtype=int)
+        else:
+            self.cells = np.array(board)
+
+        self.rows = ((self.cells != 0) @ (1 << np.arange(width))).tolist()
+        self.counts = np.count_nonzero(self.cells, axis=1).tolist()
+        self._update_tops()
+
+    def _update_tops(self):
+        self.tops = [self.height] * self.width
+        remaining = self._full_row
+        for r_ind, row in enumerate(self.rows):
+            new = row & remaining
+            while new:
+                low = new & -new
+                self.tops[low.bit_length() - 1] = r_ind
+                new ^= low
+            remaining &= ~row
+            if not remaining:
+                break
+
+    def filled(self, pos):
+        if not 0 <= pos[0] < self.height or not 0 <= pos[1] < self.width:
+            return True
+        return bool(self.rows[pos[0]] >> pos[1] & 1)
+
+    def row_masks(self):
+        """Bitmask per row, bit i is set if column i is filled"""
+        return self.rows
+
+    def row_mask(self, r_ind):
+        """Bitmask of one row, see row_masks()"""
+        return self.rows[r_ind]
+
+    # copy of the mutable state, for restore() (shape values fit in a byte)
+    def snapshot(self):
+        return self.rows[:], self.cells.astype(np.int8), self.tops[:], self.counts[:]
+
+    def restore(self, snap):
+        rows, cells, tops, counts = snap
+        self.rows = rows[:]
+        np.copyto(self.cells, cells)
+        self.tops = tops[:]
+        self.counts = counts[:]
+
+    def collides(self, piece_str, rotation, pos):
+        min_r, max_r, min_c, max_c = utils.EXTENTS[piece_str][rotation]
+        row, col = pos
+        if row + min_r < 0 or row + max_r >= self.height \
+                or col + min_c < 0 or col + max_c >= self.width:
+            return True
+
+        rows = self.rows
+        if col >= 0:
+            for r_off, mask in utils.PIECE_ROWS[piece_str][rotation]:
+                if rows[row + r_off] & (mask << col):
+                    return True
+        else:
+            for r_off, mask in utils.PIECE_ROWS[piece_str][rotation]:
+                if rows[row + r_off] & (mask >> -col):
+                    return True
+        return False
+
+    def place(self, piece_str, rotation, pos):
+        row, col = pos
+        for r_off, mask in utils.PIECE_ROWS[piece_str][rotation]:
+            self.rows[row + r_off] |= mask << col if col >= 0 else mask >> -col
+
+        val = utils.shape_values[piece_str]
+        for r_off, c_off in utils.OCCUPIED[piece_str][rotation]:
+            self.cells[row + r_off, col + c_off] = val
+
+        self._add_piece(piece_str, rotation, pos)
+
+    def clear_lines(self):
+        if self.width not in self.counts:
+            return 0
+        full = self._full_rows()
+
+        kept = [r_ind for r_ind in range(self.height) if r_ind not in full]
+        lcleared = len(full)
+        self.rows = [0] * lcleared + [self.rows[r_ind] for r_ind in kept]
+        self.cells[lcleared:] = self.cells[kept]
+        self.cells[:lcleared] = 0
+        self.counts = self._compact_counts(full)
+        self._update_tops()
+        return lcleared
+
+
+BACKENDS = {
+    'array': ArrayField,
+    'bitboard': BitField,
+}
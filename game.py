@@ -1,9 +1,17 @@
+import argparse
+
+from bot import BeamSearchBot
 from pygame_handler import GameHandler
 
 def main():
-    gh = GameHandler()
+    parser = argparse.ArgumentParser(description='Teetris')
+    parser.add_argument('--autoplay', action='store_true', help='let the bot play')
+    parser.add_argument('--budget', type=float, default=0.05, help='bot seconds per move')
+    args = parser.parse_args()
+
+    gh = GameHandler(autoplay=BeamSearchBot(args.budget) if args.autoplay else None)
 
     gh.play_game()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,143 @@
+"""Opt-in counters and timers for Board
+
+Instrumenting a board swaps its class for InstrumentedBoard, which wraps
+the engine methods with timers. Boards that aren't instrumented run the
+plain Board methods, so leaving this in costs nothing until it's used:
+
+    stats = instrument.enable(board)
+    ...
+    print(stats.to_json())
+    instrument.disable(board)
+"""
+from collections import defaultdict
+import json
+from time import perf_counter
+
+import utils
+from tetris import Board
+
+
+class Stats:
+    def __init__(self):
+        """Call counts and cumulative times (in seconds) by name
+
+        Times are inclusive, e.g. act/hd includes the lock_piece and
+        _clear_lines calls it makes
+        """
+        self.counts = defaultdict(int)
+        self.times = defaultdict(float)
+
+    def add(self, name, elapsed):
+        """Counts one call of name that took elapsed seconds"""
+        self.counts[name] += 1
+        self.times[name] += elapsed
+
+    def count(self, name, amount=1):
+        """Adds amount to the counter name, without timing anything"""
+        self.counts[name] += amount
+
+    def snapshot(self):
+        """Copy of the stats as {name: {'count': int, 'time': float}}
+
+        Counters that aren't timed have no 'time'
+        """
+        out = {}
+        for name, count in self.counts.items():
+            out[name] = {'count': count}
+            if name in self.times:
+                out[name]['time'] = self.times[name]
+        return out
+
+    def to_json(self, **kwargs):
+        """snapshot() as a JSON string, kwargs are passed on to json.dumps"""
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def reset(self):
+        self.counts.clear()
+        self.times.clear()
+
+
+class InstrumentedBoard(Board):
+    """Board recording its calls into self.stats (see enable())"""
+    __slots__ = ()
+
+    def act(self, action):
+        stats = self.stats
+        if action in utils.ROTATIONS:
+            # every kick tried is one validity check
+            checks = stats.counts['piece_valid']
+            start = perf_counter()
+            res = Board.act(self, action)
+            stats.add('act/' + action, perf_counter() - start)
+            stats.count('kicks/' + action, stats.counts['piece_valid'] - checks)
+            return res
+
+        start = perf_counter()
+        res = Board.act(self, action)
+        stats.add('act/' + action, perf_counter() - start)
+        return res
+
+    def shift(self, action, n=None):
+        start = perf_counter()
+        res = Board.shift(self, action, n)
+        self.stats.add('shift/' + action, perf_counter() - start)
+        return res
+
+    def soft_drop(self, n=None):
+        start = perf_counter()
+        res = Board.soft_drop(self, n)
+        self.stats.add('soft_drop', perf_counter() - start)
+        return res
+
+    def _piece_valid(self):
+        start = perf_counter()
+        res = Board._piece_valid(self)
+        self.stats.add('piece_valid', perf_counter() - start)
+        return res
+
+    def _generate_ghost_piece(self):
+        start = perf_counter()
+        Board._generate_ghost_piece(self)
+        self.stats.add('generate_ghost_piece', perf_counter() - start)
+
+    # covers both lock_piece() and hard drops
+    def _lock_piece(self):
+        start = perf_counter()
+        Board._lock_piece(self)
+        self.stats.add('lock_piece', perf_counter() - start)
+
+    def _clear_lines(self, mult):
+        start = perf_counter()
+        lcleared = Board._clear_lines(self, mult)
+        self.stats.add('clear_lines', perf_counter() - start)
+        self.stats.count('lines/{}'.format(lcleared))
+        return lcleared
+
+
+def enable(board, stats=None):
+    """Starts recording stats for board
+
+    Parameters
+    ----------
+    board : Board
+        Board to instrument
+    stats : Stats, optional
+        Stats to add to (e.g. shared by several boards), by default None
+        which starts a new one
+
+    Returns
+    -------
+    Stats
+        Stats the board records into
+    """
+    board.stats = stats if stats is not None else Stats()
+    board.__class__ = InstrumentedBoard
+    return board.stats
+
+
+def disable(board):
+    """Stops recording, returns the stats recorded so far"""
+    stats = board.stats
+    board.__class__ = Board
+    board.stats = None
+    return stats
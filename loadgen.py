@@ -0,0 +1,153 @@
+"""Load generator for server.py
+
+    python server.py &
+    python loadgen.py --clients 3000 --rate 0.2 --ramp 5 --duration 20
+
+Opens many connections at once, each pressing random keys at random
+times (rate per second on average, l, r and d are let go again soon
+after) and starting a new game whenever its game ends. Reports how long
+the server took to answer each command.
+"""
+import argparse
+import asyncio
+from collections import deque
+import json
+import random
+import sys
+
+# hard drops are a small part of the mix, so games last a while
+_ACTIONS = ('l', 'r', 'cw', 'ccw', 'd', 'hold', 'hd')
+_WEIGHTS = (6, 6, 4, 4, 2, 1, 1)
+# mean seconds l, r and d are held for, anything else is only pressed
+_HOLD_TIME = 0.1
+
+
+class LoadStats:
+    def __init__(self):
+        """Counts kept by every client of a load test"""
+        self.latencies = []
+        self.states = 0
+        self.games = 0
+        self.errors = 0
+
+    def to_dict(self, duration):
+        """Totals and latency percentiles (milliseconds) over duration seconds"""
+        lat = sorted(self.latencies)
+
+        def percentile(p):
+            return round(lat[min(int(len(lat) * p), len(lat) - 1)] * 1000, 3) if lat else None
+        return {
+            'commands': len(lat),
+            'commands_per_second': round(len(lat) / duration, 1),
+            'states': self.states,
+            'games': self.games,
+            'errors': self.errors,
+            'latency_ms': {'p50': percentile(0.5), 'p90': percentile(0.9),
+                           'p99': percentile(0.99), 'max': percentile(1.0)},
+        }
+
+
+# answers are in order, each one times the commands up to its seq
+async def _read_states(reader, pending, stats, loop):
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        stats.states += 1
+        # '{"seq":N,...' is all that's needed, no need to parse the rest
+        seq = int(line[7:line.index(b',', 7)])
+        now = loop.time()
+        while pending and pending[0][0] <= seq:
+            stats.latencies.append(now - pending.popleft()[1])
+
+
+async def _client(host, port, rate, delay, deadline, stats, rng):
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(delay)
+    while loop.time() < deadline:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), max(deadline - loop.time(), 0))
+        except (OSError, asyncio.TimeoutError):
+            stats.errors += 1
+            await asyncio.sleep(rng.random())
+            continue
+        pending = deque()
+        reading = asyncio.ensure_future(_read_states(reader, pending, stats, loop))
+        seq = 0
+        try:
+            while not reading.done() and loop.time() < deadline:
+                await asyncio.sleep(min(rng.expovariate(rate), deadline - loop.time()))
+                if loop.time() >= deadline:
+                    break
+                action = rng.choices(_ACTIONS, _WEIGHTS)[0]
+                commands = ['press']
+                if action in ('l', 'r', 'd'):
+                    commands.append('release')
+                for i, command in enumerate(commands):
+                    if i:
+                        await asyncio.sleep(rng.expovariate(1 / _HOLD_TIME))
+                    if reading.done():
+                        break
+                    seq += 1
+                    pending.append((seq, loop.time()))
+                    writer.write('{} {}\n'.format(command, action).encode())
+                    await writer.drain()
+            if reading.done():
+                stats.games += 1
+        except ConnectionError:
+            stats.errors += 1
+        finally:
+            writer.close()
+            reading.cancel()
+
+
+async def run(host='127.0.0.1', port=7777, clients=100, rate=5.0, duration=10.0, ramp=0.0, seed=None):
+    """Runs a load test against a running server
+
+    Parameters
+    ----------
+    clients : int, optional
+        Connections open at once, by default 100
+    rate : float, optional
+        Commands per second each connection sends on average, by default 5
+    duration : float, optional
+        Seconds to run for, by default 10
+    ramp : float, optional
+        Seconds over which the connections are opened, evenly spread, by
+        default 0 which opens them all at once
+    seed : int, optional
+        Seed of the random commands, by default None
+
+    Returns
+    -------
+    LoadStats
+    """
+    rng = random.Random(seed)
+    stats = LoadStats()
+    deadline = asyncio.get_running_loop().time() + duration
+    await asyncio.gather(*(_client(host, port, rate, ramp * i / clients, deadline, stats,
+                                   random.Random(rng.random()))
+                           for i in range(clients)))
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load tests server.py')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=5, help='commands per second per client')
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--ramp', type=float, default=0, help='seconds to open the connections over')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    stats = asyncio.run(run(args.host, args.port, args.clients, args.rate, args.duration,
+                            args.ramp, args.seed))
+    print(json.dumps(stats.to_dict(args.duration), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
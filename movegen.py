@@ -0,0 +1,471 @@
+import utils
+
+_CORNERS = ((0, 0), (0, 2), (2, 0), (2, 2))
+
+# positions are packed into one integer per rotation: bit (row + 2) * stride +
+#   col + 3 is the piece origin at (row, col), the padding covers origins
+#   whose 4x4 box pokes out of the field
+_PAD_ROWS = 2
+_PAD_COLS = 3
+
+# a rotation can kick the piece up to 2 cells, so a piece further than this
+#   from every filled cell (and the ceiling) moves the same way at any height
+_MARGIN = 2
+
+_DIRECTIONS = (utils.CLOCKWISE, utils.COUNTERCLOCKWISE)
+
+
+# SRS offsets, _KICKS[shape][rot][0 for cw, 1 for ccw] is a tuple of (row, col)
+_KICKS = dict((shape, [[tuple(utils.SRS_TABLE.get_rotation(shape, rot, direc))
+                        for direc in _DIRECTIONS]
+                       for rot in range(4)])
+              for shape in utils.SHAPES)
+
+
+def _shift(bits, offset):
+    return bits << offset if offset >= 0 else bits >> -offset
+
+
+class Placement:
+    def __init__(self, piece_str, rotation, pos, cells, tspin, hold, search=None):
+        """Final resting position of a piece and the inputs that reach it
+
+        Attributes
+        ----------
+        piece_str : str
+            Letter of the piece being placed
+        rotation : int
+            Rotation of the piece when it locks (S, Z, I and O can cover the
+            same cells in two rotations, the lowest one is used)
+        pos : list of int
+            Board position of the piece when it locks
+        cells : tuple
+            Sorted board indicies the piece occupies when it locks
+        tspin : bool
+            Whether locking here counts as a T-spin (see Board._tspun)
+        hold : bool
+            Whether the piece is the one swapped in by holding
+        """
+        self.piece_str = piece_str
+        self.rotation = rotation
+        self.pos = pos
+        self.cells = cells
+        self.tspin = tspin
+        self.hold = hold
+        self._search = search
+        self._path = None
+
+    @property
+    def path(self):
+        """Shortest list of Board.act actions placing the piece here, ending
+        with 'hd' (and starting with 'hold' if hold is True)
+
+        Found by a search on first access, most placements never need it
+        """
+        if self._path is None:
+            self._path = self._search.path(self.cells, self.tspin)
+            if self.hold:
+                self._path.insert(0, 'hold')
+            self._search = None
+        return self._path
+
+    def __repr__(self):
+        return 'Placement({}, rot={}, pos={}, tspin={})'.format(
+            self.piece_str, self.rotation, self.pos, self.tspin)
+
+
+class _Search:
+    def __init__(self, board, piece_str):
+        """Search over every (row, col, rotation) of one piece
+
+        Origins are kept as one bitmask per rotation, so a move is applied to
+        every origin at once with a few shifts and ANDs. The breadth first
+        search behind path() groups states by cost (number of inputs) and
+        whether the last move was a rotation
+        """
+        self.piece_str = piece_str
+        self.is_t = piece_str == 'T'
+        self.start = None
+        self.found = None
+        self.stride = stride = board.width + 2 * _PAD_COLS
+        self.size = (board.height + _PAD_ROWS + 4) * stride
+
+        full_row = (1 << board.width) - 1
+        empty = 0
+        for r_ind, row in enumerate(board._field.row_masks()):
+            empty |= (~row & full_row) << self._index(r_ind, 0)
+
+        # origins where each rotation fits, and where it can't fall any further
+        self.valid = []
+        self.rest = []
+        for rot in range(4):
+            fits = (1 << self.size) - 1
+            for r_off, c_off in utils.OCCUPIED[piece_str][rot]:
+                fits &= _shift(empty, -(r_off * stride + c_off))
+            self.valid.append(fits)
+            self.rest.append(fits & ~(fits >> stride))
+
+        # origins whose T-spin corners are at least 3 filled / out of bounds
+        self.spun = 0
+        if self.is_t:
+            a, b, c, d = [~_shift(empty, -(r_off * stride + c_off))
+                          for r_off, c_off in _CORNERS]
+            self.spun = (a & b & (c | d)) | (c & d & (a | b))
+
+        self.kicks = [[[r_off * stride + c_off for r_off, c_off in offsets]
+                       for offsets in kicks]
+                      for kicks in _KICKS[piece_str]]
+
+        # (kick, origins the kick moves into a fitting spot) per rotation and direction
+        self.kick_fits = [[[(kick, _shift(self.valid[(rot + direc) % 4], -kick))
+                            for kick in self.kicks[rot][d_i]]
+                           for d_i, direc in enumerate(_DIRECTIONS)]
+                          for rot in range(4)]
+        self._tops = list(board._field.tops)
+
+    def _index(self, row, col):
+        return (row + _PAD_ROWS) * self.stride + col + _PAD_COLS
+
+    def _pos(self, index):
+        row, col = divmod(index, self.stride)
+        return row - _PAD_ROWS, col - _PAD_COLS
+
+    # origins every origin in bits passes through while falling as far as it can
+    def _fill_down(self, bits, rot):
+        through = self.valid[rot]
+        step = self.stride
+        while step < self.size:
+            bits |= (bits << step) & through
+            through &= through << step
+            step <<= 1
+        return bits
+
+    @staticmethod
+    def _add(groups, cost, key, bits):
+        group = groups.get(cost)
+        if group is None:
+            group = groups[cost] = [0] * 8
+        group[key] |= bits
+
+    # adds every state one move (or one jump) away from group to groups
+    #   a group holds one bitmask per rotation * 2 + (last move was a rotation)
+    def _expand(self, groups, cost, group):
+        stride = self.stride
+        out = [0] * 8
+        for key, bits in enumerate(group):
+            if not bits:
+                continue
+            rot = key >> 1
+            free = bits & self.free
+            out[key & ~1] |= ((bits >> 1) | (bits << 1)
+                              | ((bits ^ free) << stride)) & self.valid[rot]
+
+            for d_i, direc in enumerate(_DIRECTIONS):
+                left = bits
+                rotated = 0
+                # each origin takes the first kick that fits
+                for kick, fits in self.kick_fits[rot][d_i]:
+                    hit = left & fits
+                    if hit:
+                        rotated |= hit << kick if kick >= 0 else hit >> -kick
+                        left ^= hit
+                        if not left:
+                            break
+                out[(rot + direc) % 4 * 2 + self.is_t] |= rotated
+
+            for contact, cols in self.jumps:
+                sel = free & cols
+                while sel:
+                    row = self._pos((sel & -sel).bit_length() - 1)[0]
+                    in_row = sel & (((1 << stride) - 1) << self._index(row, -_PAD_COLS))
+                    sel ^= in_row
+                    self._add(groups, cost + contact - row, key & ~1,
+                              in_row << (contact - row) * stride)
+
+        for key, bits in enumerate(out):
+            if bits:
+                self._add(groups, cost + 1, key, bits)
+
+    # origins reachable from bits by any number of l, r and d moves
+    def _slide(self, bits, rot):
+        valid = self.valid[rot]
+        stride = self.stride
+        while True:
+            prev = bits
+            for shift in (1, -1, stride):
+                through = valid
+                step = shift
+                while abs(step) < stride:
+                    bits |= _shift(bits, step) & through
+                    through &= _shift(through, step)
+                    step <<= 1
+                if shift == stride:
+                    bits = self._fill_down(bits, rot)
+            if bits == prev:
+                return bits
+
+    # origins reached by rotating from each origin in bits, per rotation
+    def _rotate(self, bits, rot):
+        out = []
+        for d_i, direc in enumerate(_DIRECTIONS):
+            left = bits
+            rotated = 0
+            # each origin takes the first kick that fits
+            for kick, fits in self.kick_fits[rot][d_i]:
+                hit = left & fits
+                if hit:
+                    rotated |= _shift(hit, kick)
+                    left ^= hit
+                    if not left:
+                        break
+            out.append(((rot + direc) % 4, rotated))
+        return out
+
+    def run(self, start, rotated, hold):
+        """Finds every reachable final position
+
+        Reachable origins are flood filled (sliding and falling first, then
+        rotating, until nothing new is reached) without tracking costs, the
+        shortest inputs are only searched for by path()
+        """
+        row, col, rot = start
+        bit = 1 << self._index(row, col)
+        if not self.valid[rot] & bit:
+            return []
+        self.start = (bit, rot, rotated and self.is_t)
+
+        reached = [0] * 4
+        reached[rot] = bit
+        changed = {rot}
+        while changed:
+            todo, changed = changed, set()
+            for rot in todo:
+                reached[rot] = self._slide(reached[rot], rot)
+            for rot in todo:
+                for n_rot, bits in self._rotate(reached[rot], rot):
+                    if bits & ~reached[n_rot]:
+                        reached[n_rot] |= bits
+                        changed.add(n_rot)
+
+        landings = []
+        for rot in range(4):
+            rest = self.rest[rot]
+            if not self.is_t:
+                landings.append((rot, False, reached[rot] & rest))
+                continue
+            # origins entered by a move, and by a rotation
+            moved = ((reached[rot] >> 1) | (reached[rot] << 1)
+                     | (reached[rot] << self.stride)) & self.valid[rot]
+            spun_in = 0
+            for p_rot in range(4):
+                for n_rot, bits in self._rotate(reached[p_rot], p_rot):
+                    if n_rot == rot:
+                        spun_in |= bits
+            if rot == self.start[1] and not self.start[2]:
+                moved |= self.start[0]
+            else:
+                spun_in |= self.start[0] if rot == self.start[1] else 0
+
+            spins = spun_in & rest & self.spun
+            plain = reached[rot] & rest & (moved | ~self.spun)
+            landings.append((rot, True, spins))
+            landings.append((rot, False, plain))
+
+        # different rotations can land on the same cells (S, Z, I, O), only
+        #   the first of those is kept
+        placements = []
+        seen = set()
+        for rot, spin, bits in landings:
+            for row, col, cells in self._landed(bits, rot):
+                if (cells, spin) in seen:
+                    continue
+                seen.add((cells, spin))
+                placements.append(Placement(self.piece_str, rot, [row, col], cells, spin,
+                                            hold, self))
+        return placements
+
+    # (row, col, sorted cells) of every origin in bits
+    def _landed(self, bits, rot):
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            row, col = self._pos(low.bit_length() - 1)
+            # OCCUPIED lists cells row by row, so these come out sorted
+            yield row, col, tuple((row + r_off, col + c_off)
+                                  for r_off, c_off in utils.OCCUPIED[self.piece_str][rot])
+
+    # breadth first search from the start, cheapest landings first
+    def _search(self):
+        # above the stack a piece can only touch the walls, so falling through
+        #   that open area is done in one jump to the first row where it could
+        #   touch something (the contact row of its column)
+        tops = self._tops
+        stride = self.stride
+        contacts = {}
+        for col in range(-_PAD_COLS, len(tops)):
+            near = min(tops[max(0, col - _MARGIN):col + 4 + _MARGIN])
+            contact = near - 3 - _MARGIN
+            contacts[contact] = contacts.get(contact, 0) | 1 << (col + _PAD_COLS)
+
+        self.free = 0
+        self.jumps = []
+        every_row = sum(1 << r_ind * stride for r_ind in range(self.size // stride))
+        for contact, cols in contacts.items():
+            for r_ind in range(_MARGIN, contact):
+                self.free |= cols << self._index(r_ind, -_PAD_COLS)
+            self.jumps.append((contact, cols * every_row))
+
+        bit, rot, rotated = self.start
+        pending = {}
+        self._add(pending, 0, rot * 2 + rotated, bit)
+        self.groups = {}
+        visited = [0] * 8
+        # origins known to fall onto an already found landing
+        dropped = [0] * 4
+        landed = [0] * 8
+        self.found = []
+        cost = 0
+        while pending:
+            group = pending.pop(cost, None)
+            if group is None:
+                cost += 1
+                continue
+            group = [bits & ~seen for bits, seen in zip(group, visited)]
+            self.groups[cost] = group
+
+            for key, bits in enumerate(group):
+                if not bits:
+                    continue
+                visited[key] |= bits
+                rot = key >> 1
+
+                spins = bits & self.rest[rot] & self.spun if key & 1 else 0
+                new = spins & ~landed[key]
+                if new:
+                    landed[key] |= new
+                    self.found.append((cost, rot, True, new))
+
+                bits &= ~spins & ~dropped[rot]
+                if bits:
+                    fill = self._fill_down(bits, rot)
+                    dropped[rot] |= fill
+                    new = fill & self.rest[rot] & ~landed[key & ~1]
+                    if new:
+                        landed[key & ~1] |= new
+                        self.found.append((cost, rot, False, new))
+
+            self._expand(pending, cost, group)
+            cost += 1
+
+    def path(self, cells, spin):
+        """Shortest actions that lock the piece on cells with a hard drop"""
+        if self.found is None:
+            self._search()
+        for cost, rot, f_spin, bits in self.found:
+            if f_spin != spin:
+                continue
+            for row, col, f_cells in self._landed(bits, rot):
+                if f_cells == cells:
+                    return self._path(cost, 1 << self._index(row, col), rot, spin)
+        raise ValueError('Cells {} are not reachable'.format(cells))
+
+    def _path(self, cost, bit, rot, spin):
+        """Actions that land on bit with a hard drop from a state costing cost"""
+        group = self.groups[cost]
+        if spin:
+            key = rot * 2 + 1
+        else:
+            # walks up from the landing to an origin the hard drop started from
+            plain = group[rot * 2]
+            spun = group[rot * 2 + 1] & ~(self.rest[rot] & self.spun)
+            while not (plain | spun) & bit:
+                bit >>= self.stride
+            key = rot * 2 if plain & bit else rot * 2 + 1
+
+        path = ['hd']
+        while cost:
+            cost, bit, key, moves = self._previous(cost, bit, key)
+            path.extend(moves)
+        path.reverse()
+        return path
+
+    # key of the state at bit in the group costing cost, None if it isn't there
+    def _reached(self, cost, bit, rot):
+        group = self.groups.get(cost)
+        if group is not None:
+            for key in (rot * 2, rot * 2 + 1):
+                if group[key] & bit:
+                    return key
+        return None
+
+    # a cheaper state that moves onto bit, and the moves it takes
+    def _previous(self, cost, bit, key):
+        rot = key >> 1
+
+        if not key & 1 or not self.is_t:
+            for action, prev in (('l', bit << 1), ('r', bit >> 1)):
+                p_key = self._reached(cost - 1, prev, rot)
+                if p_key is not None:
+                    return cost - 1, prev, p_key, [action]
+
+            prev = bit >> self.stride
+            if not prev & self.free:
+                p_key = self._reached(cost - 1, prev, rot)
+                if p_key is not None:
+                    return cost - 1, prev, p_key, ['d']
+            elif not bit & self.free:
+                # bit is a contact row, jumped to from the open area above
+                steps = 1
+                while prev & self.free:
+                    p_key = self._reached(cost - steps, prev, rot)
+                    if p_key is not None:
+                        return cost - steps, prev, p_key, ['d'] * steps
+                    prev >>= self.stride
+                    steps += 1
+
+        if key & 1 or not self.is_t:
+            for d_i, action in enumerate(('cw', 'ccw')):
+                p_rot = (rot - utils.ROTATION_TO_VAL[action]) % 4
+                kicks = self.kicks[p_rot][d_i]
+                for k_i, kick in enumerate(kicks):
+                    prev = _shift(bit, -kick)
+                    p_key = self._reached(cost - 1, prev, p_rot)
+                    if p_key is None:
+                        continue
+                    # an earlier kick that fits would have sent prev elsewhere
+                    if any(self.valid[rot] & _shift(prev, k) for k in kicks[:k_i]):
+                        continue
+                    return cost - 1, prev, p_key, [action]
+        raise RuntimeError('No predecessor found')
+
+
+def placements(board, hold=True):
+    """Finds every distinct final resting placement reachable by the current
+    piece (and the piece holding would bring in) using l, r, d, cw and ccw
+
+    Parameters
+    ----------
+    board : Board
+        Board to search, left unchanged
+    hold : bool, optional
+        Whether to include placements of the held / next piece, by default True
+
+    Returns
+    -------
+    list of Placement
+        One placement per distinct set of final cells and T-spin status
+    """
+    piece = board.cur_piece
+    out = _Search(board, piece.piece_str).run(
+        (piece.pos[0], piece.pos[1], piece.rotation),
+        piece.last_move in utils.ROTATIONS, False)
+
+    if hold and not board._hold_used:
+        if board.held_piece is not None:
+            swap = board.held_piece
+        else:
+            swap = board.next_pieces[0]
+        spawn = (6, 4 if swap == 'O' else 3, 0)
+        out.extend(_Search(board, swap).run(spawn, False, True))
+
+    return out
@@ -1,19 +1,46 @@
-from collections import defaultdict
+import os
 import sys
 from time import strftime
 import pygame
 from tetris import Board
-import utils
+import bot
+import clock
+import renderer
+import replay
+import simulation
 
 
 class GameHandler:
-    def __init__(self):
+    def __init__(self, replay_dir=None, fps=60, tick=1, autoplay=None):
+        """Plays games in a pygame window
+
+        Parameters
+        ----------
+        replay_dir : str, optional
+            Directory every game is recorded into (see replay), by default
+            None which records nothing
+        fps : float, optional
+            Frames drawn per second, by default 60
+        tick : int, optional
+            Milliseconds of game logic per simulation tick, by default 1
+        autoplay : bot.BeamSearchBot, optional
+            Bot playing the games instead of the keyboard, by default None
+        """
         pygame.display.set_caption('Teetris')
 
         self._modes = ['40L Sprint', 'Ultra']
         self._mode = None
 
         self.m_board = None
+        self._sim = None
+        self.fps = fps
+        self.tick = tick
+        self.autoplay = autoplay
+        self._bot_input = None
+
+        self.replay_dir = replay_dir
+        self._replay_file = None
+        self._recorder = None
 
         self.key_map = {
             pygame.K_LEFT: 'l',
@@ -32,10 +59,14 @@ class GameHandler:
         self.block_size = 30
 
         self.win = pygame.display.set_mode((self.win_width, self.win_height))
+        self._renderer = renderer.Renderer(
+            self.win, (self._top_left_x(), self._top_left_y()), self.block_size,
+            self.play_height // self.block_size, self.play_width // self.block_size)
 
     # generic functions
 
     def quit_game(self):
+        self._stop_recording()
         pygame.display.quit()
         pygame.quit()
         sys.exit()
@@ -50,8 +81,7 @@ class GameHandler:
         self.win.fill((0, 0, 0))
 
     def _draw_text(self, text, pos, align=(-1, -1), size=40, color=(255, 255, 255), bold=False):
-        font = pygame.font.SysFont('arial', size, bold=bold)
-        label = font.render(text, 1, color)
+        label = renderer.font(size, bold).render(text, 1, color)
 
         textpos = list(pos)
         if align[0] == 0:
@@ -66,6 +96,21 @@ class GameHandler:
 
         self.win.blit(label, textpos)
 
+    def _start_recording(self):
+        if self.replay_dir is None:
+            return
+        name = '{}.ttr'.format(strftime('%Y%m%d-%H%M%S'))
+        self._replay_file = open(os.path.join(self.replay_dir, name), 'wb')
+        self._recorder = replay.record(self.m_board, self._replay_file, self._sim.clock.now)
+
+    def _stop_recording(self):
+        if self._recorder is None:
+            return
+        self._recorder.close(self.m_board)
+        self._replay_file.close()
+        self._recorder = None
+        self._replay_file = None
+
     # menuing functions
 
     def _draw_selector(self, pos, size):
@@ -119,204 +164,43 @@ class GameHandler:
 
     # gameplay functions
 
-    def _draw_board(self):
-        tlx, tly = self._top_left_x(), self._top_left_y()
-
-        bstate = self.m_board.state()[(
-            self.m_board.height - self.m_board.playable_height)::]
-
-        for i in range(len(bstate)):
-            for j in range(len(bstate[0])):
-                pygame.draw.rect(self.win, utils.VAL_TO_COLOR[bstate[i][j]], (
-                    tlx + j * self.block_size, tly + i * self.block_size, self.block_size, self.block_size))
-
-        for pos in self.m_board.ghost_piece_occupied:
-            if pos[0] >= self.m_board.height - self.m_board.playable_height:
-                s = pygame.Surface((self.block_size, self.block_size))
-                s.set_alpha(128)
-                s.fill(
-                    utils.VAL_TO_COLOR[utils.shape_values[self.m_board.cur_piece.piece_str]])
-                self.win.blit(s, (tlx + pos[1] * self.block_size,
-                                  tly + (pos[0] - 6) * self.block_size))
-
-        pygame.draw.rect(self.win, (169, 169, 169), (tlx, tly,
-                                                     self.play_width, self.play_height), 5)
-
-    def _draw_piece_box(self, piece_str, tlx, tly):
-        color = utils.VAL_TO_COLOR[utils.shape_values[piece_str]]
-
-        for i, j in utils.OCCUPIED[piece_str][0]:
-            pygame.draw.rect(self.win, color, (tlx + j * self.block_size,
-                                                       tly + i * self.block_size, self.block_size, self.block_size))
-
-    def _draw_next_boxs(self):
-        tlx, tly = self._top_left_x() + self.play_width + 50, self._top_left_y() + 50
-        for i in range(5):
-            self._draw_piece_box(
-                self.m_board.next_pieces[i], tlx, tly + i * self.block_size * 3)
-
-    def _draw_hold_box(self):
-        held = self.m_board.held_piece
-        if held is None:
-            return
-        tlx, tly = self._top_left_x() - 150, self._top_left_y() + 50
-        self._draw_piece_box(held, tlx, tly)
-
-    def _draw_lines_cleared(self):
-        self._draw_text('Lines: {}'.format(self.m_board.lines_cleared),
-                        (self._top_left_x() + self.play_width/2, self._top_left_y()), (0, 1))
-
-    def _draw_score(self):
-        self._draw_text('Score: {}'.format(
-            self.m_board.score), (self._top_left_x(), self._top_left_y() + self.play_height))
-
-    def _draw_time(self):
-        time = (pygame.time.get_ticks() - self.start_time) / 1000
-        self._draw_text('Time: {:.2f}'.format(time),
-                        (self._top_left_x() - 200, self._top_left_y() + self.play_height - 80), size=30)
-
-    def _draw_grid(self):
-        tlx, tly = self._top_left_x(), self._top_left_y()
-        for i in range(self.m_board.playable_height):
-            pygame.draw.line(self.win, (50, 50, 50), (tlx, tly + i*30),
-                             (tlx + self.play_width, tly + i * 30))  # horizontal lines
-            for j in range(self.m_board.width):
-                pygame.draw.line(self.win, (50, 50, 50), (tlx + j * 30, tly),
-                                 (tlx + j * 30, tly + self.play_height))  # vertical lines
-
+    # draws what changed since the last frame, returns the areas to update
     def _draw_game(self):
-        self._clear_board()
-        self._draw_board()
-        self._draw_grid()
-        self._draw_score()
-        self._draw_time()
-        self._draw_lines_cleared()
-        self._draw_next_boxs()
-        self._draw_hold_box()
-        # implement more drawings for the game e.g. controls
-
-    def _get_das_keys(self):
-        keys = []
-        for key, command in self.key_map.items():
-            if command == 'l' or command == 'r':
-                keys.append(key)
-        return keys
-
-    def _sprint_finished(self):
-        if self.m_board.lines_cleared >= 40:
-            return True
-        return False
-
-    def _ultra_finished(self):
-        if pygame.time.get_ticks() - self.start_time > 120 * 1000:
-            return True
-        return False
+        return self._renderer.draw(self.m_board, self._sim.time)
 
-    def _game_loop(self):
+    # pygame events as simulation inputs, stops with -1 on escape and 0 on F4
+    def _poll_input(self):
+        events = []
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.quit_game()
 
-        finished = None
-        if self._mode == 0:
-            finished = self._sprint_finished
-        elif self._mode == 1:
-            finished = self._ultra_finished
-        else:
-            finished = lambda: False
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    return events, -1
+                elif event.key == pygame.K_F4:
+                    return events, 0
+                elif event.key in self.key_map and self._bot_input is None:
+                    events.append(('press', self.key_map[event.key]))
+            elif event.type == pygame.KEYUP and event.key in self.key_map \
+                    and self._bot_input is None:
+                events.append(('release', self.key_map[event.key]))
+
+        if self._bot_input is not None:
+            events.extend(self._bot_input.poll()[0])
+        return events, None
 
+    def _game_loop(self):
         self.m_board = Board()
+        self._sim = simulation.GameSimulation(self.m_board, self._mode, tick=self.tick)
+        self._start_recording()
+        self._renderer.reset()
+        if self.autoplay is not None:
+            self._bot_input = bot.BotInput(self.autoplay, self._sim)
 
-        running = True
-
-        clock = pygame.time.Clock()
-
-        gravity = 1
-
-        das = 80
-        arr = 1
-        soft_drop_rate = 1
-
-        held_time = defaultdict(lambda: 0)
-        arr_charge = defaultdict(lambda: 0)
-
-        das_keys = self._get_das_keys()
-
-        c_time = pygame.time.get_ticks()
-
-        self.start_time = c_time
-
-        until_falling = 1000
-        lock_delay = 500
-
-        while running:
-            if finished():
-                return 1
-
-            o_time = c_time
-            clock.tick()
-
-            c_time = pygame.time.get_ticks()
-            delta_t = c_time - o_time
-
-            # auto falling code
-            until_falling -= gravity * delta_t
-            if until_falling <= 0:
-                if self.m_board.act('d') == False:
-                    if lock_delay <= 0:
-                        self.m_board.lock_piece()
-                        until_falling = 1000
-
-                    lock_delay -= delta_t
-                else:
-                    # lock_delay = 500 # SEGA rotation lock delay
-                    until_falling = 1000
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.quit_game()
-
-                if event.type == pygame.KEYDOWN:
-                    try:
-                        if self.m_board.act(self.key_map[event.key]) == 1:
-                            if self.key_map[event.key] == 'hold':
-                                until_falling = 1000
-                            lock_delay = 500  # Infinity lock delay
-                    except KeyError:
-                        if event.key == pygame.K_ESCAPE:
-                            return -1
-                        elif event.key == pygame.K_F4:
-                            return 0
-                        continue  # skips this key event
-
-                    if event.key in das_keys:
-                        for key in das_keys:
-                            held_time[key] = -delta_t
-                            arr_charge[key] = -delta_t
-                    elif event.key == pygame.K_DOWN:
-                        arr_charge[event.key] = -delta_t
-
-            keys = pygame.key.get_pressed()
-
-            for key in das_keys:
-                if keys[key]:
-                    held_time[key] += delta_t
-
-                    if held_time[key] > das:
-                        arr_charge[key] += delta_t
-                        while arr_charge[key] > arr:
-                            arr_charge[key] -= arr
-                            self.m_board.act(self.key_map[key])
-
-            # should use a member variable/function that is the inverse mapping of key_map
-            if keys[pygame.K_DOWN]:
-                arr_charge[pygame.K_DOWN] += delta_t
-                while arr_charge[pygame.K_DOWN] > soft_drop_rate:
-                    arr_charge[pygame.K_DOWN] -= soft_drop_rate
-                    self.m_board.act('d')
-
-            self._draw_game()
-            pygame.display.update()
-
-            if self.m_board.dead:
-                return 1
+        loop = simulation.FixedTimestep(self.fps, clock.RealClock())
+        return loop.run(self._sim, self._poll_input,
+                        lambda: pygame.display.update(self._draw_game()))
 
     # postgame functions
 
@@ -354,5 +238,6 @@ class GameHandler:
             game_res = 0
             while game_res == 0:
                 game_res = self._game_loop()
+                self._stop_recording()
 
         self._end_loop()
\ No newline at end of file
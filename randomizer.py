@@ -0,0 +1,70 @@
+import copy
+import hashlib
+
+import numpy as np
+import utils
+
+
+def seed_int(seed):
+    """Seed as the non-negative int the generator takes
+
+    Other seeds (strings, negative numbers, tuples, ...) are hashed into
+    one, the same way in every process unlike hash()
+    """
+    if seed is None or isinstance(seed, int) and seed >= 0:
+        return seed
+    return int.from_bytes(hashlib.sha256(repr(seed).encode()).digest()[:8], 'little')
+
+
+class BagRandomizer:
+    def __init__(self, seed=None, block=64):
+        """7-bag piece generator with its own random state
+
+        Bags are shuffled a block at a time with one numpy call, next_bag()
+        then hands them out one by one
+
+        Parameters
+        ----------
+        seed : hashable, optional
+            Seed of the generator (see seed_int()), by default None which
+            seeds from the OS
+        block : int, optional
+            Number of bags shuffled at once, by default 64
+        """
+        self.block = block
+        self._rng = np.random.Generator(np.random.PCG64(seed_int(seed)))
+        self._fill(self._rng.bit_generator.state)
+
+    # shuffles the block of bags drawn from the random state, which is kept
+    #   so get_state() only needs it and an index to find its way back
+    # the generator is always set to the state first, so copies can share it
+    def _fill(self, state):
+        self._rng.bit_generator.state = state
+        self._block_state = state
+        order = self._rng.random((self.block, len(utils.SHAPES))).argsort(axis=1)
+        self._bags = np.array(utils.SHAPES)[order].tolist()
+        self._next_state = self._rng.bit_generator.state
+        self._index = 0
+
+    def next_bag(self):
+        """Returns the next bag, a shuffled list of the 7 piece letters"""
+        if self._index == self.block:
+            self._fill(self._next_state)
+        bag = self._bags[self._index]
+        self._index += 1
+        return bag
+
+    def get_state(self):
+        """Position of the generator, restored with set_state()"""
+        return self._block_state, self._index
+
+    def set_state(self, state):
+        """Moves the generator back (or forward) to a position from get_state()"""
+        block_state, index = state
+        if block_state is not self._block_state:
+            self._fill(block_state)
+        self._index = index
+
+    def copy(self):
+        """Independent randomizer at the same position"""
+        return copy.copy(self)
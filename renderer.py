@@ -0,0 +1,202 @@
+import numpy as np
+import pygame
+import utils
+
+_BLACK = (0, 0, 0)
+_WHITE = (255, 255, 255)
+_GRID = (50, 50, 50)
+_BORDER = (169, 169, 169)
+
+# ghost tiles are keyed by shape value + _GHOST
+_GHOST = 8
+
+_fonts = {}
+
+
+def font(size, bold=False):
+    """pygame.font.SysFont, looked up once per size and weight"""
+    key = (size, bold)
+    if key not in _fonts:
+        _fonts[key] = pygame.font.SysFont('arial', size, bold=bold)
+    return _fonts[key]
+
+
+# top left corner of text of the given size placed at pos with align (see GameHandler._draw_text)
+def _text_pos(size, pos, align):
+    textpos = list(pos)
+    for axis in range(2):
+        if align[axis] == 0:
+            textpos[axis] -= size[axis] / 2
+        elif align[axis] == 1:
+            textpos[axis] -= size[axis]
+    return textpos
+
+
+class Renderer:
+    def __init__(self, win, top_left, block_size, rows, cols):
+        """Draws a game onto win, only redrawing what changed since the last frame
+
+        Cells are blitted from tiles rendered once (grid lines included),
+        and the HUD texts, preview and hold boxes are only redrawn when
+        their contents change
+
+        Parameters
+        ----------
+        win : pygame.Surface
+            Display surface
+        top_left : tuple of float
+            Top left corner of the playing field on win
+        block_size : int
+            Size of a cell in pixels
+        rows, cols : int
+            Number of visible rows and columns of the field
+        """
+        self.win = win
+        self.top_left = top_left
+        self.block_size = block_size
+        self.rows = rows
+        self.cols = cols
+        self.play_rect = pygame.Rect(top_left[0], top_left[1], cols * block_size, rows * block_size)
+
+        self._tiles = {}
+        self._box_tiles = {}
+        for val, color in utils.VAL_TO_COLOR.items():
+            self._tiles[val] = self._tile(color)
+            box_tile = pygame.Surface((block_size, block_size))
+            box_tile.fill(color)
+            self._box_tiles[val] = box_tile
+            if val:
+                ghost = pygame.Surface((block_size, block_size))
+                ghost.set_alpha(128)
+                ghost.fill(color)
+                self._tiles[val + _GHOST] = self._tile(_BLACK, ghost)
+
+        self.reset()
+
+    # cell with its top and left grid lines, with overlay blitted on top of the colour
+    def _tile(self, color, overlay=None):
+        tile = pygame.Surface((self.block_size, self.block_size))
+        tile.fill(color)
+        if overlay is not None:
+            tile.blit(overlay, (0, 0))
+        pygame.draw.line(tile, _GRID, (0, 0), (self.block_size, 0))
+        pygame.draw.line(tile, _GRID, (0, 0), (0, self.block_size))
+        return tile
+
+    def reset(self):
+        """Makes the next draw() redraw the whole window"""
+        self._cells = None
+        self._drawn = {}
+
+    def _draw_cells(self, cells):
+        tlx, tly = self.top_left
+        size = self.block_size
+        if self._cells is None:
+            changed = np.argwhere(np.ones_like(cells, dtype=bool))
+        else:
+            changed = np.argwhere(cells != self._cells)
+        self._cells = cells
+
+        rects = []
+        for r_ind, c_ind in changed.tolist():
+            rects.append(self.win.blit(self._tiles[cells[r_ind, c_ind]],
+                                       (tlx + c_ind * size, tly + r_ind * size)))
+
+        # the border overlaps the outer cells and the grid goes over the
+        #   border, so both are drawn again over them
+        inner = self.play_rect.inflate(-10, -10)
+        for rect in rects:
+            if not inner.contains(rect):
+                self.win.set_clip(rect)
+                pygame.draw.rect(self.win, _BORDER, self.play_rect, 5)
+                pygame.draw.line(self.win, _GRID, rect.topleft, rect.topright)
+                pygame.draw.line(self.win, _GRID, rect.topleft, rect.bottomleft)
+        self.win.set_clip(None)
+        return rects
+
+    # full grid, its lines end one pixel past the field
+    def _draw_grid(self):
+        tlx, tly = self.top_left
+        width, height = self.play_rect.size
+        for i in range(self.rows):
+            pygame.draw.line(self.win, _GRID, (tlx, tly + i * self.block_size),
+                             (tlx + width, tly + i * self.block_size))
+        for j in range(self.cols):
+            pygame.draw.line(self.win, _GRID, (tlx + j * self.block_size, tly),
+                             (tlx + j * self.block_size, tly + height))
+
+    # redraws the area covered by key when value changes, draw returns the rects it drew to
+    def _draw_changed(self, key, value, draw):
+        prev = self._drawn.get(key)
+        if prev is not None and prev[0] == value:
+            return []
+        rects = []
+        if prev is not None:
+            for rect in prev[1]:
+                rects.append(self.win.fill(_BLACK, rect))
+        drawn = draw()
+        self._drawn[key] = (value, drawn)
+        return rects + drawn
+
+    def _text(self, text, pos, align=(-1, -1), size=40):
+        label = font(size).render(text, 1, _WHITE)
+        return [self.win.blit(label, _text_pos(label.get_size(), pos, align))]
+
+    def _piece_box(self, piece_str, tlx, tly):
+        tile = self._box_tiles[utils.shape_values[piece_str]]
+        return [self.win.blit(tile, (tlx + j * self.block_size, tly + i * self.block_size))
+                for i, j in utils.OCCUPIED[piece_str][0]]
+
+    def _next_boxes(self, pieces):
+        tlx = self.top_left[0] + self.play_rect.width + 50
+        tly = self.top_left[1] + 50
+        rects = []
+        for i, piece_str in enumerate(pieces):
+            rects.extend(self._piece_box(piece_str, tlx, tly + i * self.block_size * 3))
+        return rects
+
+    def _hold_box(self, held):
+        if held is None:
+            return []
+        return self._piece_box(held, self.top_left[0] - 150, self.top_left[1] + 50)
+
+    def draw(self, board, elapsed):
+        """Draws the frame of board, elapsed milliseconds into the game
+
+        Returns
+        -------
+        list of pygame.Rect
+            Areas of win that changed, to pass to pygame.display.update()
+        """
+        full = self._cells is None
+        if full:
+            self.win.fill(_BLACK)
+
+        hidden = board.height - board.playable_height
+        cells = board.state()[hidden:]
+        for r_ind, c_ind in board.ghost_piece_occupied:
+            if r_ind >= hidden and cells[r_ind - hidden, c_ind] == 0:
+                cells[r_ind - hidden, c_ind] = utils.shape_values[board.cur_piece.piece_str] + _GHOST
+        rects = self._draw_cells(cells)
+        if full:
+            self._draw_grid()
+
+        tlx, tly = self.top_left
+        width, height = self.play_rect.size
+        score = 'Score: {}'.format(board.score)
+        rects += self._draw_changed('score', score, lambda: self._text(score, (tlx, tly + height)))
+        time = 'Time: {:.2f}'.format(elapsed / 1000)
+        rects += self._draw_changed('time', time, lambda: self._text(
+            time, (tlx - 200, tly + height - 80), size=30))
+        lines = 'Lines: {}'.format(board.lines_cleared)
+        rects += self._draw_changed('lines', lines, lambda: self._text(
+            lines, (tlx + width / 2, tly), (0, 1)))
+
+        pieces = tuple(board.next_pieces)[:5]
+        rects += self._draw_changed('next', pieces, lambda: self._next_boxes(pieces))
+        rects += self._draw_changed('hold', board.held_piece,
+                                    lambda: self._hold_box(board.held_piece))
+
+        if full:
+            return [self.win.get_rect()]
+        return rects
@@ -0,0 +1,240 @@
+import time
+
+import utils
+from tetris import Board
+
+# file layout: MAGIC, VERSION, varint seed, then records of varint dt
+#   (milliseconds since the previous record) and one code byte. The codes
+#   are utils.ACTIONS plus LOCK (a lock_piece() call from outside act(),
+#   e.g. lock delay running out) and END, which is followed by the varint
+#   final score and lines cleared instead of another record
+MAGIC = b'TTRP'
+VERSION = 1
+
+LOCK = 9
+END = 10
+
+_CODE_TO_ACTION = dict((val, key) for key, val in utils.ACTIONS.items())
+_CODE_TO_ACTION[LOCK] = 'lock'
+
+
+def _write_varint(out, val):
+    while val >= 0x80:
+        out.append(val & 0x7f | 0x80)
+        val >>= 7
+    out.append(val)
+
+
+# returns (value, position after it), or None if data ends first
+def _read_varint(data, pos):
+    val = 0
+    shift = 0
+    while pos < len(data):
+        byte = data[pos]
+        pos += 1
+        val |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return val, pos
+        shift += 7
+    return None
+
+
+class ReplayWriter:
+    def __init__(self, stream, seed, clock=None):
+        """Records the actions applied to a board into a binary stream
+
+        Records are buffered and written out each time a piece locks, so a
+        reader can follow the file while the game is still running
+
+        Parameters
+        ----------
+        stream : file object
+            Binary stream to append to, left open by close()
+        seed : int
+            Seed of the board being recorded
+        clock : callable, optional
+            Returns the current time in milliseconds, by default a monotonic clock
+        """
+        self._stream = stream
+        self._clock = clock if clock is not None else lambda: int(time.monotonic() * 1000)
+        self._last = self._clock()
+        self._buf = bytearray(MAGIC)
+        self._buf.append(VERSION)
+        _write_varint(self._buf, seed)
+        self.flush()
+
+    def record(self, action):
+        """Adds an action name (a key of utils.ACTIONS, or 'lock')"""
+        now = self._clock()
+        _write_varint(self._buf, max(now - self._last, 0))
+        self._last = now
+        if action == 'lock':
+            self._buf.append(LOCK)
+            self.flush()
+        else:
+            code = utils.ACTIONS[action]
+            self._buf.append(code)
+            if code == utils.ACTIONS['hd']:
+                self.flush()
+
+    def flush(self):
+        """Writes out the buffered records"""
+        self._stream.write(self._buf)
+        self._stream.flush()
+        self._buf.clear()
+
+    def close(self, board):
+        """Ends the replay with the final score and lines cleared of board"""
+        _write_varint(self._buf, 0)
+        self._buf.append(END)
+        _write_varint(self._buf, board.score)
+        _write_varint(self._buf, board.lines_cleared)
+        self.flush()
+
+
+def record(board, stream, clock=None):
+    """Starts recording every action applied to board into stream
+
+    Returns
+    -------
+    ReplayWriter
+        Writer attached to board, call its close() when the game ends
+    """
+    writer = ReplayWriter(stream, board.rseed, clock)
+    board.recorder = writer
+    return writer
+
+
+class ReplayReader:
+    def __init__(self, stream):
+        """Reads a replay, possibly while it is still being written
+
+        Parameters
+        ----------
+        stream : file object
+            Binary stream positioned at the start of the replay
+
+        Attributes
+        ----------
+        seed : int
+            Seed of the recorded board
+        final : tuple of int
+            (score, lines cleared) stored at the end of the replay, None
+            until the end has been read
+        """
+        self._stream = stream
+        self._data = b''
+        self._pos = 0
+        self.final = None
+
+        header = len(MAGIC) + 1
+        while True:
+            self._read_more()
+            if len(self._data) >= header:
+                found = _read_varint(self._data, header)
+                if found is not None:
+                    break
+            if not self._more:
+                raise ValueError('Replay header is incomplete')
+        if self._data[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a replay file')
+        if self._data[len(MAGIC)] != VERSION:
+            raise ValueError('Unsupported replay version {}'.format(self._data[len(MAGIC)]))
+        self.seed, self._pos = found
+
+    def _read_more(self, size=1 << 16):
+        chunk = self._stream.read(size)
+        self._more = bool(chunk)
+        if chunk:
+            self._data = self._data[self._pos:] + chunk
+            self._pos = 0
+
+    def records(self):
+        """Yields (dt, code) for every complete record available so far
+
+        Stops at the end of the replay or at the end of the data written
+        so far, in which case calling again later picks up from there
+        """
+        while self.final is None:
+            data = self._data
+            pos = self._pos
+            size = len(data)
+            while pos < size:
+                byte = data[pos]
+                if byte < 0x80 and pos + 1 < size:
+                    # single byte delay, by far the most common
+                    dt = byte
+                    code = data[pos + 1]
+                    nxt = pos + 2
+                else:
+                    found = _read_varint(data, pos)
+                    if found is None or found[1] >= size:
+                        break
+                    dt, nxt = found
+                    code = data[nxt]
+                    nxt += 1
+
+                if code == END:
+                    score = _read_varint(data, nxt)
+                    lines = score and _read_varint(data, score[1])
+                    if not lines:
+                        break
+                    self.final = score[0], lines[0]
+                    pos = lines[1]
+                    break
+                pos = nxt
+                yield dt, code
+            self._pos = pos
+
+            if self.final is None:
+                self._read_more()
+                if not self._more:
+                    return
+
+
+def replay(stream, backend='bitboard'):
+    """Plays a replay back on a new board
+
+    Returns
+    -------
+    Board
+        Board in the state the replay leaves it in
+    ReplayReader
+        Reader of the replay, final is None if the replay has no end yet
+    """
+    reader = ReplayReader(stream)
+    board = Board(rseed=reader.seed, backend=backend)
+    act = board.act
+    lock = board.lock_piece
+    actions = _CODE_TO_ACTION
+    for _, code in reader.records():
+        if code == LOCK:
+            lock()
+            continue
+        action = actions.get(code)
+        if action is None:
+            raise ValueError('Invalid action code {}'.format(code))
+        act(action)
+    return board, reader
+
+
+def verify(stream, backend='bitboard'):
+    """Replays a finished replay headless and checks its final score and lines
+
+    Raises
+    ------
+    ValueError
+        If the replay has no end or the replayed game doesn't match it
+
+    Returns
+    -------
+    Board
+        Board at the end of the replay
+    """
+    board, reader = replay(stream, backend)
+    if reader.final is None:
+        raise ValueError('Replay has no end record')
+    if (board.score, board.lines_cleared) != reader.final:
+        raise ValueError('Replay ends with score {} and {} lines, expected {} and {}'.format(
+            board.score, board.lines_cleared, *reader.final))
+    return board
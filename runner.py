@@ -0,0 +1,276 @@
+"""Plays many seeded games across a process pool
+
+    python runner.py --games 10000 --out results.jsonl
+
+Workers are sent seeds in chunks and send back one result per game,
+which are folded into the summary as they arrive. Each result is also
+appended to the output file, so a killed run picks up where it left off
+when started again with the same arguments.
+"""
+import argparse
+from collections import Counter
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+
+import utils
+from tetris import Board
+
+# filled in by _init_worker() in each worker process
+_policy = None
+_config = None
+
+
+def _random_policy(seed):
+    rng = random.Random(seed)
+
+    def moves(board):
+        actions = []
+        if rng.random() < 0.1:
+            actions.append('hold')
+        for _ in range(rng.randint(0, 3)):
+            actions.append(rng.choice(('cw', 'ccw')))
+        for _ in range(rng.randint(0, 5)):
+            actions.append(rng.choice(('l', 'r')))
+        actions.append('hd')
+        return actions
+    return moves
+
+
+def _beam_policy(seed):
+    placement_bot = _policy
+
+    def moves(board):
+        placement = placement_bot.choose(board)
+        return placement.path if placement is not None else ['hd']
+    return moves
+
+
+# name: function of the game seed returning a function of the board
+#   returning the actions playing its next piece (ending with 'hd')
+POLICIES = {
+    'random': _random_policy,
+    'beam': _beam_policy,
+}
+
+
+def play_game(seed, policy, pieces=None, backend='bitboard'):
+    """Plays one game
+
+    Parameters
+    ----------
+    seed : int
+        Seed of the board (and of the policy, if it's random)
+    policy : callable
+        Returns the actions playing the board's next piece, ending with 'hd'
+    pieces : int, optional
+        Most pieces to place, by default None which plays until the game is lost
+
+    Returns
+    -------
+    dict
+        seed, score, lines, pieces, tspins and death: 'lock_out' (a
+        piece locked entirely above the visible rows), 'block_out' (a new
+        piece spawned blocked) or None if the game wasn't lost
+    """
+    board = Board(rseed=seed, backend=backend)
+    hidden = board.height - board.playable_height
+    placed = 0
+    tspins = 0
+    death = None
+    while not board.dead and (pieces is None or placed < pieces):
+        for action in policy(board):
+            if action == 'hd':
+                # what _lock_piece will see once the piece has fallen
+                piece = board.cur_piece
+                if board.drop_distance() == 0 and board._tspun():
+                    tspins += 1
+                bottom = piece.pos[0] + board.drop_distance() \
+                    + utils.EXTENTS[piece.piece_str][piece.rotation][1]
+                board.act('hd')
+                if board.dead:
+                    death = 'lock_out' if bottom < hidden else 'block_out'
+                break
+            board.act(action)
+            if board.dead:
+                # holding brought in a piece with no room to spawn
+                death = 'block_out'
+                break
+        placed += 1
+    return {
+        'seed': seed,
+        'score': board.score,
+        'lines': board.lines_cleared,
+        'pieces': placed,
+        'tspins': tspins,
+        'death': death,
+    }
+
+
+class Summary:
+    def __init__(self):
+        """Running totals of game results, see add()"""
+        self.games = 0
+        self.sums = Counter()
+        self.squares = Counter()
+        self.best = None
+        self.deaths = Counter()
+
+    def add(self, result):
+        """Folds in one play_game() result"""
+        self.games += 1
+        for key in ('score', 'lines', 'pieces', 'tspins'):
+            self.sums[key] += result[key]
+            self.squares[key] += result[key] ** 2
+        if self.best is None or result['score'] > self.best['score']:
+            self.best = result
+        self.deaths[result['death'] or 'none'] += 1
+
+    def to_dict(self):
+        """Mean and standard deviation of each total, plus death causes and the best game"""
+        out = {'games': self.games, 'deaths': dict(self.deaths), 'best': self.best}
+        for key in ('score', 'lines', 'pieces', 'tspins'):
+            mean = self.sums[key] / self.games if self.games else 0.0
+            var = self.squares[key] / self.games - mean ** 2 if self.games else 0.0
+            out[key] = {'mean': mean, 'std': math.sqrt(max(var, 0.0)), 'total': self.sums[key]}
+        return out
+
+
+def _init_worker(config):
+    global _policy, _config
+    _config = config
+    if config['policy'] == 'beam':
+        import bot
+        _policy = bot.BeamSearchBot(config['budget'], config['width'], config['depth'])
+
+
+def _run_chunk(seeds):
+    policy = POLICIES[_config['policy']]
+    return [play_game(seed, policy(seed), _config['pieces'], _config['backend'])
+            for seed in seeds]
+
+
+# config and results already in path, truncating a last line cut off by a kill
+def _load_checkpoint(path):
+    if not os.path.exists(path):
+        return None, []
+    config = None
+    results = []
+    good = 0
+    with open(path, 'rb') as in_file:
+        for line in in_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            if config is None:
+                config = record['config']
+            else:
+                results.append(record)
+            good += len(line)
+    with open(path, 'rb+') as out_file:
+        out_file.truncate(good)
+    return config, results
+
+
+def run(config, seeds, out_path=None, workers=None, chunk=16, progress=None):
+    """Plays every seed across a process pool
+
+    Parameters
+    ----------
+    config : dict
+        policy (a key of POLICIES), pieces, backend and for 'beam' budget,
+        width and depth
+    seeds : list of int
+        Seeds of the games to play
+    out_path : str, optional
+        JSON lines file results are appended to, and read back from to skip
+        seeds already played by an earlier run with the same config
+    workers : int, optional
+        Worker processes, by default one per core
+    chunk : int, optional
+        Seeds sent to a worker at a time, by default 16
+    progress : callable, optional
+        Called with the Summary after each chunk arrives
+
+    Returns
+    -------
+    Summary
+        Results of every seed, earlier runs included
+    """
+    summary = Summary()
+    done = set()
+    out_file = None
+    if out_path is not None:
+        old_config, results = _load_checkpoint(out_path)
+        if old_config is not None and old_config != config:
+            raise ValueError('{} was written with a different config: {}'.format(out_path, old_config))
+        wanted = set(seeds)
+        for result in results:
+            if result['seed'] in wanted and result['seed'] not in done:
+                done.add(result['seed'])
+                summary.add(result)
+        out_file = open(out_path, 'a')
+        if old_config is None:
+            out_file.write(json.dumps({'config': config}) + '\n')
+            out_file.flush()
+
+    todo = [seed for seed in seeds if seed not in done]
+    chunks = [todo[i:i + chunk] for i in range(0, len(todo), chunk)]
+    try:
+        with multiprocessing.Pool(workers, _init_worker, (config,)) as pool:
+            for results in pool.imap_unordered(_run_chunk, chunks):
+                for result in results:
+                    summary.add(result)
+                    if out_file is not None:
+                        out_file.write(json.dumps(result) + '\n')
+                if out_file is not None:
+                    out_file.flush()
+                if progress is not None:
+                    progress(summary)
+    finally:
+        if out_file is not None:
+            out_file.close()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--start', type=int, default=0, help='first seed')
+    parser.add_argument('--policy', choices=list(POLICIES), default='random')
+    parser.add_argument('--pieces', type=int, default=None, help='most pieces per game')
+    parser.add_argument('--backend', default='bitboard')
+    parser.add_argument('--budget', type=float, default=float('inf'),
+                        help='beam seconds per move (default: no limit, so results repeat)')
+    parser.add_argument('--width', type=int, default=8, help='beam width')
+    parser.add_argument('--depth', type=int, default=2, help='beam depth')
+    parser.add_argument('--workers', type=int, default=None, help='default: one per core')
+    parser.add_argument('--chunk', type=int, default=16, help='seeds per task')
+    parser.add_argument('--out', help='JSON lines checkpoint of the results')
+    args = parser.parse_args(argv)
+
+    config = {'policy': args.policy, 'pieces': args.pieces, 'backend': args.backend}
+    if args.policy == 'beam':
+        config.update(budget=args.budget, width=args.width, depth=args.depth)
+
+    def progress(summary):
+        sys.stderr.write('\r{} / {} games'.format(summary.games, args.games))
+
+    try:
+        summary = run(config, range(args.start, args.start + args.games), args.out,
+                      args.workers, args.chunk, progress)
+    except ValueError as e:
+        parser.error(str(e))
+    sys.stderr.write('\n')
+    print(json.dumps(summary.to_dict(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
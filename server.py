@@ -0,0 +1,295 @@
+"""Game server playing many sessions in one asyncio event loop
+
+    python server.py --port 7777
+    python loadgen.py --port 7777 --clients 3000 --rate 0.2 --ramp 5
+
+Each TCP connection gets its own Board and GameSimulation. The protocol
+is line based, one command per line from the client:
+
+    press <action>      same as a key going down (see GameSimulation.press),
+                        action being one of utils.PLAYER_ACTIONS
+    release <action>    the key going back up
+    quit                ends the session
+
+and one JSON object per line from the server, the game state:
+
+    {"seq": 3, "time": 1234, "piece": ["T", 0, 4, 3], "hold": null,
+     "next": "IOZSJ", "score": 0, "lines": 0, "dead": false,
+     "field": ["0000000000", ...]}
+
+Commands are played on the next tick that is due (like FixedTimestep,
+so game time never runs ahead of the clock) and answered with the state
+after it, seq being the number of commands handled up to the last one
+played. Invalid commands are answered right away with an {"seq": n,
+"error": ...} line, so clients can time every command. field, one string
+of shape values per row, is only sent when it changed since the last
+state. States are also pushed whenever gravity, lock delay or
+auto-shift change the game, unless the client isn't reading them fast
+enough. The connection is closed once the game ends.
+
+Sessions aren't stepped every frame: each one sleeps until the next
+tick in which something can happen to it without input.
+"""
+import argparse
+import asyncio
+from itertools import islice
+import json
+import sys
+
+import simulation
+import utils
+from tetris import Board
+
+_MODES = {'sprint': simulation.SPRINT, 'ultra': simulation.ULTRA, None: None}
+
+# pushed states are dropped while more than this many bytes wait to be sent
+_PUSH_LIMIT = 1 << 16
+# connections waiting to be accepted, thousands of clients can arrive at once
+_BACKLOG = 1024
+
+
+class Session:
+    def __init__(self, sim, writer, fps=60):
+        """One connected game, its timers run by the event loop
+
+        Parameters
+        ----------
+        sim : GameSimulation
+            Game being played
+        writer : asyncio.StreamWriter
+            Where the states are sent
+        fps : float, optional
+            Most timer wakeups per second, by default 60
+
+        Attributes
+        ----------
+        seq : int
+            Number of commands handled
+        applied : int
+            seq of the last command played
+        """
+        self.sim = sim
+        self.writer = writer
+        self.frame = 1 / fps
+        self.seq = 0
+        self.applied = 0
+        self._pending = []
+        self._pending_seq = 0
+        self._loop = asyncio.get_running_loop()
+        self._start = self._loop.time()
+        self._timer = None
+        self._sent_piece = None
+        self._sent_field = None
+        self._schedule()
+
+    # plays the ticks due by now, the queued commands landing on the latest of them
+    #   returns whether commands were played
+    def _catch_up(self):
+        sim = self.sim
+        due = int((self._loop.time() - self._start) * 1000 // sim.tick) - sim.ticks
+        if due <= 0:
+            return False
+        sim.advance(due - 1)
+        if not self._pending or sim.finished:
+            sim.advance(1)
+            return False
+        sim.step(self._pending)
+        self._pending = []
+        self.applied = self._pending_seq
+        return True
+
+    # wakes up on the next tick that can change the game (at most once a frame)
+    def _schedule(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        sim = self.sim
+        if sim.finished:
+            return
+        idle = 0 if self._pending else sim._idle_ticks(1 << 30)
+        wake = self._start + (sim.ticks + idle + 1) * sim.tick / 1000
+        self._timer = self._loop.call_at(max(wake, self._loop.time() + self.frame), self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        if self._catch_up():
+            # answers the commands queued since the last tick
+            self.send_state()
+        elif self.writer.transport.get_write_buffer_size() < _PUSH_LIMIT:
+            self.send_state(changed_only=True)
+        if self.sim.finished:
+            self.close()
+        else:
+            self._schedule()
+
+    def handle(self, line):
+        """Queues one command line, answered with the state once it's played
+
+        Returns
+        -------
+        bool
+            False if the session should end
+        """
+        self.seq += 1
+        words = line.split()
+        if words == ['quit']:
+            return False
+        if len(words) != 2 or words[0] not in ('press', 'release') \
+                or words[1] not in utils.PLAYER_ACTIONS:
+            self.send({'seq': self.seq, 'error': 'Invalid command \'{}\''.format(line.strip())})
+            return True
+
+        sim = self.sim
+        self._pending.append(tuple(words))
+        self._pending_seq = self.seq
+        if self._catch_up():
+            self.send_state()
+        if sim.finished:
+            return False
+        self._schedule()
+        return True
+
+    def state(self, changed_only=False):
+        """The game as sent to the client, None if changed_only and nothing changed"""
+        board = self.sim.board
+        piece = board.cur_piece
+        piece_key = (piece.piece_str, piece.rotation, piece.pos[0], piece.pos[1], board.held_piece)
+        field_changed = board._field_hash != self._sent_field
+        if changed_only and not field_changed and piece_key == self._sent_piece \
+                and not self.sim.finished:
+            return None
+        self._sent_piece = piece_key
+
+        out = {
+            'seq': self.applied,
+            'time': self.sim.time,
+            'piece': list(piece_key[:4]),
+            'hold': board.held_piece,
+            'next': ''.join(islice(board.next_pieces, 5)),
+            'score': board.score,
+            'lines': board.lines_cleared,
+            'dead': board.dead,
+        }
+        if field_changed:
+            self._sent_field = board._field_hash
+            out['field'] = [''.join(map(str, row)) for row in board._board.tolist()]
+        return out
+
+    def send_state(self, changed_only=False):
+        """Sends state(), if there's one to send"""
+        state = self.state(changed_only)
+        if state is not None:
+            self.send(state)
+
+    def send(self, message):
+        """Sends a message as one JSON line"""
+        if not self.writer.is_closing():
+            self.writer.write(json.dumps(message, separators=(',', ':')).encode() + b'\n')
+
+    def close(self):
+        """Stops the timers and closes the connection"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.writer.is_closing():
+            self.writer.close()
+
+
+class GameServer:
+    def __init__(self, backend='bitboard', mode=None, fps=60, **sim_args):
+        """Accepts connections, starting a game for each
+
+        Parameters
+        ----------
+        backend : str, optional
+            Field backend of the boards, by default 'bitboard'
+        mode : int, optional
+            simulation.SPRINT, simulation.ULTRA or None, by default None
+        fps : float, optional
+            Most timer wakeups per second of a session, by default 60
+        **sim_args
+            Passed on to each GameSimulation (tick, gravity, das, ...)
+
+        Attributes
+        ----------
+        sessions : set of Session
+            Games being played
+        """
+        self.backend = backend
+        self.mode = mode
+        self.fps = fps
+        self.sim_args = sim_args
+        self.sessions = set()
+        self._handlers = set()
+
+    async def _serve_client(self, reader, writer):
+        board = Board(backend=self.backend)
+        sim = simulation.GameSimulation(board, self.mode, **self.sim_args)
+        session = Session(sim, writer, self.fps)
+        self.sessions.add(session)
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            session.send_state()
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    # a line longer than the stream limit
+                    break
+                if not line or not session.handle(line.decode(errors='replace')):
+                    break
+                await writer.drain()
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.discard(session)
+            self._handlers.discard(handler)
+            session.close()
+
+    async def start(self, host='127.0.0.1', port=7777):
+        """Starts listening, returns the asyncio.Server"""
+        return await asyncio.start_server(self._serve_client, host, port, limit=1 << 12,
+                                          backlog=_BACKLOG)
+
+    async def close(self):
+        """Ends every session, waiting for their connections to close"""
+        for session in list(self.sessions):
+            session.close()
+        # closed connections read as ended, so the handlers finish on their own
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+
+async def _serve(args):
+    game_server = GameServer(args.backend, _MODES[args.mode], args.fps,
+                             tick=args.tick, gravity=args.gravity)
+    server = await game_server.start(args.host, args.port)
+    print('listening on {}'.format(', '.join(str(sock.getsockname()) for sock in server.sockets)))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await game_server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serves games over TCP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--backend', default='bitboard')
+    parser.add_argument('--mode', choices=('sprint', 'ultra'), default=None)
+    parser.add_argument('--fps', type=float, default=60, help='most timer wakeups per session per second')
+    parser.add_argument('--tick', type=int, default=16,
+                        help='milliseconds per tick (default: about a frame at 60 fps)')
+    parser.add_argument('--gravity', type=float, default=1, help='rows per second')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
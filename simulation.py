@@ -0,0 +1,310 @@
+from clock import RealClock, VirtualClock
+
+SPRINT = 0
+ULTRA = 1
+
+SPRINT_LINES = 40
+ULTRA_TIME = 120 * 1000
+
+# actions repeated while held (auto-shift and soft drop)
+_SHIFTS = ('l', 'r')
+_SOFT_DROP = 'd'
+
+
+class GameSimulation:
+    def __init__(self, board, mode=None, tick=1, gravity=1, das=80, arr=1,
+                 soft_drop_rate=1, lock_delay=500):
+        """Game logic (gravity, lock delay, auto-shift and soft drop) advanced in fixed ticks
+
+        Everything only depends on the number of ticks and the inputs given
+        to each tick, so the same inputs give the same game whether it's
+        played live or simulated
+
+        Parameters
+        ----------
+        board : Board
+            Board being played
+        mode : int, optional
+            SPRINT, ULTRA or None for a game that only ends when lost
+        tick : int, optional
+            Milliseconds of game time per tick, by default 1
+        gravity : float, optional
+            Rows per second the piece falls, by default 1
+        das : int, optional
+            Milliseconds l / r are held before they repeat, by default 80
+        arr : int, optional
+            Milliseconds between repeats, by default 1, 0 moves straight to the wall
+        soft_drop_rate : int, optional
+            Milliseconds between soft drops while d is held, by default 1,
+            0 drops straight to the floor
+        lock_delay : int, optional
+            Milliseconds a grounded piece waits before locking, by default 500
+
+        Attributes
+        ----------
+        clock : VirtualClock
+            Game time, advanced by tick every step
+        ticks : int
+            Number of ticks played
+        """
+        self.board = board
+        self.mode = mode
+        self.tick = tick
+        self.gravity = gravity
+        self.das = das
+        self.arr = arr
+        self.soft_drop_rate = soft_drop_rate
+        self.lock_delay = lock_delay
+
+        self.clock = VirtualClock()
+        self.ticks = 0
+        self.held = set()
+        self._held_time = dict.fromkeys(_SHIFTS, 0)
+        self._charge = dict.fromkeys(_SHIFTS + (_SOFT_DROP,), 0)
+        self._until_falling = 1000
+        self._lock_left = lock_delay
+
+    @property
+    def time(self):
+        """Milliseconds of game time played"""
+        return self.clock.now()
+
+    @property
+    def finished(self):
+        """Whether the game is lost or the mode's goal is reached"""
+        if self.board.dead:
+            return True
+        if self.mode == SPRINT:
+            return self.board.lines_cleared >= SPRINT_LINES
+        if self.mode == ULTRA:
+            return self.clock.now() > ULTRA_TIME
+        return False
+
+    @property
+    def falls_next_tick(self):
+        """Whether gravity moves or locks the piece in the next tick"""
+        if self._until_falling - self.gravity * self.tick > 0:
+            return False
+        return self.board.drop_distance() != 0 or self._lock_left <= 0
+
+    def press(self, action):
+        """Applies a pressed key's action, l, r and d then repeat while held"""
+        if self.board.act(action):
+            if action == 'hold':
+                self._until_falling = 1000
+            self._lock_left = self.lock_delay  # infinite lock delay
+
+        # the step this happens in adds its tick back, so timers start at 0
+        if action in _SHIFTS:
+            for key in _SHIFTS:
+                self._held_time[key] = -self.tick
+                self._charge[key] = -self.tick
+        elif action == _SOFT_DROP:
+            self._charge[_SOFT_DROP] = -self.tick
+
+        if action in self._charge:
+            self.held.add(action)
+
+    def release(self, action):
+        """Stops repeating a held action"""
+        self.held.discard(action)
+
+    def step(self, events=()):
+        """Advances the game by one tick
+
+        Parameters
+        ----------
+        events : iterable of tuple
+            ('press', action) / ('release', action) inputs of this tick
+        """
+        board = self.board
+        tick = self.tick
+
+        self._until_falling -= self.gravity * tick
+        if self._until_falling <= 0:
+            if board.drop_distance() == 0:
+                if self._lock_left <= 0:
+                    board.lock_piece()
+                    self._until_falling = 1000
+                self._lock_left -= tick
+            else:
+                board.act('d')
+                self._until_falling = 1000
+
+        for kind, action in events:
+            if kind == 'press':
+                self.press(action)
+            else:
+                self.release(action)
+
+        # all the repeats due this tick are applied as one move
+        for key in _SHIFTS:
+            if key in self.held:
+                self._held_time[key] += tick
+                if self._held_time[key] > self.das:
+                    count = self._repeats(key, self.arr)
+                    if count != 0:
+                        board.shift(key, count)
+
+        if _SOFT_DROP in self.held:
+            count = self._repeats(_SOFT_DROP, self.soft_drop_rate)
+            if count != 0:
+                board.soft_drop(count)
+
+        self.clock.advance(tick)
+        self.ticks += 1
+
+    # charges key by a tick, returns how many repeats of period it paid for
+    #   (None for a period of 0, which repeats all the way)
+    def _repeats(self, key, period):
+        if period <= 0:
+            self._charge[key] = 0
+            return None
+        self._charge[key] += self.tick
+        if self._charge[key] <= period:
+            return 0
+        count = int(-(-self._charge[key] // period)) - 1
+        self._charge[key] -= count * period
+        return count
+
+    # number of the next limit ticks in which nothing can happen without input
+    def _idle_ticks(self, limit):
+        if self.held:
+            return 0
+        idle = limit
+        if self.gravity > 0:
+            idle = min(idle, -(-self._until_falling // (self.gravity * self.tick)) - 1)
+        if self.mode == ULTRA:
+            # stop on the tick the time runs out like step() would
+            idle = min(idle, (ULTRA_TIME - self.clock.now()) // self.tick)
+        return max(int(idle), 0)
+
+    def advance(self, ticks):
+        """Plays up to ticks ticks without inputs, stopping early if the game finishes
+
+        Same as calling step() that many times, but stretches where only
+        the gravity timer runs are skipped over at once
+        """
+        while ticks > 0 and not self.finished:
+            idle = self._idle_ticks(ticks)
+            if idle > 0:
+                self._until_falling -= self.gravity * self.tick * idle
+                self.clock.advance(self.tick * idle)
+                self.ticks += idle
+                ticks -= idle
+            else:
+                self.step()
+                ticks -= 1
+
+
+def run_headless(sim, inputs=(), max_ticks=None):
+    """Plays sim as fast as possible until it finishes
+
+    Parameters
+    ----------
+    sim : GameSimulation
+        Game to play
+    inputs : iterable of tuple
+        (tick, kind, action) inputs sorted by tick, see GameSimulation.step
+    max_ticks : int, optional
+        Stops after this many ticks even if the game isn't finished
+
+    Returns
+    -------
+    GameSimulation
+        sim, played to the end
+    """
+    inputs = iter(inputs)
+    pending = next(inputs, None)
+    while not sim.finished and (max_ticks is None or sim.ticks < max_ticks):
+        events = []
+        while pending is not None and pending[0] <= sim.ticks:
+            events.append(pending[1:])
+            pending = next(inputs, None)
+        if events:
+            sim.step(events)
+            continue
+
+        # nothing to do until the next input
+        until = sim.ticks + (1 << 20) if pending is None else pending[0]
+        if max_ticks is not None:
+            until = min(until, max_ticks)
+        sim.advance(until - sim.ticks)
+    return sim
+
+
+class FixedTimestep:
+    def __init__(self, fps=60, clock=None):
+        """Runs a simulation against a clock
+
+        Once per frame the ticks due since the last frame are played and
+        the frame is drawn, the rest of the frame is slept. The inputs are
+        polled right before the last due tick and land on it, so poll()
+        sees the game they're applied to, and replaying them at those ticks
+        with run_headless() gives the same game
+
+        With a VirtualClock sleeping is instant, so the same loop plays
+        headless games (e.g. with poll() driven by a bot) as fast as it can
+
+        Parameters
+        ----------
+        fps : float, optional
+            Frames (input polls and draws) per second, by default 60
+        clock : RealClock or VirtualClock, optional
+            Clock the ticks and frames are timed by, by default a new RealClock
+
+        Attributes
+        ----------
+        inputs : list of tuple
+            (tick, kind, action) inputs played by the last run(), in the
+            format run_headless() takes
+        """
+        self.fps = fps
+        self.clock = clock if clock is not None else RealClock()
+        self.inputs = []
+
+    def run(self, sim, poll, render):
+        """Plays sim until it finishes or poll() asks to stop
+
+        Parameters
+        ----------
+        sim : GameSimulation
+            Game to play
+        poll : callable
+            Returns (events, stop): the inputs since the last call (see
+            GameSimulation.step) and None, or a value to stop and return.
+            Only called in frames with ticks due
+        render : callable
+            Draws a frame
+
+        Returns
+        -------
+        Any
+            What poll() stopped with, 1 if the game finished
+        """
+        self.inputs = []
+        frame = 1000 / self.fps
+        start = self.clock.now()
+        next_frame = start
+        while not sim.finished:
+            # ticks due by now, inputs land on the latest of them
+            due = int((self.clock.now() - start) // sim.tick) - sim.ticks
+            if due > 0:
+                sim.advance(due - 1)
+            if due > 0 and not sim.finished:
+                events, stop = poll()
+                if stop is not None:
+                    return stop
+                if events:
+                    self.inputs.extend((sim.ticks,) + event for event in events)
+                    sim.step(events)
+                else:
+                    sim.advance(1)
+
+            render()
+            next_frame = max(next_frame + frame, self.clock.now())
+            wait = next_frame - self.clock.now()
+            self.clock.sleep(wait)
+
+        render()
+        return 1
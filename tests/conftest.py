@@ -0,0 +1,53 @@
+import functools
+import os
+import random
+import sys
+
+# the modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import features  # noqa: E402
+import movegen  # noqa: E402
+from bot import WEIGHTS  # noqa: E402
+from tetris import Board  # noqa: E402
+
+_NOISE = ('l', 'r', 'd', 'cw', 'ccw')
+
+
+@functools.lru_cache(maxsize=None)
+def game_actions(seed, pieces=150):
+    """Player actions of a reproducible game that lasts and clears lines
+
+    Each piece gets a few random moves (and sometimes a hold), then goes to
+    one of the two best placements by bot.WEIGHTS left from where it is
+    """
+    rng = random.Random(seed)
+    board = Board(rseed=seed)
+    weights = [WEIGHTS.get(name, 0.0) for name in features.FEATURES]
+    out = []
+
+    def act(action):
+        out.append(action)
+        board.act(action)
+    for _ in range(pieces):
+        for _ in range(rng.randint(0, 2)):
+            act(rng.choice(_NOISE))
+        if rng.random() < 0.1:
+            act('hold')
+        if board.dead:
+            break
+        snap = board.snapshot()
+        scored = []
+        for placement in movegen.placements(board, False):
+            for action in placement.path:
+                board.act(action)
+            score = features.extract(board._board)[0] @ weights \
+                + WEIGHTS['lines'] * board.lines_cleared - 1000 * board.dead
+            scored.append((score, rng.random(), placement))
+            board.restore(snap)
+        scored.sort(key=lambda item: item[:2], reverse=True)
+        for action in rng.choice(scored[:2])[2].path:
+            act(action)
+        if board.dead:
+            break
+    return tuple(out)
@@ -0,0 +1,46 @@
+import pytest
+
+import movegen
+import simulation
+from bot import BotInput
+from clock import VirtualClock
+from tetris import Board
+
+
+class _LowestBot:
+    """Deterministic stand-in for BeamSearchBot, places pieces as low as they go"""
+
+    def __init__(self):
+        self.planned = []
+
+    def choose(self, board):
+        placement = max(movegen.placements(board, False),
+                        key=lambda placement: (max(row for row, _ in placement.cells), placement.cells))
+        self.planned.append(placement.cells)
+        return placement
+
+
+class _Locks:
+    """Stands in for a feed.FeedWriter, keeps the cells of every piece that locks"""
+
+    def __init__(self):
+        self.cells = []
+
+    def locked(self, piece):
+        self.cells.append(tuple(sorted(piece.occupied())))
+
+
+@pytest.mark.parametrize('gravity', [1, 30, 2000])
+def test_bot_input_places_what_was_planned(gravity):
+    board = Board(rseed=5)
+    board.feed = _Locks()
+    sim = simulation.GameSimulation(board, gravity=gravity)
+    bot = _LowestBot()
+    bot_input = BotInput(bot, sim)
+
+    def poll():
+        if len(board.feed.cells) == 60:
+            return [], 0
+        return bot_input.poll()
+    assert simulation.FixedTimestep(clock=VirtualClock()).run(sim, poll, lambda: None) == 0
+    assert board.feed.cells == bot.planned
@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import game_actions
+from feed import FeedView, FeedWriter
+from tetris import Board
+
+
+def _same(view, board):
+    assert (view.state() == board.state()).all()
+    assert view.ghost_piece_occupied == board.ghost_piece_occupied
+    assert view.held_piece == board.held_piece
+    assert view.next_pieces == tuple(board.next_pieces)[:5]
+    assert (view.score, view.lines_cleared, view.dead) == \
+        (board.score, board.lines_cleared, board.dead)
+
+
+@pytest.mark.parametrize('every', [1, 3])
+@pytest.mark.parametrize('seed', range(3))
+def test_views_follow_the_board(seed, every):
+    board = Board(rseed=seed)
+    writer = FeedWriter(board, keyframe_every=50)
+    view = FeedView()
+    late = FeedView()
+    for i, action in enumerate(game_actions(seed)):
+        board.act(action)
+        if i % every:
+            continue
+        message = writer.poll()
+        view.apply(message)
+        _same(view, board)
+        # joins part way through, synced from the next keyframe on
+        if i >= 100 and late.apply(message):
+            _same(late, board)
+    assert late.synced
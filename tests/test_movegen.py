@@ -0,0 +1,69 @@
+import pytest
+
+import movegen
+import utils
+from conftest import game_actions
+from tetris import Board
+
+_MOVES = ('l', 'r', 'd', 'cw', 'ccw')
+
+
+# boards at the start of every 20th piece of a seeded game
+def _positions(seed):
+    board = Board(rseed=seed)
+    pieces = 0
+    for action in game_actions(seed):
+        board.act(action)
+        if board.dead:
+            break
+        if action == 'hd':
+            pieces += 1
+            if pieces % 20 == 0:
+                yield board.clone()
+
+
+# every (cells, tspin) the current piece can lock in, by trying every move from every state
+def _brute_force(board):
+    start = board.snapshot()
+    piece = board.cur_piece
+    seen = {(piece.rotation, tuple(piece.pos), piece.last_move in utils.ROTATIONS)}
+    todo = [start]
+    out = set()
+    while todo:
+        snap = todo.pop()
+        board.restore(snap)
+        if board.drop_distance() == 0:
+            out.add((tuple(sorted(board.cur_piece.occupied())), board._tspun()))
+        for move in _MOVES:
+            board.restore(snap)
+            if board.act(move):
+                piece = board.cur_piece
+                key = (piece.rotation, tuple(piece.pos), piece.last_move in utils.ROTATIONS)
+                if key not in seen:
+                    seen.add(key)
+                    todo.append(board.snapshot())
+    board.restore(start)
+    return out
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_placements_match_brute_force(seed):
+    for board in _positions(seed):
+        found = [(placement.cells, placement.tspin) for placement in movegen.placements(board, False)]
+        assert len(found) == len(set(found))
+        assert set(found) == _brute_force(board)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_paths_reach_their_placements(seed):
+    for board in _positions(seed):
+        snap = board.snapshot()
+        for placement in movegen.placements(board):
+            assert placement.path[-1] == 'hd'
+            for action in placement.path[:-1]:
+                assert board.act(action)
+            piece = board.cur_piece
+            piece._fall(board.drop_distance())
+            assert tuple(sorted(piece.occupied())) == placement.cells
+            assert board._tspun() == placement.tspin
+            board.restore(snap)
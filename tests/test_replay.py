@@ -0,0 +1,39 @@
+import io
+
+import pytest
+
+import replay
+from conftest import game_actions
+from tetris import Board
+
+
+def _recorded(seed):
+    board = Board(rseed=seed)
+    stream = io.BytesIO()
+    writer = replay.record(board, stream, clock=lambda: 0)
+    for action in game_actions(seed):
+        board.act(action)
+    writer.close(board)
+    stream.seek(0)
+    return board, stream
+
+
+@pytest.mark.parametrize('backend', ['array', 'bitboard'])
+@pytest.mark.parametrize('seed', range(4))
+def test_verify_replays_the_game(seed, backend):
+    board, stream = _recorded(seed)
+    played = replay.verify(stream, backend)
+    assert (played.state() == board.state()).all()
+    assert (played.score, played.lines_cleared, played.dead) == \
+        (board.score, board.lines_cleared, board.dead)
+
+
+def test_verify_rejects_a_wrong_end():
+    board, stream = _recorded(0)
+    data = bytearray(stream.getvalue())
+    # the last byte is the varint line count
+    data[-1] += 1
+    with pytest.raises(ValueError):
+        replay.verify(io.BytesIO(bytes(data)))
+    with pytest.raises(ValueError):
+        replay.verify(io.BytesIO(stream.getvalue()[:-3]))
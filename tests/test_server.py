@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import server
+import simulation
+
+
+# starts a server on a free port, connects to it and runs body(session, reader, writer)
+def _run(body, **sim_args):
+    async def main():
+        game_server = server.GameServer(mode=simulation.ULTRA, **sim_args)
+        listener = await game_server.start(port=0)
+        reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+        json.loads(await reader.readline())
+        session, = game_server.sessions
+        try:
+            await body(session, reader, writer)
+        finally:
+            writer.close()
+            listener.close()
+            await game_server.close()
+    asyncio.run(main())
+
+
+# reads states until the one answering command seq
+async def _answer(reader, seq):
+    while True:
+        state = json.loads(await reader.readline())
+        if state['seq'] >= seq:
+            return state
+
+
+def test_commands_dont_run_ahead_of_the_clock():
+    async def body(session, reader, writer):
+        loop = asyncio.get_running_loop()
+        writer.write(b'release l\n' * 3000)
+        await _answer(reader, 3000)
+        sim = session.sim
+        wall = int((loop.time() - session._start) * 1000 // sim.tick)
+        assert sim.ticks <= wall
+        assert sim.time <= wall * sim.tick
+    _run(body, tick=16)
+
+
+def test_every_command_is_answered():
+    async def body(session, reader, writer):
+        writer.write(b'press r\nrelease r\nfly l\npress hd\n')
+        seen = []
+        while not seen or seen[-1] < 4:
+            seen.append(json.loads(await reader.readline())['seq'])
+        assert 3 in seen
+        assert session.applied == 4
+        assert session.sim.board.lines_cleared == 0
+        assert session.sim.board.cur_piece.pos[0] == 6
+    _run(body)
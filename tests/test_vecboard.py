@@ -0,0 +1,31 @@
+import numpy as np
+
+import utils
+from conftest import game_actions
+from tetris import Board
+from vecboard import NOOP, VecBoard
+
+SEEDS = range(6)
+
+
+def test_matches_boards():
+    games = [game_actions(seed) for seed in SEEDS]
+    boards = [Board(rseed=seed) for seed in SEEDS]
+    vec = VecBoard(list(SEEDS))
+    for step in range(max(map(len, games))):
+        codes = np.full(len(games), NOOP)
+        for i, (board, actions) in enumerate(zip(boards, games)):
+            if step < len(actions) and not board.dead:
+                board.act(actions[step])
+                codes[i] = utils.ACTIONS[actions[step]]
+        vec.step(codes)
+
+        state = vec.state()
+        for i, board in enumerate(boards):
+            assert (state[i] == board.state()).all()
+            assert vec.score[i] == board.score
+            assert vec.lines_cleared[i] == board.lines_cleared
+            assert vec.dead[i] == board.dead
+            assert vec.held[i] == utils.shape_values.get(board.held_piece, 0)
+            assert list(vec.next_pieces[i]) == \
+                [utils.shape_values[piece_str] for piece_str in list(board.next_pieces)[:5]]
@@ -1,16 +1,20 @@
-import copy
-import random
 from collections import deque
-from datetime import datetime
 import os
 import sys
 
 import numpy as np
 import utils
+from fields import BACKENDS
+from randomizer import BagRandomizer, seed_int
+import zobrist
 
 
 class Piece:
+    __slots__ = ('piece_str', '_parent_game', 'rotation', 'last_move', 'pos')
+
     rotation_table = {'cw': 1, 'ccw': -1}
+    # (index into pos, amount) of each movement
+    move_table = {'u': (0, -1), 'd': (0, 1), 'l': (1, -1), 'r': (1, 1)}
 
     # called with the piece_str e.g. 'S' representing which piece
     # can be I, J, L, O , S, T, Z pieces
@@ -52,8 +56,7 @@ class Piece:
     # moves the piece in the desired direction
     # 'd', 'l', or 'r'
     def _move(self, direc: str) -> bool:
-        index = 0 if direc in ('u', 'd') else 1
-        amt = 1 if direc in ('d', 'r') else -1
+        index, amt = self.move_table[direc]
 
         self.pos[index] += amt
 
@@ -62,6 +65,12 @@ class Piece:
             return False
         return True
 
+    # moves the piece down by dist rows, which the caller knows are free
+    def _fall(self, dist):
+        if dist > 0:
+            self.pos[0] += dist
+            self.last_move = 'd'
+
     # returns the board indicies currently occupied by this piece
     def occupied(self):
         for spot in utils.OCCUPIED[self.piece_str][self.rotation]:
@@ -80,12 +89,12 @@ class Piece:
         bool
             Whether or not the action succeeded
         """
-        if action in utils.ROTATIONS:
-            if self._rotate(self.rotation_table[action]):
+        if action in utils.MOVEMENT:
+            if self._move(action):
                 self.last_move = action
                 return True
-        elif action in utils.MOVEMENT:
-            if self._move(action):
+        elif action in utils.ROTATIONS:
+            if self._rotate(self.rotation_table[action]):
                 self.last_move = action
                 return True
         else:
@@ -95,31 +104,47 @@ class Piece:
 
 
 class Board:
-    def __init__(self, board=None, rseed=None):
+    __slots__ = ('height', 'playable_height', 'width', '_field', 'rseed', 'randomizer',
+                 'recorder', 'lines_cleared', 'score', 'dead', 'held_piece', '_hold_used',
+                 'cur_piece', '_ghost', 'next_pieces', '_keys', '_field_hash', 'stats', 'feed')
+
+    def __init__(self, board=None, rseed=None, backend='array'):
         """Main board class, built on top of numpy array
 
         Parameters
         ----------
         board : numpy.array, optional
             Board state, by default None which generates an empty board
-        rseed : Any, optional
-            Seed used by random.seed() for rng, by default None
+        rseed : hashable, optional
+            Seed of the board's own piece randomizer, by default None which
+            picks one at random. Anything but a non-negative int is hashed
+            into one (randomizer.seed_int), which rseed is then set to
+        backend : str, optional
+            Field representation, 'array' (numpy array) or 'bitboard'
+            (one integer bitmask per row), by default 'array'
         """
 
         self.height = 26
         self.playable_height = 20
         self.width = 10
 
-        if board is None:
-            self._board = np.array([[0 for i in range(self.width)]
-                                    for i in range(self.height)])
-        else:
-            self._board = np.array(board)
+        try:
+            self._field = BACKENDS[backend](self.height, self.width, board)
+        except KeyError:
+            raise ValueError('Invalid backend \'{}\''.format(backend))
+        self._keys = zobrist.keys(self.height, self.width)
+        self._field_hash = self._keys.field_hash(self._field.row_masks())
 
+        # the seed is kept so the game can be replayed
         if rseed is None:
-            rseed = datetime.now()
-
-        random.seed(rseed)
+            rseed = int.from_bytes(os.urandom(4), 'little')
+        self.rseed = seed_int(rseed)
+        self.randomizer = BagRandomizer(self.rseed)
+        self.recorder = None
+        # set by instrument.enable()
+        self.stats = None
+        # set by feed.FeedWriter
+        self.feed = None
 
         self.lines_cleared = 0
         self.score = 0
@@ -128,11 +153,15 @@ class Board:
         self._hold_used = False
 
         self.cur_piece = None
+        self._ghost = None
         self.next_pieces = deque()
         self._pick_new_next()
         self._spawn_piece()
-        self.ghost_piece_occupied = None
-        self._generate_ghost_piece()
+
+    # colour plane of the field, used by state() and rendering
+    @property
+    def _board(self):
+        return self._field.cells
 
     def _out_of_bounds(self, pos):
         if not 0 <= pos[0] < self.height or not 0 <= pos[1] < self.width:
@@ -142,12 +171,12 @@ class Board:
     # checks if the current location of the piece is valid
     #   i.e. doesn't intersect with already placed blocks / out of bounds
     def _piece_valid(self):
-        return not any(self._out_of_bounds(pos) or self._board[pos] != 0 for pos in self.cur_piece.occupied())
+        piece = self.cur_piece
+        return not self._field.collides(piece.piece_str, piece.rotation, piece.pos)
 
-    # picks a random new piece
-    #   modify this if want to switch to bag/other randomizer
+    # queues up the next bag of pieces
     def _pick_new_next(self):
-        self.next_pieces.extend(np.random.permutation(utils.SHAPES))
+        self.next_pieces.extend(self.randomizer.next_bag())
 
     # spawns a new piece in
     # also checks validity of spawned piece to see if game is lost
@@ -156,7 +185,7 @@ class Board:
         self.cur_piece = Piece(self.next_pieces.popleft(), self)
         if len(self.next_pieces) < 7:
             self._pick_new_next()
-        self._generate_ghost_piece()
+        self._ghost = None
 
         if not self._piece_valid():
             self.dead = True
@@ -168,13 +197,23 @@ class Board:
         self._spawn_piece()
         self._hold_used = True
 
-    def _generate_ghost_piece(self):
-        og_piece = copy.deepcopy(self.cur_piece)
-        while self.cur_piece.act('d'):
-            pass
+    # number of rows the current piece can fall before landing
+    def drop_distance(self):
+        piece = self.cur_piece
+        return self._field.drop_distance(piece.piece_str, piece.rotation, piece.pos)
 
-        self.ghost_piece_occupied = tuple(self.cur_piece.occupied())
-        self.cur_piece = og_piece
+    def _generate_ghost_piece(self):
+        dist = self.drop_distance()
+        self._ghost = tuple((pos[0] + dist, pos[1])
+                            for pos in self.cur_piece.occupied())
+
+    # board indicies the current piece would occupy after a hard drop
+    #   generated lazily, only when something asks for it
+    @property
+    def ghost_piece_occupied(self):
+        if self._ghost is None:
+            self._generate_ghost_piece()
+        return self._ghost
 
     def _tspun(self):
         if self.cur_piece.piece_str != 'T' or self.cur_piece.last_move not in utils.ROTATIONS:
@@ -187,7 +226,7 @@ class Board:
 
         for corner in corners:
             tocheck = tuple(map(sum, zip(corner, self.cur_piece.pos)))
-            if self._out_of_bounds(tocheck) or self._board[tocheck] != 0:
+            if self._field.filled(tocheck):
                 filled_corners += 1
 
         if filled_corners >= 3:
@@ -196,16 +235,12 @@ class Board:
 
     # clears lines as needed and award points
     def _clear_lines(self, mult):
+        lcleared = self._field.clear_lines()
+        if lcleared:
+            self._field_hash = self._keys.field_hash(self._field.row_masks())
 
-        lcleared = 0
-        for r_ind in range(self.height):
-            if all(val != 0 for val in self._board[r_ind]):
-                for l_ind in reversed(range(1, r_ind + 1)):
-                    self._board[l_ind] = self._board[l_ind - 1]
-                self._board[0] = 0
-                self.score += mult * 1000 * (lcleared + 1)
-                lcleared += 1
-
+        # the n-th line cleared by a single lock is worth n times the base
+        self.score += mult * 1000 * lcleared * (lcleared + 1) // 2
         self.lines_cleared += lcleared
         return lcleared
 
@@ -213,12 +248,20 @@ class Board:
 
     # locks _cur_piece in place and spawns a new one
     def lock_piece(self):
-        safe = False
-        for pos in self.cur_piece.occupied():
-            self._board[pos] = utils.shape_values[self.cur_piece.piece_str]
-            if pos[0] >= self.height - self.playable_height:
-                safe = True
-        if not safe:
+        if self.recorder is not None:
+            self.recorder.record('lock')
+        self._lock_piece()
+
+    def _lock_piece(self):
+        piece = self.cur_piece
+        self._field.place(piece.piece_str, piece.rotation, piece.pos)
+        self._field_hash ^= self._keys.piece_hash(piece.piece_str, piece.rotation, piece.pos)
+        if self.feed is not None:
+            self.feed.locked(piece)
+
+        # dead if no cell of the piece is in the visible rows
+        bottom = piece.pos[0] + utils.EXTENTS[piece.piece_str][piece.rotation][1]
+        if bottom < self.height - self.playable_height:
             self.dead = True
 
         mult = 2 if self._tspun() else 1
@@ -232,25 +275,27 @@ class Board:
     #           0 for failed action (e.g. piece became invalid)
     #           1 for successful action
     def act(self, action):
-        if action == 'hold':
-            if self._hold_used:
+        if self.recorder is not None and action in utils.ACTIONS:
+            self.recorder.record(action)
+
+        # most frequent first
+        if action in utils.MOVEMENT:
+            if not self.cur_piece.act(action):
                 return False
-            self._hold()
         elif action == 'hd':
-            while self.cur_piece.act('d'):
-                pass
-            self.lock_piece()
-        elif action in utils.MOVEMENT:
-            if not self.cur_piece.act(action):
+            self.cur_piece._fall(self.drop_distance())
+            self._lock_piece()
+        elif action == 'hold':
+            if self._hold_used:
                 return False
+            self._hold()
         elif action in utils.ROTATIONS:
             offsets = utils.SRS_TABLE.get_rotation(
                 self.cur_piece.piece_str, self.cur_piece.rotation, utils.ROTATION_TO_VAL[action])
 
             for offset in offsets:
                 old_pos = self.cur_piece.pos
-                self.cur_piece.pos = list(
-                    utils.vector_add(self.cur_piece.pos, offset))
+                self.cur_piece.pos = [old_pos[0] + offset[0], old_pos[1] + offset[1]]
 
                 if self.cur_piece.act(action):
                     break
@@ -261,21 +306,173 @@ class Board:
             raise ValueError('Invalid move \'{}\''.format(action))
 
         if action != 'd':
-            self._generate_ghost_piece()
+            self._ghost = None
 
         return True
 
-    def state(self):
-        bstate = copy.deepcopy(self._board)
+    def shift(self, action, n=None):
+        """Moves the current piece up to n columns left or right in one step
+
+        Same as act(action) n times: it stops at the first wall or block
+        and sets last_move like the last successful move would
+
+        Parameters
+        ----------
+        action : str
+            'l' or 'r'
+        n : int, optional
+            Most columns to move, by default None which moves to the wall
+
+        Returns
+        -------
+        int
+            Number of columns moved
+        """
+        if action != 'l' and action != 'r':
+            raise ValueError('Invalid shift \'{}\''.format(action))
+        if n == 1:
+            # a plain move is cheaper than measuring the distance
+            return int(self.act(action))
+        piece = self.cur_piece
+        direc = Piece.move_table[action][1]
+        dist = self._field.shift_distance(piece.piece_str, piece.rotation, piece.pos, direc)
+        if n is not None and n < dist:
+            dist = max(n, 0)
+
+        if self.recorder is not None:
+            for _ in range(dist):
+                self.recorder.record(action)
+
+        if dist:
+            piece.pos[1] += direc * dist
+            piece.last_move = action
+            self._ghost = None
+        return dist
+
+    def soft_drop(self, n=None):
+        """Moves the current piece down up to n rows in one step, without locking it
+
+        Same as act('d') n times (see shift())
+
+        Parameters
+        ----------
+        n : int, optional
+            Most rows to move, by default None which moves to the floor
+
+        Returns
+        -------
+        int
+            Number of rows moved
+        """
+        dist = self.drop_distance()
+        if n is not None and n < dist:
+            dist = max(n, 0)
+
+        if self.recorder is not None:
+            for _ in range(dist):
+                self.recorder.record('d')
+
+        self.cur_piece._fall(dist)
+        return dist
+
+    @property
+    def row_counts(self):
+        """Number of filled cells in each row of the field, top row first"""
+        return tuple(self._field.counts)
+
+    @property
+    def column_heights(self):
+        """Height of the stack in each column, counted from the bottom of the field"""
+        return tuple(self.height - top for top in self._field.tops)
+
+    @property
+    def zobrist(self):
+        """64 bit Zobrist hash of the filled cells, the current piece (its
+        letter, not where it is), the hold state and the first
+        zobrist.PREVIEW next pieces
+
+        The field part is updated as pieces lock and lines clear, the rest
+        is added on each access
+        """
+        keys = self._keys
+        out = self._field_hash ^ keys.piece[self.cur_piece.piece_str] ^ keys.held[self.held_piece]
+        if self._hold_used:
+            out ^= keys.hold_used
+        for slot, piece_str in zip(keys.preview, self.next_pieces):
+            out ^= slot[piece_str]
+        return out
+
+    def snapshot(self):
+        """Copies the state of the game that changes as it is played
+
+        Much cheaper than copy.deepcopy(board), meant for search trees that
+        branch the game many times
+
+        Returns
+        -------
+        tuple
+            Opaque snapshot to pass to restore()
+        """
+        piece = self.cur_piece
+        return (self._field.snapshot(), self._field_hash, self.score, self.lines_cleared, self.dead,
+                self.held_piece, self._hold_used,
+                (piece.piece_str, piece.rotation, piece.pos[:], piece.last_move),
+                tuple(self.next_pieces), self.randomizer.get_state())
+
+    def restore(self, snap):
+        """Puts the game back to a snapshot() of this board (or of its clones)"""
+        (field, self._field_hash, self.score, self.lines_cleared, self.dead, self.held_piece,
+         self._hold_used, piece, next_pieces, randomizer) = snap
+        self._field.restore(field)
+        self.cur_piece = Piece(piece[0], self)
+        self.cur_piece.rotation = piece[1]
+        self.cur_piece.pos = piece[2][:]
+        self.cur_piece.last_move = piece[3]
+        self._ghost = None
+        self.next_pieces = deque(next_pieces)
+        self.randomizer.set_state(randomizer)
+
+    def clone(self):
+        """Independent copy of the board, without its recorder, stats or feed"""
+        board = Board.__new__(Board)
+        board.height = self.height
+        board.playable_height = self.playable_height
+        board.width = self.width
+        board._field = self._field.copy()
+        board.rseed = self.rseed
+        board._keys = self._keys
+        board.randomizer = self.randomizer.copy()
+        board.recorder = None
+        board.stats = None
+        board.feed = None
+        board.restore(self.snapshot())
+        return board
+
+    def state(self, out=None):
+        """Field with the current piece drawn in
+
+        Parameters
+        ----------
+        out : numpy.array, optional
+            (height, width) array to write into, by default None which
+            allocates a new one
+
+        Returns
+        -------
+        numpy.array
+            Shape value of each cell, 0 if empty
+        """
+        if out is None:
+            out = self._board.copy()
+        else:
+            np.copyto(out, self._board)
+        val = utils.shape_values[self.cur_piece.piece_str]
         for pos in self.cur_piece.occupied():
-            bstate[pos] = utils.shape_values[self.cur_piece.piece_str]
-        return bstate
+            out[pos] = val
+        return out
 
     def __str__(self):
-        temp = copy.deepcopy(self._board)
-        for pos in self.cur_piece.occupied():
-            temp[pos] = utils.shape_values[self.cur_piece.piece_str]
-        out = np.array_str(temp)
+        out = np.array_str(self.state())
         out = out.replace('0', ' ')
 
         return out
@@ -12,6 +12,7 @@ ACTIONS = {
     'r': 5,
     'd': 6,
     'hd': 7,
+    'hold': 8,
 }
 
 ROTATIONS = dict((key, val)
@@ -20,6 +21,9 @@ ROTATIONS = dict((key, val)
 MOVEMENT = dict((key, val)
                 for key, val in ACTIONS.items() if key in ('u', 'd', 'l', 'r'))
 
+# actions a player has, 'u' is only there for debugging
+PLAYER_ACTIONS = ('l', 'r', 'd', 'cw', 'ccw', 'hd', 'hold')
+
 ROTATION_TO_VAL = {
     'cw': 1,
     'ccw': -1
@@ -90,6 +94,46 @@ for shape_name, shape in _occupied_shapes.items():
                 if val != 0:
                     OCCUPIED[shape_name][rot].append((r_i, c_i))
 
+# row masks of each piece rotation, used by bitboard fields
+#   PIECE_ROWS[shape][rot] is a tuple of (row offset, mask) where bit i of
+#   mask is set if the cell at column offset i is occupied
+PIECE_ROWS = {}
+
+# bounding box of each piece rotation as (min row, max row, min col, max col)
+EXTENTS = {}
+
+# lowest cell of each column of a piece rotation, used for drop distances
+#   BOTTOMS[shape][rot] is a tuple of (col offset, max row offset)
+BOTTOMS = {}
+
+# leftmost and rightmost cell of each row of a piece rotation, used for shift distances
+#   SIDES[shape][rot] is a tuple of (row offset, min col offset, max col offset)
+SIDES = {}
+
+for shape_name, rotations in OCCUPIED.items():
+    PIECE_ROWS[shape_name] = []
+    EXTENTS[shape_name] = []
+    BOTTOMS[shape_name] = []
+    SIDES[shape_name] = []
+    for cells in rotations:
+        masks = {}
+        for r_i, c_i in cells:
+            masks[r_i] = masks.get(r_i, 0) | (1 << c_i)
+        PIECE_ROWS[shape_name].append(tuple(sorted(masks.items())))
+
+        rows = [r_i for r_i, _ in cells]
+        cols = [c_i for _, c_i in cells]
+        EXTENTS[shape_name].append((min(rows), max(rows), min(cols), max(cols)))
+
+        bottoms = {}
+        for r_i, c_i in cells:
+            bottoms[c_i] = max(bottoms.get(c_i, r_i), r_i)
+        BOTTOMS[shape_name].append(tuple(sorted(bottoms.items())))
+
+        SIDES[shape_name].append(tuple(
+            (r_i, (mask & -mask).bit_length() - 1, mask.bit_length() - 1)
+            for r_i, mask in PIECE_ROWS[shape_name][-1]))
+
 
 shape_values = {
     'T': 1,
@@ -0,0 +1,272 @@
+import numpy as np
+import utils
+from randomizer import BagRandomizer
+
+# pieces are identified by their shape value (1 - 7, 0 meaning no piece)
+_VAL_TO_SHAPE = dict((val, key) for key, val in utils.shape_values.items())
+
+# _CELLS[val, rot] holds the (row, col) offsets of the 4 occupied cells
+_CELLS = np.zeros((8, 4, 4, 2), dtype=np.int64)
+
+# _KICKS[val, rot, d] holds the SRS offsets tried when rotating from rot,
+#   d = 0 for cw and d = 1 for ccw; _KICK_COUNT[val] is 0 for pieces that
+#   can't rotate (O), mirroring SRS_TABLE.get_rotation
+_KICKS = np.zeros((8, 4, 2, 5, 2), dtype=np.int64)
+_KICK_COUNT = np.zeros(8, dtype=np.int64)
+
+for _shape, _val in utils.shape_values.items():
+    for _rot in range(4):
+        _CELLS[_val, _rot] = utils.OCCUPIED[_shape][_rot]
+        for _d, _direc in enumerate((utils.CLOCKWISE, utils.COUNTERCLOCKWISE)):
+            _offsets = list(utils.SRS_TABLE.get_rotation(_shape, _rot, _direc))
+            _KICK_COUNT[_val] = len(_offsets)
+            if _offsets:
+                _KICKS[_val, _rot, _d] = _offsets
+
+_SPAWN_COL = np.array([3, 3, 3, 3, 3, 3, 3, 4])
+
+_CORNERS = np.array([(0, 0), (0, 2), (2, 0), (2, 2)])
+
+_MOVES = {
+    utils.ACTIONS['u']: (-1, 0),
+    utils.ACTIONS['d']: (1, 0),
+    utils.ACTIONS['l']: (0, -1),
+    utils.ACTIONS['r']: (0, 1),
+}
+
+NOOP = -1
+
+
+class VecBoard:
+    def __init__(self, seeds):
+        """N boards stepped in lockstep with batched numpy operations
+
+        Every game follows the same rules as tetris.Board and, given the same
+        seed, produces the same pieces, states and scores
+
+        Parameters
+        ----------
+        seeds : sequence of int
+            One seed per game, the number of seeds sets the number of games
+
+        Attributes
+        ----------
+        fields : numpy.array
+            (N, height, width) shape values of the locked cells
+        piece, rotation : numpy.array
+            (N,) shape value and rotation of each current piece
+        pos : numpy.array
+            (N, 2) row and column of each current piece
+        held : numpy.array
+            (N,) shape value of each held piece, 0 if nothing is held
+        score, lines_cleared : numpy.array
+            (N,) running totals of each game
+        dead : numpy.array
+            (N,) whether each game is over, dead games ignore actions
+        """
+        self.height = 26
+        self.playable_height = 20
+        self.width = 10
+        self.num_games = len(seeds)
+
+        n = self.num_games
+        self.fields = np.zeros((n, self.height, self.width), dtype=np.int8)
+        self.piece = np.zeros(n, dtype=np.int64)
+        self.rotation = np.zeros(n, dtype=np.int64)
+        self.pos = np.zeros((n, 2), dtype=np.int64)
+        self.held = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lines_cleared = np.zeros(n, dtype=np.int64)
+        self.dead = np.zeros(n, dtype=bool)
+        self._hold_used = np.zeros(n, dtype=bool)
+        self._last_rotated = np.zeros(n, dtype=bool)
+
+        # preview queue per game, holds at most 13 pieces plus one put back by hold
+        self._queue = np.zeros((n, 16), dtype=np.int64)
+        self._queue_len = np.zeros(n, dtype=np.int64)
+        self._randomizers = [None] * n
+
+        self.reset(np.arange(n), seeds)
+
+    @property
+    def next_pieces(self):
+        """(N, 5) shape values of the preview pieces of each game"""
+        return self._queue[:, :5]
+
+    def reset(self, idx, seeds):
+        """Restarts the games at indices idx with new seeds"""
+        idx = np.asarray(idx, dtype=np.int64)
+        self.fields[idx] = 0
+        self.held[idx] = 0
+        self.score[idx] = 0
+        self.lines_cleared[idx] = 0
+        self.dead[idx] = False
+        self._queue_len[idx] = 0
+        for i, seed in zip(idx, seeds):
+            self._randomizers[i] = BagRandomizer(seed)
+            self._pick_new_next(i)
+        self._spawn_piece(idx)
+
+    # positions of the cells of pieces val in rotations rot at pos, as (k, 4) arrays
+    def _cells(self, val, rot, pos):
+        cells = _CELLS[val, rot]
+        return pos[:, 0, None] + cells[:, :, 0], pos[:, 1, None] + cells[:, :, 1]
+
+    # checks the cells (k, ...) of games idx against the walls and locked blocks
+    def _blocked(self, idx, rows, cols):
+        out = (rows < 0) | (rows >= self.height) | (cols < 0) | (cols >= self.width)
+        rows = np.clip(rows, 0, self.height - 1)
+        cols = np.clip(cols, 0, self.width - 1)
+        idx = idx.reshape((-1,) + (1,) * (rows.ndim - 1))
+        return out | (self.fields[idx, rows, cols] != 0)
+
+    def _collides(self, idx, val, rot, pos):
+        return self._blocked(idx, *self._cells(val, rot, pos)).any(axis=1)
+
+    def _pick_new_next(self, i):
+        bag = [utils.shape_values[p] for p in self._randomizers[i].next_bag()]
+        start = self._queue_len[i]
+        self._queue[i, start:start + len(bag)] = bag
+        self._queue_len[i] += len(bag)
+
+    def _spawn_piece(self, idx):
+        if not len(idx):
+            return
+        self.piece[idx] = self._queue[idx, 0]
+        self._queue[idx, :-1] = self._queue[idx, 1:]
+        self._queue_len[idx] -= 1
+        for i in idx[self._queue_len[idx] < 7]:
+            self._pick_new_next(i)
+
+        self.rotation[idx] = 0
+        self.pos[idx, 0] = 6
+        self.pos[idx, 1] = _SPAWN_COL[self.piece[idx]]
+        self._last_rotated[idx] = False
+        self._hold_used[idx] = False
+
+        self.dead[idx] |= self._collides(
+            idx, self.piece[idx], self.rotation[idx], self.pos[idx])
+
+    def _hold(self, idx):
+        idx = idx[~self._hold_used[idx]]
+        refill = idx[self.held[idx] != 0]
+        self._queue[refill, 1:] = self._queue[refill, :-1]
+        self._queue[refill, 0] = self.held[refill]
+        self._queue_len[refill] += 1
+
+        self.held[idx] = self.piece[idx]
+        self._spawn_piece(idx)
+        self._hold_used[idx] = True
+
+    def _move(self, idx, delta):
+        pos = self.pos[idx] + delta
+        ok = ~self._collides(idx, self.piece[idx], self.rotation[idx], pos)
+        idx = idx[ok]
+        self.pos[idx] = pos[ok]
+        self._last_rotated[idx] = False
+
+    def _rotate(self, idx, d):
+        direc = 1 if d == 0 else -1
+        idx = idx[_KICK_COUNT[self.piece[idx]] > 0]
+        for k in range(5):
+            if not len(idx):
+                break
+            val = self.piece[idx]
+            rot = self.rotation[idx]
+            new_rot = (rot + direc) % 4
+            pos = self.pos[idx] + _KICKS[val, rot, d, k]
+            ok = ~self._collides(idx, val, new_rot, pos)
+
+            done = idx[ok]
+            self.pos[done] = pos[ok]
+            self.rotation[done] = new_rot[ok]
+            self._last_rotated[done] = True
+            idx = idx[~ok]
+
+    def _drop_distance(self, idx):
+        # tests every shift at once, the first blocked one is one past the landing row
+        rows, cols = self._cells(self.piece[idx], self.rotation[idx], self.pos[idx])
+        rows = rows[:, None, :] + np.arange(self.height + 1)[None, :, None]
+        cols = np.broadcast_to(cols[:, None, :], rows.shape)
+        return self._blocked(idx, rows, cols).any(axis=2).argmax(axis=1) - 1
+
+    def _lock_piece(self, idx):
+        val = self.piece[idx]
+        rows, cols = self._cells(val, self.rotation[idx], self.pos[idx])
+        self.fields[idx[:, None], rows, cols] = val[:, None]
+        self.dead[idx] |= ~(rows >= self.height - self.playable_height).any(axis=1)
+
+        corners = self._blocked(idx, self.pos[idx, 0, None] + _CORNERS[:, 0],
+                                self.pos[idx, 1, None] + _CORNERS[:, 1])
+        tspun = (val == utils.shape_values['T']) & self._last_rotated[idx] \
+            & (corners.sum(axis=1) >= 3)
+        self._clear_lines(idx, np.where(tspun, 2, 1))
+        self._spawn_piece(idx)
+
+    def _clear_lines(self, idx, mult):
+        full = (self.fields[idx] != 0).all(axis=2)
+        lcleared = full.sum(axis=1)
+        self.score[idx] += mult * 1000 * lcleared * (lcleared + 1) // 2
+        self.lines_cleared[idx] += lcleared
+
+        some = lcleared > 0
+        idx, full, lcleared = idx[some], full[some], lcleared[some]
+        if not len(idx):
+            return
+        # moves the full rows to the top (keeping the order of the rest), then empties them
+        order = np.argsort(~full, axis=1, kind='stable')
+        fields = np.take_along_axis(self.fields[idx], order[:, :, None], axis=1)
+        fields[np.arange(self.height)[None, :] < lcleared[:, None]] = 0
+        self.fields[idx] = fields
+
+    def step(self, actions):
+        """Applies one action to every game
+
+        Parameters
+        ----------
+        actions : numpy.array
+            (N,) action codes from utils.ACTIONS, or NOOP to skip a game
+
+        Returns
+        -------
+        numpy.array
+            (N,) points scored by each game during this step
+        numpy.array
+            (N,) whether each game is over
+        """
+        actions = np.asarray(actions)
+        if actions.shape != (self.num_games,):
+            raise ValueError('Expected {} actions, got shape {}'.format(
+                self.num_games, actions.shape))
+
+        score = self.score.copy()
+        live = ~self.dead
+        for code in np.unique(actions[live]):
+            idx = np.flatnonzero(live & (actions == code))
+            if code in _MOVES:
+                self._move(idx, _MOVES[code])
+            elif code == utils.ACTIONS['cw']:
+                self._rotate(idx, 0)
+            elif code == utils.ACTIONS['ccw']:
+                self._rotate(idx, 1)
+            elif code == utils.ACTIONS['hd']:
+                dist = self._drop_distance(idx)
+                self.pos[idx, 0] += dist
+                self._last_rotated[idx[dist > 0]] = False
+                self._lock_piece(idx)
+            elif code == utils.ACTIONS['hold']:
+                self._hold(idx)
+            elif code != NOOP:
+                raise ValueError('Invalid action code \'{}\''.format(code))
+
+        return self.score - score, self.dead.copy()
+
+    def state(self, out=None):
+        """(N, height, width) fields with the current pieces drawn in"""
+        if out is None:
+            out = np.empty_like(self.fields)
+        np.copyto(out, self.fields)
+        idx = np.arange(self.num_games)
+        rows, cols = self._cells(self.piece, self.rotation, self.pos)
+        out[idx[:, None], rows, cols] = self.piece[:, None]
+        return out
@@ -0,0 +1,377 @@
+"""Games stepped by worker processes through shared memory
+
+    env = SharedVecEnv(1024, workers=4)
+    obs = env.reset()
+    obs, rewards, dones = env.step(actions)     # (N,) action codes
+    print(env.steps_per_second)
+    env.close()
+
+Actions, observations, rewards and done flags live in one
+multiprocessing.shared_memory block that the trainer and the workers
+map as numpy arrays, so nothing is pickled or sent per step. A step is
+the trainer writing the actions and two barrier waits: one releasing the
+workers, each stepping its own slice of the games, and one for all of
+them to finish.
+"""
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+import sys
+import threading
+from itertools import islice
+from time import perf_counter
+
+import numpy as np
+import utils
+from tetris import Board
+from vecboard import NOOP, VecBoard
+
+# worker commands, written to the shared 'command' array before a barrier
+_STEP = 0
+_RESET = 1
+_STOP = 2
+
+_CODE_TO_ACTION = dict((val, key) for key, val in utils.ACTIONS.items())
+# 'u' is left out like everywhere a player acts
+_VALID_CODES = np.array(sorted(utils.ACTIONS[action] for action in utils.PLAYER_ACTIONS) + [NOOP])
+
+
+# (name, shape, dtype) of each array in the shared block
+def _layout(num_games, workers, preview, height=26, width=10):
+    return [
+        ('command', (1,), np.int64),
+        ('actions', (num_games,), np.int64),
+        ('episodes', (num_games,), np.int64),
+        ('board', (num_games, height, width), np.int8),
+        ('next_pieces', (num_games, preview), np.int8),
+        ('held_piece', (num_games,), np.int8),
+        ('rewards', (num_games,), np.int64),
+        ('dones', (num_games,), bool),
+        ('final_scores', (num_games,), np.int64),
+        ('worker_steps', (workers,), np.int64),
+        ('worker_time', (workers,), np.float64),
+    ]
+
+
+# bytes of each array of layout, rounded up to keep the next one 8 byte aligned
+def _sizes(layout):
+    return [-(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+            for _, shape, dtype in layout]
+
+
+# numpy arrays over buf, laid out one after the other
+def _map(buf, layout):
+    arrays = {}
+    offset = 0
+    for (name, shape, dtype), size in zip(layout, _sizes(layout)):
+        arrays[name] = np.ndarray(shape, dtype, buf, offset)
+        offset += size
+    return arrays
+
+
+class _BoardGames:
+    # one Board per game of the slice
+    def __init__(self, arrays, lo, hi, seeds, backend, preview):
+        self.arrays = arrays
+        self.lo, self.hi = lo, hi
+        self.seeds = seeds
+        self.backend = backend
+        self.preview = preview
+        self.boards = [None] * (hi - lo)
+
+    def _observe(self, i):
+        arrays = self.arrays
+        board = self.boards[i - self.lo]
+        board.state(out=arrays['board'][i])
+        for j, piece_str in enumerate(islice(board.next_pieces, self.preview)):
+            arrays['next_pieces'][i, j] = utils.shape_values[piece_str]
+        arrays['held_piece'][i] = utils.shape_values.get(board.held_piece, 0)
+
+    def reset(self, indices):
+        for i in indices:
+            seed = self.seeds(i, self.arrays['episodes'][i])
+            self.boards[i - self.lo] = Board(rseed=seed, backend=self.backend)
+            self._observe(i)
+
+    def step(self):
+        arrays = self.arrays
+        actions = arrays['actions']
+        for i in range(self.lo, self.hi):
+            code = actions[i]
+            board = self.boards[i - self.lo]
+            score = board.score
+            if code != NOOP:
+                board.act(_CODE_TO_ACTION[code])
+            arrays['rewards'][i] = board.score - score
+            arrays['dones'][i] = board.dead
+            if board.dead:
+                arrays['final_scores'][i] = board.score
+                arrays['episodes'][i] += 1
+                self.reset([i])
+            else:
+                self._observe(i)
+
+
+class _VecGames:
+    # one VecBoard stepping the whole slice
+    def __init__(self, arrays, lo, hi, seeds, backend, preview):
+        self.arrays = arrays
+        self.lo, self.hi = lo, hi
+        self.seeds = seeds
+        self.preview = preview
+        self.vec = VecBoard([seeds(i, arrays['episodes'][i]) for i in range(lo, hi)])
+
+    def _observe(self):
+        arrays = self.arrays
+        lo, hi = self.lo, self.hi
+        self.vec.state(out=arrays['board'][lo:hi])
+        arrays['next_pieces'][lo:hi] = self.vec._queue[:, :self.preview]
+        arrays['held_piece'][lo:hi] = self.vec.held
+
+    def reset(self, indices):
+        self.vec.reset([i - self.lo for i in indices],
+                       [self.seeds(i, self.arrays['episodes'][i]) for i in indices])
+        self._observe()
+
+    def step(self):
+        arrays = self.arrays
+        lo, hi = self.lo, self.hi
+        rewards, dones = self.vec.step(arrays['actions'][lo:hi])
+        arrays['rewards'][lo:hi] = rewards
+        arrays['dones'][lo:hi] = dones
+        finished = np.flatnonzero(dones)
+        if len(finished):
+            arrays['final_scores'][lo + finished] = self.vec.score[finished]
+            arrays['episodes'][lo + finished] += 1
+            self.vec.reset(finished, [self.seeds(lo + i, arrays['episodes'][lo + i])
+                                      for i in finished.tolist()])
+        self._observe()
+
+
+_ENGINES = {
+    'board': _BoardGames,
+    'vec': _VecGames,
+}
+
+
+# seed of episode k of game i, the same whatever the number of workers
+class _Seeds:
+    def __init__(self, seed, num_games):
+        self.seed = seed
+        self.num_games = num_games
+
+    def __call__(self, i, episode):
+        return int(self.seed + episode * self.num_games + i)
+
+
+def _worker(shm_name, layout, barrier, w_ind, lo, hi, seed, engine, backend, preview):
+    shm = shared_memory.SharedMemory(shm_name)
+    arrays = games = None
+    try:
+        arrays = _map(shm.buf, layout)
+        games = _ENGINES[engine](arrays, lo, hi, _Seeds(seed, len(arrays['actions'])),
+                                 backend, preview)
+        games.reset(range(lo, hi))
+        barrier.wait()
+
+        steps = arrays['worker_steps']
+        elapsed = arrays['worker_time']
+        while True:
+            barrier.wait()
+            command = arrays['command'][0]
+            if command == _STOP:
+                break
+            start = perf_counter()
+            if command == _RESET:
+                games.reset(range(lo, hi))
+            else:
+                games.step()
+                steps[w_ind] += hi - lo
+            elapsed[w_ind] += perf_counter() - start
+            barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    except BaseException:
+        # wakes up everyone else instead of leaving them waiting
+        barrier.abort()
+        raise
+    finally:
+        # the arrays hold pointers into the block, they have to go first
+        arrays = games = steps = elapsed = None
+        shm.close()
+
+
+class SharedVecEnv:
+    def __init__(self, num_games, workers=None, seed=0, engine='board', backend='bitboard',
+                 preview=5, timeout=None):
+        """Games split across worker processes, stepped in lockstep
+
+        Finished games restart on their own: the step that ends a game
+        reports its reward and done flag with the first observation of the
+        next one, and its score in final_scores
+
+        Parameters
+        ----------
+        num_games : int
+            Number of games
+        workers : int, optional
+            Worker processes, by default one per core (at most num_games)
+        seed : int, optional
+            Game i's k-th episode is seeded with seed + k * num_games + i, by default 0
+        engine : str, optional
+            'board' (a Board per game) or 'vec' (a VecBoard per worker),
+            by default 'board'
+        backend : str, optional
+            Field backend of the 'board' engine, by default 'bitboard'
+        preview : int, optional
+            Number of next pieces in the observation, by default 5
+        timeout : float, optional
+            Seconds to wait for the workers at a barrier, by default None (forever)
+
+        Attributes
+        ----------
+        observation : dict of numpy.array
+            Shared arrays, overwritten by every step: 'board' (N, height,
+            width) shape values with the current pieces drawn in,
+            'next_pieces' (N, preview) and 'held_piece' (N,)
+        rewards, dones, final_scores : numpy.array
+            (N,) shared results of the last step, final_scores only
+            meaningful where dones is set
+        """
+        if engine not in _ENGINES:
+            raise ValueError('Invalid engine \'{}\''.format(engine))
+        if num_games < 1:
+            raise ValueError('Need at least one game, got {}'.format(num_games))
+        workers = min(workers or multiprocessing.cpu_count(), num_games)
+        self.num_games = num_games
+        self.workers = workers
+        self.timeout = timeout
+
+        layout = _layout(num_games, workers, preview)
+        self._shm = shared_memory.SharedMemory(create=True, size=sum(_sizes(layout)))
+        self._arrays = _map(self._shm.buf, layout)
+        self._arrays['actions'][:] = NOOP
+
+        self._barrier = multiprocessing.Barrier(workers + 1)
+        bounds = np.linspace(0, num_games, workers + 1).astype(int).tolist()
+        self._procs = []
+        for w_ind in range(workers):
+            proc = multiprocessing.Process(
+                target=_worker, daemon=True,
+                args=(self._shm.name, layout, self._barrier, w_ind, bounds[w_ind],
+                      bounds[w_ind + 1], seed, engine, backend, preview))
+            proc.start()
+            self._procs.append(proc)
+        self._wait()
+
+        arrays = self._arrays
+        self.observation = {name: arrays[name] for name in ('board', 'next_pieces', 'held_piece')}
+        self.rewards = arrays['rewards']
+        self.dones = arrays['dones']
+        self.final_scores = arrays['final_scores']
+
+    def _wait(self):
+        try:
+            self._barrier.wait(self.timeout)
+        except threading.BrokenBarrierError:
+            self.close()
+            raise RuntimeError('A vector env worker failed or timed out')
+
+    def _run(self, command):
+        self._arrays['command'][0] = command
+        self._wait()
+        self._wait()
+
+    def reset(self):
+        """Restarts every game (with its next episode's seed), returns the observation"""
+        self._arrays['episodes'] += 1
+        self._run(_RESET)
+        return self.observation
+
+    def step(self, actions):
+        """Applies one action to every game
+
+        Parameters
+        ----------
+        actions : array_like
+            (N,) utils.ACTIONS codes of utils.PLAYER_ACTIONS, or vecboard.NOOP to skip a game
+
+        Returns
+        -------
+        dict of numpy.array
+            observation
+        numpy.array
+            (N,) points scored by each game
+        numpy.array
+            (N,) whether each game ended (and was restarted)
+        """
+        actions = np.asarray(actions)
+        if actions.shape != (self.num_games,):
+            raise ValueError('Expected {} actions, got shape {}'.format(
+                self.num_games, actions.shape))
+        if not np.isin(actions, _VALID_CODES).all():
+            raise ValueError('Invalid action codes {}'.format(
+                np.unique(actions[~np.isin(actions, _VALID_CODES)]).tolist()))
+        self._arrays['actions'][:] = actions
+        self._run(_STEP)
+        return self.observation, self.rewards, self.dones
+
+    @property
+    def steps_per_second(self):
+        """(workers,) game steps per second each worker spent stepping"""
+        elapsed = self._arrays['worker_time']
+        return np.divide(self._arrays['worker_steps'], elapsed,
+                         out=np.zeros(self.workers), where=elapsed > 0)
+
+    def close(self):
+        """Stops the workers and frees the shared memory"""
+        if self._shm is None:
+            return
+        if not self._barrier.broken:
+            self._arrays['command'][0] = _STOP
+            try:
+                self._barrier.wait(self.timeout)
+            except threading.BrokenBarrierError:
+                pass
+        for proc in self._procs:
+            proc.join(self.timeout)
+            if proc.is_alive():
+                proc.terminate()
+        # the arrays hold pointers into the block, they have to go first
+        self.observation = self.rewards = self.dones = self.final_scores = None
+        self._arrays = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Steps random actions to measure throughput')
+    parser.add_argument('--games', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=None, help='default: one per core')
+    parser.add_argument('--engine', choices=list(_ENGINES), default='vec')
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    codes = _VALID_CODES[_VALID_CODES != NOOP]
+    with SharedVecEnv(args.games, args.workers, args.seed, args.engine) as env:
+        start = perf_counter()
+        for _ in range(args.steps):
+            env.step(rng.choice(codes, args.games))
+        elapsed = perf_counter() - start
+        print('{:.0f} steps/s'.format(args.steps * args.games / elapsed))
+        for w_ind, rate in enumerate(env.steps_per_second):
+            print('worker {}: {:.0f} steps/s'.format(w_ind, rate))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+from collections import OrderedDict
+import random
+
+import utils
+
+# number of preview pieces that are part of a board's key
+PREVIEW = 5
+
+
+class ZobristKeys:
+    def __init__(self, height, width, seed=0):
+        """Random 64 bit keys XORed together into board hashes
+
+        Parameters
+        ----------
+        height : int
+            Number of rows of the field
+        width : int
+            Number of columns of the field
+        seed : int, optional
+            Seed of the keys, by default 0 so hashes match between runs
+
+        Attributes
+        ----------
+        cells : list of list of int
+            Key of each filled cell, indexed [row][col]
+        rows : list of list of int
+            XOR of the cell keys of each row for every row mask, indexed [row][mask]
+        piece, held : dict
+            Key of the current / held piece by letter (held has None for no piece)
+        hold_used : int
+            Key added when hold can't be used until the next piece
+        preview : list of dict
+            Key of each preview slot by letter
+        """
+        rng = random.Random(seed)
+        self.cells = [[rng.getrandbits(64) for _ in range(width)] for _ in range(height)]
+
+        self.rows = []
+        for row_keys in self.cells:
+            table = [0] * (1 << width)
+            for mask in range(1, 1 << width):
+                low = mask & -mask
+                table[mask] = table[mask ^ low] ^ row_keys[low.bit_length() - 1]
+            self.rows.append(table)
+
+        self.piece = dict((shape, rng.getrandbits(64)) for shape in utils.SHAPES)
+        self.held = dict((shape, rng.getrandbits(64)) for shape in utils.SHAPES)
+        self.held[None] = 0
+        self.hold_used = rng.getrandbits(64)
+        self.preview = [dict((shape, rng.getrandbits(64)) for shape in utils.SHAPES)
+                        for _ in range(PREVIEW)]
+
+    def field_hash(self, masks):
+        """Hash of a field from its row masks (see row_masks() of the fields)"""
+        out = 0
+        for table, mask in zip(self.rows, masks):
+            out ^= table[mask]
+        return out
+
+    def piece_hash(self, piece_str, rotation, pos):
+        """XOR of the keys of the cells a piece covers"""
+        out = 0
+        row, col = pos
+        for r_off, c_off in utils.OCCUPIED[piece_str][rotation]:
+            out ^= self.cells[row + r_off][col + c_off]
+        return out
+
+
+_keys = {}
+
+
+def keys(height, width):
+    """Shared ZobristKeys for a field size"""
+    if (height, width) not in _keys:
+        _keys[height, width] = ZobristKeys(height, width)
+    return _keys[height, width]
+
+
+class TranspositionTable:
+    def __init__(self, capacity=1 << 16):
+        """Size bounded cache of search results keyed by board hash
+
+        Once full, storing a new key evicts the least recently used one
+
+        Parameters
+        ----------
+        capacity : int, optional
+            Maximum number of entries, by default 65536
+
+        Attributes
+        ----------
+        hits, misses : int
+            Number of get() calls that found / didn't find their key
+        evictions : int
+            Number of entries dropped to make room
+        """
+        if capacity < 1:
+            raise ValueError('Capacity must be positive, got {}'.format(capacity))
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Value stored for key, default if there is none"""
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Stores value for key, evicting the least recently used entry if full"""
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+        elif len(entries) >= self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+        entries[key] = value
+
+    @property
+    def hit_rate(self):
+        """Fraction of get() calls that found their key"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def items(self):
+        """(key, value) of every entry, least recently used first"""
+        return list(self._entries.items())
+
+    def clear(self):
+        """Drops every entry and resets the counters"""
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries